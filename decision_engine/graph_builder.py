@@ -39,11 +39,12 @@ class GraphBuilder:
         self.market_monitor = market_monitor
         self.trader_cfg = trader_cfg or {}
         # 创建节点实例（不再传递exchange_config，节点从state读取）
-        self.data_collector = DataCollector(market_monitor=market_monitor)
+        self.data_collector = DataCollector(market_monitor=market_monitor, owner=trader_id)
         self.coin_pool = CoinPool(trader_cfg, symbol_filter=symbol_filter)
         self.signal_analyzer = SignalAnalyzer(
             trader_id=trader_id, 
-            settings=settings
+            settings=settings,
+            derivatives=market_monitor.derivatives if market_monitor else None
         )
         self.AI_decision = AIDecision(
             trader_cfg, 
@@ -150,11 +150,13 @@ class AIDecision:
             # OpenInterest 和 FundingRate
             open_interest = signals.get('open_interest')
             open_interest_average = signals.get('open_interest_average')
+            open_interest_change_pct = signals.get('open_interest_change_pct')
             funding_rate = signals.get('funding_rate')
             
             # 格式化持仓量和资金费率（先判断再格式化，避免f-string格式错误）
             oi_str = f"{open_interest:.2f}" if open_interest is not None else "N/A"
             oi_avg_str = f"{open_interest_average:.2f}" if open_interest_average is not None else "N/A"
+            oi_change_str = f"{open_interest_change_pct:+.2f}%" if open_interest_change_pct is not None else "N/A"
             funding_rate_str = f"{funding_rate:.2e}" if funding_rate is not None else "N/A"
             
             # 趋势判断
@@ -197,6 +199,7 @@ class AIDecision:
                 f"    【持仓量与资金费率】\n"
                 f"      - 持仓量 (Latest): {oi_str}\n"
                 f"      - 持仓量 (Average): {oi_avg_str}\n"
+                f"      - 持仓量 (4h Change): {oi_change_str}\n"
                 f"      - 资金费率: {funding_rate_str}\n"
                 f"    【3分钟序列数据摘要】\n{intraday_summary if intraday_summary else '        无数据'}\n"
                 f"    【4小时序列数据摘要】\n{longer_term_summary if longer_term_summary else '        无数据'}"
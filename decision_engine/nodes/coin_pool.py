@@ -11,10 +11,8 @@ if TYPE_CHECKING:
 class CoinPool:
     """候选币种池节点 - 从信号源获取候选币种列表"""
     
-    # 等待筛选完成的配置常量
+    # 等待第一次排名完成的配置常量
     MAX_WAIT_TIME_SECONDS = 120  # 最多等待2分钟
-    CHECK_INTERVAL_SECONDS = 2  # 每2秒检查一次
-    LOG_INTERVAL_SECONDS = 10  # 每10秒输出一次等待日志
     
     def __init__(self, trader_cfg: dict, symbol_filter: Optional['SymbolFilter'] = None):
         self.trader_cfg = trader_cfg
@@ -69,29 +67,15 @@ class CoinPool:
                 filtered_symbols = self.symbol_filter.get_filtered_symbols()
                 logger.info(f"filtered_symbols: {filtered_symbols}")
                 logger.info(f"is running: {self.symbol_filter._running}")
-                # 如果筛选结果为空，且筛选任务正在运行，等待筛选完成
+                # 筛选任务已产生过排名时结果随K线收盘事件更新，始终可直接使用；
+                # 只有启动后第一次排名完成前才需要等待（等待排名事件，而不是轮询）
                 if not filtered_symbols:
                     if hasattr(self.symbol_filter, '_running') and self.symbol_filter._running:
-                        logger.info("⏳ 内置AI评分正在运行中，等待筛选结果完成...")
-                        import time
-                        
-                        # 等待筛选完成
-                        elapsed = 0
-                        
-                        while elapsed < self.MAX_WAIT_TIME_SECONDS:
-                            time.sleep(self.CHECK_INTERVAL_SECONDS)
-                            elapsed += self.CHECK_INTERVAL_SECONDS
-                            
-                            filtered_symbols = self.symbol_filter.get_filtered_symbols()
-                            if filtered_symbols:
-                                logger.info(f"等待{elapsed}秒后，获取到{len(filtered_symbols)}个筛选币种")
-                                break
-                            
-                            # 定期输出等待日志
-                            if elapsed % self.LOG_INTERVAL_SECONDS == 0:
-                                logger.info(f"继续等待筛选结果... ({elapsed}/{self.MAX_WAIT_TIME_SECONDS}秒)")
-                        
-                        if not filtered_symbols:
+                        logger.info("⏳ 内置AI评分正在运行中，等待第一次排名完成...")
+                        filtered_symbols = self.symbol_filter.wait_for_ranking(timeout=self.MAX_WAIT_TIME_SECONDS)
+                        if filtered_symbols:
+                            logger.info(f"获取到{len(filtered_symbols)}个筛选币种")
+                        else:
                             logger.warning(f"等待{self.MAX_WAIT_TIME_SECONDS}秒后筛选结果仍未准备好，将使用配置币种")
                     else:
                         logger.warning("⚠️ 内置AI评分筛选任务未运行，使用配置币种")
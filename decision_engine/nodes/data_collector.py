@@ -1,10 +1,11 @@
 from decision_engine.state import DecisionState
 from services.market.api_client import APIClient
 from utils.logger import logger
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, Set, Tuple
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from services.market.monitor import MarketMonitor
-import asyncio
-import threading
+import time
 from services.trader.CCXT_trader import CCXTTrader
 
 class DataCollector:
@@ -12,18 +13,23 @@ class DataCollector:
     
     # K线数据配置
     KLINE_LIMIT = 200  # K线数据获取数量
+    INCLUDE_FORMING_KLINE = True  # 缓存读取时包含未收盘K线（最后一根反映实时价格，与 REST 返回一致）
+    REST_FETCH_MAX_WORKERS = 5  # REST 回退的最大并发数（与历史数据加载器一致，CCXT 自身限速仍生效）
     
     # WebSocket订阅配置
-    WS_SUBSCRIBE_TIMEOUT_SECONDS = 5  # WebSocket订阅超时时间（秒）
+    SUBSCRIBE_INTERVALS = ["3m", "4h"]  # 动态订阅的K线周期
+    WS_SUBSCRIBE_TIMEOUT_SECONDS = 5  # WebSocket订阅超时时间（秒，不含订阅前的历史K线加载）
     
-    def __init__(self, market_monitor: Optional[MarketMonitor] = None):
+    def __init__(self, market_monitor: Optional[MarketMonitor] = None, owner: Optional[str] = None):
         """
         初始化数据收集节点
         
         Args:
-            market_monitor: 市场数据监控器（可选）
+            market_monitor: 市场数据监控器（可选，可能与其他交易员共享）
+            owner: 订阅者标识（交易员ID），用于共享监控器的订阅引用计数
         """
         self.market_monitor = market_monitor
+        self.owner = owner or MarketMonitor.DEFAULT_OWNER
         self.api_client: Optional[APIClient] = None  # 延迟初始化
 
     def _get_api_client(self, state: DecisionState) -> Optional[APIClient]:
@@ -129,59 +135,116 @@ class DataCollector:
             state['market_data_map'] = {}
             return state
         
-        # 7. 收集市场数据
+        # 7. 收集市场数据（缓存命中直接读取；缓存未命中的币种并发走 REST API）
+        started = time.perf_counter()
         market_data_map = {}
+        fetch_latency_ms = {}
         
+        rest_symbols = []
         for symbol in all_symbols:
-            try:
-                # 优先从监控器缓存获取数据
-                if self.market_monitor and self.market_monitor.is_monitoring(symbol):
-                    klines_3m = self.market_monitor.get_klines(symbol, "3m", limit=self.KLINE_LIMIT)
-                    klines_4h = self.market_monitor.get_klines(symbol, "4h", limit=self.KLINE_LIMIT)
-                    latest_price = self.market_monitor.get_latest_price(symbol)
-                    
-                    market_data_map[symbol] = {
-                        'symbol': symbol,
-                        'current_price': latest_price,
-                        'klines_3m': klines_3m,
-                        'klines_4h': klines_4h,
-                        'source': 'websocket_cache',
-                        'is_position': symbol in position_symbols,  # 标记是否为持仓币种
-                        'is_candidate': symbol in candidate_symbols  # 标记是否为候选币种
-                    }
-                    logger.debug(f"{symbol}: 从监控器缓存获取数据")
-                else:
-                    # 回退到 REST API
-                    klines_3m = api_client.get_Klines(symbol, "3m", limit=self.KLINE_LIMIT)
-                    klines_4h = api_client.get_Klines(symbol, "4h", limit=self.KLINE_LIMIT)
-                    
-                    market_data_map[symbol] = {
-                        'symbol': symbol,
-                        'klines_3m': klines_3m or [],
-                        'klines_4h': klines_4h or [],
-                        'source': 'rest_api',
-                        'is_position': symbol in position_symbols,
-                        'is_candidate': symbol in candidate_symbols
-                    }
-                    logger.debug(f"{symbol}: 从REST API获取数据")
-            except Exception as e:
-                logger.error(f"收集{symbol}市场数据失败: {e}", exc_info=True)
-                market_data_map[symbol] = {
-                    'symbol': symbol,
-                    'error': str(e)
+            if self._cache_is_usable(symbol):
+                data, latency_ms = self._collect_symbol(symbol, None, position_symbols, candidate_symbols)
+                market_data_map[symbol] = data
+                fetch_latency_ms[symbol] = latency_ms
+            else:
+                rest_symbols.append(symbol)
+        
+        if rest_symbols:
+            with ThreadPoolExecutor(max_workers=min(self.REST_FETCH_MAX_WORKERS, len(rest_symbols))) as executor:
+                futures = {
+                    executor.submit(self._collect_symbol, symbol, api_client, position_symbols, candidate_symbols): symbol
+                    for symbol in rest_symbols
                 }
+                for future in as_completed(futures):
+                    symbol = futures[future]
+                    market_data_map[symbol], fetch_latency_ms[symbol] = future.result()
         
         state['market_data_map'] = market_data_map
-        logger.info(f"完成数据收集，共{len(market_data_map)}个币种")
+        state['fetch_latency_ms'] = fetch_latency_ms
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        slowest = max(fetch_latency_ms, key=fetch_latency_ms.get)
+        logger.info(
+            f"完成数据收集，共{len(market_data_map)}个币种（REST {len(rest_symbols)}个），"
+            f"耗时 {elapsed_ms:.0f}ms，最慢 {slowest} {fetch_latency_ms[slowest]:.0f}ms"
+        )
         return state
     
+    def _cache_is_usable(self, symbol: str) -> bool:
+        """监控器缓存是否可用（正在监控，且K线没有缺失；断线后回补完成前走 REST API）"""
+        if not self.market_monitor or not self.market_monitor.is_monitoring(symbol):
+            return False
+        status = self.market_monitor.get_data_status(symbol)
+        if status is not None and not status['complete']:
+            logger.info(f"⚠️ {symbol}: 缓存K线不完整（{status['intervals']}），使用REST API")
+            return False
+        return True
+    
+    def _collect_symbol(
+        self,
+        symbol: str,
+        api_client: Optional[APIClient],
+        position_symbols: Set[str],
+        candidate_symbols: List[str]
+    ) -> Tuple[Dict, float]:
+        """
+        收集单个币种的市场数据
+        
+        Args:
+            symbol: 币种符号
+            api_client: API客户端，为 None 时从监控器缓存读取
+            position_symbols: 持仓币种
+            candidate_symbols: 候选币种
+            
+        Returns:
+            (市场数据字典, 耗时毫秒)
+        """
+        started = time.perf_counter()
+        try:
+            if api_client is None:
+                # 从监控器缓存获取数据
+                data = {
+                    'symbol': symbol,
+                    'current_price': self.market_monitor.get_latest_price(symbol),
+                    'klines_3m': self.market_monitor.get_klines(
+                        symbol, "3m", limit=self.KLINE_LIMIT, include_forming=self.INCLUDE_FORMING_KLINE
+                    ),
+                    'klines_4h': self.market_monitor.get_klines(
+                        symbol, "4h", limit=self.KLINE_LIMIT, include_forming=self.INCLUDE_FORMING_KLINE
+                    ),
+                    'source': 'websocket_cache',
+                    'is_position': symbol in position_symbols,  # 标记是否为持仓币种
+                    'is_candidate': symbol in candidate_symbols  # 标记是否为候选币种
+                }
+                logger.debug(f"{symbol}: 从监控器缓存获取数据")
+            else:
+                # 回退到 REST API
+                klines_3m = api_client.get_Klines(symbol, "3m", limit=self.KLINE_LIMIT)
+                klines_4h = api_client.get_Klines(symbol, "4h", limit=self.KLINE_LIMIT)
+                data = {
+                    'symbol': symbol,
+                    'klines_3m': klines_3m or [],
+                    'klines_4h': klines_4h or [],
+                    'source': 'rest_api',
+                    'is_position': symbol in position_symbols,
+                    'is_candidate': symbol in candidate_symbols
+                }
+                logger.debug(f"{symbol}: 从REST API获取数据")
+        except Exception as e:
+            logger.error(f"收集{symbol}市场数据失败: {e}", exc_info=True)
+            data = {
+                'symbol': symbol,
+                'error': str(e)
+            }
+        return data, (time.perf_counter() - started) * 1000
+    
     def _ensure_symbols_monitored(self, symbols: list):
         """确保所有币种都已添加到监控器（动态订阅WebSocket）"""
         if not self.market_monitor:
             return
         
-        # 检查哪些币种需要添加
-        symbols_to_add = [s for s in symbols if not self.market_monitor.is_monitoring(s)]
+        # 检查哪些币种需要添加（共享监控器中已被其他交易员订阅的币种也要登记本交易员）
+        symbols_to_add = [s for s in symbols if not self.market_monitor.is_monitoring(s, owner=self.owner)]
         
         if not symbols_to_add:
             logger.debug("所有币种已在监控中")
@@ -189,35 +252,22 @@ class DataCollector:
         
         logger.debug(f"需要添加{len(symbols_to_add)}个币种到监控器")
         
-        # 在独立线程中运行异步操作（因为监控器的事件循环在另一个线程）
-        def add_symbols_async():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                for symbol in symbols_to_add:
-                    try:
-                        loop.run_until_complete(
-                            self.market_monitor.add_symbol(symbol, intervals=["3m", "4h"])
-                        )
-                        logger.debug(f"已添加{symbol}到监控器并订阅WebSocket")
-                    except Exception as e:
-                        logger.error(f"添加{symbol}到监控器失败: {e}", exc_info=True)
-            except Exception as e:
-                logger.error(f"添加币种到监控器失败: {e}", exc_info=True)
-            finally:
-                loop.close()
-        
-        # 在后台线程中执行（不阻塞主流程）
-        thread = threading.Thread(target=add_symbols_async, daemon=True)
-        thread.start()
-        # 等待订阅完成
-        thread.join(timeout=self.WS_SUBSCRIBE_TIMEOUT_SECONDS)
-        
-        if thread.is_alive():
+        # 调度到监控器自己的事件循环（WebSocket 连接属于该循环），所有流合并为一次订阅
+        future = self.market_monitor.subscribe_many(symbols_to_add, intervals=self.SUBSCRIBE_INTERVALS, owner=self.owner)
+        # 监控器先分页加载历史K线再订阅，等待时间按历史加载的请求量放宽，避免超时后再用 REST 重复加载
+        timeout = self.WS_SUBSCRIBE_TIMEOUT_SECONDS + self.market_monitor.history_load_timeout(
+            len(symbols_to_add), self.SUBSCRIBE_INTERVALS
+        )
+        try:
+            future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            # 订阅会在后台继续完成，本轮未就绪的币种使用 REST API
             logger.warning("添加币种到监控器超时，将使用REST API回退")
-        else:
-            # 验证订阅状态
-            failed_symbols = [s for s in symbols_to_add if not self.market_monitor.is_monitoring(s)]
-            if failed_symbols:
-                logger.warning(f"以下币种订阅失败，将使用REST API: {failed_symbols}")
-    
\ No newline at end of file
+            return
+        except Exception as e:
+            logger.error(f"添加币种到监控器失败: {e}", exc_info=True)
+        
+        # 验证订阅状态
+        failed_symbols = [s for s in symbols_to_add if not self.market_monitor.is_monitoring(s)]
+        if failed_symbols:
+            logger.warning(f"以下币种订阅失败，将使用REST API: {failed_symbols}")
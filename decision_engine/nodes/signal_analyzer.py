@@ -2,6 +2,7 @@ from decision_engine.state import DecisionState
 from utils.logger import logger
 from services.market.api_client import APIClient
 from services.market.feature_engine import FeatureEngine, MarketFeatures
+from services.market.feature_executor import FeatureExecutor
 from typing import Optional, Dict
 from dataclasses import asdict
 
@@ -10,6 +11,7 @@ from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from services.market.performance import PerformanceAnalyzer
     from config.settings import Settings
+    from services.market.derivatives_snapshot import DerivativesSnapshot
 
 class SignalAnalyzer:
     """信号分析节点 - 计算技术指标和流动性过滤（使用FeatureEngine）"""
@@ -21,7 +23,9 @@ class SignalAnalyzer:
     def __init__(
         self, 
         trader_id: Optional[str] = None,
-        settings: Optional['Settings'] = None
+        settings: Optional['Settings'] = None,
+        derivatives: Optional['DerivativesSnapshot'] = None,
+        feature_executor: Optional[FeatureExecutor] = None
     ):
         """
         初始化信号分析节点
@@ -29,9 +33,13 @@ class SignalAnalyzer:
         Args:
             trader_id: 交易员ID
             settings: 设置对象
+            derivatives: 共享的资金费率/持仓量快照（由 MarketMonitor 提供）
+            feature_executor: 特征计算执行器（默认使用进程内共享的执行器，由 FEATURE_WORKERS 决定是否使用进程池）
         """
         self.trader_id = trader_id
         self.settings = settings
+        self.derivatives = derivatives
+        self.feature_executor = feature_executor or FeatureExecutor.instance()
         self.api_client: Optional[APIClient] = None  # 延迟初始化
         self.feature_engine: Optional[FeatureEngine] = None  # 延迟初始化
         self.performance_analyzer = None
@@ -52,7 +60,7 @@ class SignalAnalyzer:
         exchange_config = state.get('exchange_config')
         if exchange_config:
             self.api_client = APIClient()
-            self.feature_engine = FeatureEngine(self.api_client)
+            self.feature_engine = FeatureEngine(self.api_client, vectorized=True, derivatives=self.derivatives)
             return self.api_client
         
         logger.warning("⚠️ exchange_config未设置，无法创建APIClient")
@@ -75,22 +83,37 @@ class SignalAnalyzer:
         signal_data_map = {}
         
         existing_symbols = {pos.get('symbol') for pos in existing_positions if pos.get('symbol')}
-
+        
+        # 1. 把各币种的K线转换为 OHLCV 数组，提交给特征计算执行器（CPU 计算，不含网络请求）
+        payloads = []
         for symbol, raw_data in market_data_map.items():
+            # 检查是否有错误标记
+            if 'error' in raw_data:
+                logger.warning(f"{symbol}数据收集失败: {raw_data.get('error')}，跳过")
+                continue
             try:
-                # 检查是否有错误标记
-                if 'error' in raw_data:
-                    logger.warning(f"{symbol}数据收集失败: {raw_data.get('error')}，跳过")
-                    continue
-                
-                # 获取K线数据
-                klines_3m = raw_data.get('klines_3m', [])
-                klines_4h = raw_data.get('klines_4h', [])
-                
-                # 使用FeatureEngine统一计算所有特征
-                features = self.feature_engine.calculate_features(symbol, klines_3m, klines_4h)
+                payloads.append(FeatureExecutor.make_payload(
+                    symbol, raw_data.get('klines_3m') or [], raw_data.get('klines_4h') or []
+                ))
+            except Exception as e:
+                logger.error(f"{symbol}K线数据转换失败: {e}", exc_info=True)
+        futures = self.feature_executor.submit(payloads)
+        
+        # 2. 特征计算进行的同时，批量刷新候选币种的资金费率和持仓量，补充特征时只读快照
+        if self.derivatives is not None:
+            try:
+                self.derivatives.prefetch(symbol for symbol, _, _ in payloads)
+            except Exception as e:
+                logger.warning(f"批量获取资金费率/持仓量失败: {e}")
+
+        # 3. 按提交顺序取得特征，补充持仓量/资金费率后做流动性过滤
+        for payload, future in zip(payloads, futures):
+            symbol = payload[0]
+            try:
+                features = self.feature_executor.result(future, payload)
                 if not features:
                     continue
+                features = self.feature_engine.attach_derivatives(features)
                 
                 # 流动性过滤
                 is_existing_position = symbol in existing_symbols
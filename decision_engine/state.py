@@ -14,6 +14,7 @@ class DecisionState(TypedDict, total=False):
 
     #市场信息
     market_data_map: Dict[str, Dict]
+    fetch_latency_ms: Dict[str, float]  # 每个币种的数据收集耗时（毫秒，用于诊断）
     #信号信息
     signal_data_map: Dict[str, Dict]
     #性能信息
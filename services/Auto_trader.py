@@ -1,11 +1,12 @@
 from utils.logger import logger
 from config.settings import Settings
 import threading
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime, timedelta
 from decision_engine.graph_builder import GraphBuilder
 from decision_engine.state import DecisionState
 from services.market.monitor import MarketMonitor
+from services.market.market_hub import MarketDataHub
 from services.market.historical_loader import HistoricalDataLoader
 from services.market.symbol_filter import SymbolFilter
 
@@ -14,18 +15,27 @@ class AutoTrader:
     AutoTrader class
     """
 
-    def __init__(self, trader_cfg: dict, settings: Settings):
+    PRIORITY_VOLUME_TOP = 30  # 冷启动时按成交额优先加载的币种数量
+
+    def __init__(self, trader_cfg: dict, settings: Settings, market_hub: Optional[MarketDataHub] = None):
         self.trader_cfg = trader_cfg
         self.settings = settings
         self.trader_id = trader_cfg.get('id')
         self.trader_name = trader_cfg.get('name')
         self.exchange_config = trader_cfg.get('exchange', {})
+        self.market_hub = market_hub
         
-        # 创建市场数据监控器（后台运行WebSocket）
-        self.market_monitor = MarketMonitor(self.exchange_config)
+        # 市场数据监控器（后台运行WebSocket）：有行情数据中心时与其他交易员共享，否则独立创建
+        if self.market_hub:
+            self.market_monitor = self.market_hub.get_monitor(self.exchange_config)
+        else:
+            self.market_monitor = MarketMonitor(self.exchange_config)
         
         # 创建历史数据加载器
-        self.historical_loader = HistoricalDataLoader(self.market_monitor.api_client)
+        self.historical_loader = HistoricalDataLoader(
+            self.market_monitor.api_client,
+            archive=self.market_monitor.kline_archive
+        )
         
         # 创建币种筛选器（如果启用内置评分，整合了评分功能）
         self.symbol_filter: Optional[SymbolFilter] = None
@@ -72,14 +82,20 @@ class AutoTrader:
         self.start_time = datetime.now()
         self.call_count = 0
         
-        # 启动市场数据监控器
-        self.market_monitor.start()
+        # 启动市场数据监控器（共享监控器由行情数据中心按引用计数启动）
+        if self.market_hub:
+            self.market_hub.acquire(self.trader_id, self.exchange_config)
+        else:
+            self.market_monitor.start()
         logger.info(f"✅ 市场数据监控器已启动")
         
         # 如果启用内置AI评分，初始化所有币种并启动筛选任务
         if self.trader_cfg.get('use_inside_coins') and self.symbol_filter:
             logger.info("🚀 启用内置AI评分，开始初始化所有币种...")
             
+            # 全市场价格由 !ticker@arr / !markPrice@arr 推送，只有候选币种单独订阅K线流
+            self.market_monitor.enable_market_streams()
+            
             # 先设置 running_flag，然后立即启动筛选任务（即使数据还没准备好）
             # 这样筛选任务会在后台等待数据加载完成
             self.symbol_filter.running_flag = self._stop_event
@@ -93,16 +109,27 @@ class AutoTrader:
                     all_symbols = self.historical_loader.get_all_tradable_symbols()
                     logger.info(f"找到 {len(all_symbols)} 个交易对")
                     
-                    # 2. 加载历史数据到monitor缓存
+                    # 2. 加载历史数据到monitor缓存（共享监控器中已有数据的币种无需重复下载）
+                    symbols_to_load = [
+                        symbol for symbol in all_symbols
+                        if self.market_monitor.kline_store.count(symbol, "3m") == 0
+                        or self.market_monitor.kline_store.count(symbol, "4h") == 0
+                    ]
+                    if len(symbols_to_load) < len(all_symbols):
+                        logger.info(f"📦 {len(all_symbols) - len(symbols_to_load)} 个币种已有缓存数据（共享监控器），跳过加载")
+                    # 已有数据的币种立即参与评分，其余币种每加载完一个就加入筛选（逐步发布部分排名）
+                    pending = set(symbols_to_load)
+                    self.symbol_filter.add_symbols([symbol for symbol in all_symbols if symbol not in pending])
                     success_count = self.historical_loader.load_historical_data(
-                        all_symbols,
+                        symbols_to_load,
                         ["3m", "4h"],
-                        self.market_monitor.kline_cache,
-                        self.market_monitor._cache_lock
+                        self.market_monitor.kline_store,
+                        priority_symbols=self._priority_symbols(symbols_to_load),
+                        on_symbol_loaded=lambda symbol: self.symbol_filter.add_symbols([symbol])
                     )
-                    logger.info(f"✅ 历史数据加载完成，成功加载 {success_count}/{len(all_symbols)} 个币种")
+                    logger.info(f"✅ 历史数据加载完成，成功加载 {success_count}/{len(symbols_to_load)} 个币种")
                     
-                    # 3. 更新 symbol_filter 的 all_symbols（筛选任务会自动使用新数据）
+                    # 3. 按交易所顺序设置完整的 all_symbols（统一重新排名一次）
                     self.symbol_filter.all_symbols = all_symbols
                     logger.info("✅ 所有币种初始化完成，筛选任务将使用新数据")
                 except Exception as e:
@@ -125,6 +152,17 @@ class AutoTrader:
         self._scan_thread.start()
         logger.info(f"Trader {self.trader_name} started")
     
+    def _priority_symbols(self, symbols: List[str]) -> List[str]:
+        """冷启动时优先加载的币种：已监控的币种（持仓/候选）和24小时成交额最高的币种"""
+        by_key = {symbol.replace('/', '').upper(): symbol for symbol in symbols}
+        monitored = (symbol.replace('/', '').upper() for symbol in list(self.market_monitor._monitored_symbols))
+        priority = [by_key[key] for key in monitored if key in by_key]
+        # 全市场 Ticker 流已推送时，按成交额（q）取前几名
+        tickers = [(key, ticker) for key, ticker in list(self.market_monitor.ticker_cache.items()) if key in by_key]
+        tickers.sort(key=lambda item: float(item[1].get('q') or 0), reverse=True)
+        priority.extend(by_key[key] for key, _ in tickers[:self.PRIORITY_VOLUME_TOP])
+        return list(dict.fromkeys(priority))
+    
     def stop(self):
         #停止交易员
         if not self.is_running:
@@ -138,8 +176,11 @@ class AutoTrader:
         if self.symbol_filter:
             self.symbol_filter.stop()
         
-        # 停止市场数据监控器
-        self.market_monitor.stop()
+        # 停止市场数据监控器（共享监控器只释放本交易员的订阅，最后一个交易员释放时才停止）
+        if self.market_hub:
+            self.market_hub.release(self.trader_id, self.exchange_config)
+        else:
+            self.market_monitor.stop()
         
         if self._scan_thread:
             self._scan_thread.join()
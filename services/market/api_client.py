@@ -1,23 +1,63 @@
 import ccxt
+from typing import Dict, List, Optional, Tuple
 from utils.logger import logger
 from services.market.type import MarketData
 from services.market.type import Kline
+from services.market.markets_cache import MarketsCache
+from services.market.weight_scheduler import WeightScheduler
 
 class APIClient:
     """REST API 客户端（CCXT）"""
+    
+    # 经过权重调度器的现货接口（/api/v3）；持仓量/资金费率走合约接口（/fapi），
+    # 其响应头中的已用权重和限频属于合约的额度，不用于校准现货调度器
+    SCHEDULED_METHODS = frozenset({'fetch_ohlcv'})
     #固定使用binance的API
     def __init__(self):
         #写死用binance的API了，素以exchange_config参数没用上
         self.exchange = ccxt.binance()
+        self.scheduler = WeightScheduler.for_exchange("binance")  # 进程内共享的请求权重调度器
         logger.info(f"APIClient initialized")
-        # 初始化时加载市场数据
+        # 初始化时加载市场数据（进程内共享缓存，未过期时不访问网络）
         try:
-            self.exchange.load_markets()
+            self.load_markets()
             logger.info(f"APIClient initialized, markets loaded")
         except Exception as e:
             logger.error(f"❌ 加载市场数据失败: {e}", exc_info=True)
             raise
 
+    def load_markets(self):
+        """从共享缓存装入市场数据（缓存为空或过期时下载一次并写入缓存）"""
+        return MarketsCache.instance().apply(self.exchange)
+
+    def _call(self, method: str, *args, **kwargs):
+        """调用 ccxt 方法，调度器管理的现货接口把已用权重 / 限频反馈给调度器"""
+        scheduled = method in self.SCHEDULED_METHODS
+        try:
+            result = getattr(self.exchange, method)(*args, **kwargs)
+        except (ccxt.RateLimitExceeded, ccxt.DDoSProtection):
+            if scheduled:
+                self._report_rate_limited()
+            raise
+        if scheduled:
+            self._report_used_weight()
+        return result
+
+    def _response_header(self, name: str) -> Optional[str]:
+        headers = getattr(self.exchange, 'last_response_headers', None) or {}
+        return headers.get(name) or headers.get(name.lower())
+
+    def _report_used_weight(self):
+        """读取响应头 X-MBX-USED-WEIGHT-1M 校准调度器的令牌"""
+        used_weight = self._response_header('X-MBX-USED-WEIGHT-1M')
+        if used_weight is not None:
+            self.scheduler.observe(int(used_weight))
+
+    def _report_rate_limited(self):
+        """429/418：按 Retry-After 暂停调度器"""
+        retry_after = self._response_header('Retry-After')
+        self.scheduler.penalize(float(retry_after) if retry_after else None)
+
     def get_market_data(self, symbol: str):
         """获取市场数据"""
         try:
@@ -32,117 +72,183 @@ class APIClient:
         """获取持仓量（返回合约数量）"""
         try:
             symbol = self._normalize_symbol(symbol)
-            open_interest_data = self.exchange.fetch_open_interest(symbol)
-            
-            if open_interest_data is None:
-                logger.debug(f"⚠️ {symbol} Open Interest 返回 None")
-                return None
-            
-            # CCXT 返回格式: {'openInterestAmount': 12345.67, 'openInterestValue': None, ...}
-            if isinstance(open_interest_data, dict):
-                # 优先使用 openInterestAmount（持仓量，合约数量）
-                oi_amount = open_interest_data.get('openInterestAmount')
-                if oi_amount is not None:
-                    return float(oi_amount)
-                
-                # 备选：尝试 openInterest 字段
-                oi = open_interest_data.get('openInterest')
-                if oi is not None:
-                    return float(oi)
-            
-            logger.warning(f"⚠️ {symbol} Open Interest 数据格式异常: {open_interest_data}")
-            return None
+            open_interest_data = self._call('fetch_open_interest', symbol)
+            return self._parse_open_interest(symbol, open_interest_data)
         except Exception as e:
             logger.error(f"❌ 获取 {symbol} 持仓量失败: {e}", exc_info=True)
             return None
     
+    def _parse_open_interest(self, symbol: str, open_interest_data):
+        """解析 fetch_open_interest 的返回值"""
+        if open_interest_data is None:
+            logger.debug(f"⚠️ {symbol} Open Interest 返回 None")
+            return None
+        
+        # CCXT 返回格式: {'openInterestAmount': 12345.67, 'openInterestValue': None, ...}
+        if isinstance(open_interest_data, dict):
+            # 优先使用 openInterestAmount（持仓量，合约数量）
+            oi_amount = open_interest_data.get('openInterestAmount')
+            if oi_amount is not None:
+                return float(oi_amount)
+            
+            # 备选：尝试 openInterest 字段
+            oi = open_interest_data.get('openInterest')
+            if oi is not None:
+                return float(oi)
+        
+        logger.warning(f"⚠️ {symbol} Open Interest 数据格式异常: {open_interest_data}")
+        return None
+    
     def get_funding_rate(self, symbol: str):
         """获取资金费率"""
         try:
-            # 规范化币种并转换为永续合约格式
-            # 处理输入格式: "BTC/USDT" 或 "BTC" 或 "BTCUSDT"
-            normalized = symbol.upper().strip()
-            
-            # 如果包含斜杠，直接使用
-            if '/' in normalized:
-                base, quote = normalized.split('/')
-            else:
-                # 如果没有斜杠，尝试从 "BTCUSDT" 格式提取
-                if normalized.endswith('USDT'):
-                    base = normalized[:-4]
-                    quote = 'USDT'
-                else:
-                    # 默认添加 USDT
-                    base = normalized
-                    quote = 'USDT'
-            
-            # 转换为永续合约格式: BTC/USDT:USDT
-            contract_symbol = f"{base}/{quote}:{quote}"
-            
-            funding_rate_data = self.exchange.fetch_funding_rate(contract_symbol)
-            # 处理返回结果（可能是 dict 或 float）
-            if isinstance(funding_rate_data, dict):
-                funding_rate = funding_rate_data.get('fundingRate') or funding_rate_data.get('rate')
-                if funding_rate is not None:
-                    logger.debug(f"获取到资金费率: {funding_rate}")
-                    return float(funding_rate)
-            elif isinstance(funding_rate_data, (int, float)):
-                logger.debug(f"获取到资金费率: {funding_rate_data}")
-                return float(funding_rate_data)
-            
-            logger.warning(f"⚠️ {symbol} 资金费率数据格式异常: {funding_rate_data}")
-            return None
+            funding_rate_data = self._call('fetch_funding_rate', self._contract_symbol(symbol))
+            return self._parse_funding_rate(symbol, funding_rate_data)
         except Exception as e:
             logger.error(f"❌ 获取资金费率失败: {e}", exc_info=True)
             return None
+    
+    def get_funding_rates(self) -> Dict[str, float]:
+        """批量获取所有永续合约的资金费率 {BTCUSDT: rate}（premiumIndex，一次请求）"""
+        try:
+            return self._parse_funding_rates(self._call('fetch_funding_rates'))
+        except Exception as e:
+            logger.error(f"❌ 批量获取资金费率失败: {e}", exc_info=True)
+            return {}
+    
+    def _parse_funding_rates(self, funding_rates_data) -> Dict[str, float]:
+        """解析 fetch_funding_rates 的返回值（按交易所 ID 索引，如 BTCUSDT）"""
+        rates = {}
+        for unified_symbol, item in (funding_rates_data or {}).items():
+            rate = item.get('fundingRate')
+            if rate is None:
+                continue
+            market_id = (item.get('info') or {}).get('symbol') or unified_symbol.split(':')[0].replace('/', '')
+            rates[market_id.upper()] = float(rate)
+        return rates
+    
+    def get_open_interests(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        """获取一组交易对的持仓量（币安没有批量接口，逐个请求）"""
+        return {symbol: self.get_open_interest(symbol) for symbol in symbols}
+    
+    def get_open_interest_history(self, symbol: str, period: str = '5m',
+                                  limit: int = 48) -> Optional[List[Tuple[int, float]]]:
+        """获取持仓量历史 [(timestamp_ms, 持仓量)]（openInterestHist，按时间升序）"""
+        try:
+            symbol = self._normalize_symbol(symbol)
+            history = self._call('fetch_open_interest_history', symbol, period, limit=limit)
+            return self._parse_open_interest_history(history)
+        except Exception as e:
+            logger.error(f"❌ 获取 {symbol} 持仓量历史失败: {e}", exc_info=True)
+            return None
+    
+    def _parse_open_interest_history(self, history) -> List[Tuple[int, float]]:
+        """解析 fetch_open_interest_history 的返回值（跳过没有持仓量的记录）"""
+        points = []
+        for item in history or []:
+            value = item.get('openInterestAmount')
+            if value is None:
+                value = item.get('openInterest')
+            if value is None or item.get('timestamp') is None:
+                continue
+            points.append((int(item['timestamp']), float(value)))
+        points.sort()
+        return points
+    
+    def get_open_interest_histories(self, symbols: List[str], period: str = '5m',
+                                    limit: int = 48) -> Dict[str, Optional[List[Tuple[int, float]]]]:
+        """获取一组交易对的持仓量历史（逐个请求）"""
+        return {symbol: self.get_open_interest_history(symbol, period, limit) for symbol in symbols}
+    
+    def get_derivatives(self, symbol: str) -> Tuple[Optional[float], Optional[float]]:
+        """获取持仓量和资金费率 (open_interest, funding_rate)"""
+        return self.get_open_interest(symbol), self.get_funding_rate(symbol)
+    
+    def _contract_symbol(self, symbol: str) -> str:
+        """规范化币种并转换为永续合约格式: BTC/USDT:USDT"""
+        # 处理输入格式: "BTC/USDT" 或 "BTC" 或 "BTCUSDT"
+        normalized = symbol.upper().strip()
         
-    def get_Klines(self, symbol: str, timeframe: str, limit: int=100):
-        """获取K线数据"""
+        # 如果包含斜杠，直接使用
+        if '/' in normalized:
+            base, quote = normalized.split('/')
+        else:
+            # 如果没有斜杠，尝试从 "BTCUSDT" 格式提取
+            if normalized.endswith('USDT'):
+                base = normalized[:-4]
+                quote = 'USDT'
+            else:
+                # 默认添加 USDT
+                base = normalized
+                quote = 'USDT'
+        
+        return f"{base}/{quote}:{quote}"
+    
+    def _parse_funding_rate(self, symbol: str, funding_rate_data):
+        """解析 fetch_funding_rate 的返回值"""
+        # 处理返回结果（可能是 dict 或 float）
+        if isinstance(funding_rate_data, dict):
+            funding_rate = funding_rate_data.get('fundingRate') or funding_rate_data.get('rate')
+            if funding_rate is not None:
+                logger.debug(f"获取到资金费率: {funding_rate}")
+                return float(funding_rate)
+        elif isinstance(funding_rate_data, (int, float)):
+            logger.debug(f"获取到资金费率: {funding_rate_data}")
+            return float(funding_rate_data)
+        
+        logger.warning(f"⚠️ {symbol} 资金费率数据格式异常: {funding_rate_data}")
+        return None
+        
+    def get_Klines(self, symbol: str, timeframe: str, limit: int=100, since: Optional[int] = None):
+        """获取K线数据（指定 since 时从该 open_time（毫秒）开始向后获取）"""
         try:
             symbol = self._normalize_symbol(symbol)
             #使用CCXT获取K线数据
-            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            ohlcv = self._call('fetch_ohlcv', symbol, timeframe, since=since, limit=limit)
             #logger.info(f"获取到K线数据: {len(ohlcv)} 根")
-            
-            kline_list = []
-            for ohlcv_item in ohlcv:
-                # CCXT 返回格式: [timestamp, open, high, low, close, volume]
-                open_time = int(ohlcv_item[0])
-                open_price = float(ohlcv_item[1])
-                high = float(ohlcv_item[2])
-                low = float(ohlcv_item[3])
-                close = float(ohlcv_item[4])
-                volume = float(ohlcv_item[5]) if len(ohlcv_item) > 5 else 0.0
-                
-                # 计算缺失的字段
-                # close_time: 根据 timeframe 计算（近似值）
-                close_time = self._calculate_close_time(open_time, timeframe)
-                
-                # quote_volume: 使用 close 价格估算（volume * close）
-                quote_volume = volume * close if volume > 0 else 0.0
-                
-                # trades: CCXT 不提供，设为 0
-                trades = 0
-                
-                kline = Kline(
-                    open_time=open_time,
-                    open=open_price,
-                    high=high,
-                    low=low,
-                    close=close,
-                    volume=volume,
-                    close_time=close_time,
-                    quote_volume=quote_volume,
-                    trades=trades
-                )
-                kline_list.append(kline)
-            
-            #logger.info(f"✅ 成功转换 {len(kline_list)} 根K线数据")
-            return kline_list
+            return self._to_klines(ohlcv, timeframe)
         except Exception as e:
             #logger.error(f"❌ 获取K线数据失败: {e}", exc_info=True)
             return None
     
+    def _to_klines(self, ohlcv: list, timeframe: str) -> List[Kline]:
+        """把 CCXT 的 OHLCV 数组转换为 Kline 列表"""
+        kline_list = []
+        for ohlcv_item in ohlcv:
+            # CCXT 返回格式: [timestamp, open, high, low, close, volume]
+            open_time = int(ohlcv_item[0])
+            open_price = float(ohlcv_item[1])
+            high = float(ohlcv_item[2])
+            low = float(ohlcv_item[3])
+            close = float(ohlcv_item[4])
+            volume = float(ohlcv_item[5]) if len(ohlcv_item) > 5 else 0.0
+            
+            # 计算缺失的字段
+            # close_time: 根据 timeframe 计算（近似值）
+            close_time = self._calculate_close_time(open_time, timeframe)
+            
+            # quote_volume: 使用 close 价格估算（volume * close）
+            quote_volume = volume * close if volume > 0 else 0.0
+            
+            # trades: CCXT 不提供，设为 0
+            trades = 0
+            
+            kline = Kline(
+                open_time=open_time,
+                open=open_price,
+                high=high,
+                low=low,
+                close=close,
+                volume=volume,
+                close_time=close_time,
+                quote_volume=quote_volume,
+                trades=trades
+            )
+            kline_list.append(kline)
+        
+        #logger.info(f"✅ 成功转换 {len(kline_list)} 根K线数据")
+        return kline_list
+    
     def _calculate_close_time(self, open_time: int, timeframe: str) -> int:
         """根据开盘时间和时间周期计算收盘时间（毫秒）"""
         # 将时间周期转换为秒数
@@ -0,0 +1,257 @@
+"""
+异步 REST API 客户端 - 基于 ccxt.async_support，在独立事件循环中并发请求
+所有请求共享一个 aiohttp 会话（keep-alive、连接池），并发请求由 ccxt 的限速器按接口权重排队；
+继承 APIClient 的同步方法签名，现有调用方无需修改
+"""
+import asyncio
+import ssl
+import threading
+from typing import Coroutine, Dict, List, Optional, Tuple
+import aiohttp
+import certifi
+import ccxt.async_support as ccxt_async
+from utils.logger import logger
+from services.market.api_client import APIClient
+from services.market.markets_cache import MarketsCache
+from services.market.weight_scheduler import WeightScheduler
+from services.market.type import Kline
+
+
+class AsyncAPIClient(APIClient):
+    """异步 REST API 客户端（CCXT async_support）
+
+    - 异步方法（*_async）可在任意事件循环中 await，请求实际在客户端自己的事件循环线程中执行
+    - 同步方法（get_Klines / get_open_interest / get_funding_rate）阻塞等待结果，与 APIClient 一致
+    - 批量方法（get_klines_many / get_open_interests / get_derivatives）在一次调用中并发发出多个请求
+    """
+
+    MAX_CONNECTIONS = 20  # 连接池大小
+    MAX_CONCURRENT_REQUESTS = 10  # 同时进行的请求数（其余请求在 ccxt 限速器之前排队）
+    KEEPALIVE_SECONDS = 30  # 空闲连接保持时间
+    REQUEST_TIMEOUT_SECONDS = 30  # 同步方法等待单个请求的超时
+    LOAD_MARKETS_TIMEOUT_SECONDS = 60  # 初始化加载市场数据的超时
+
+    def __init__(self):
+        # 不调用 APIClient.__init__（它会创建同步的 ccxt 实例）
+        self.scheduler = WeightScheduler.for_exchange("binance")
+        self._start()
+
+    def _start(self):
+        """启动事件循环线程，创建共享会话并加载市场数据"""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="AsyncAPIClient")
+        self._thread.start()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.exchange = None
+        try:
+            self._run(self._open(), timeout=self.LOAD_MARKETS_TIMEOUT_SECONDS)
+            logger.info("AsyncAPIClient initialized, markets loaded")
+        except Exception as e:
+            logger.error(f"❌ 加载市场数据失败: {e}", exc_info=True)
+            self.close()
+            raise
+
+    async def _open(self):
+        """在客户端事件循环中创建共享会话和交易所实例，并加载市场数据"""
+        connector = aiohttp.TCPConnector(
+            limit=self.MAX_CONNECTIONS,
+            keepalive_timeout=self.KEEPALIVE_SECONDS,
+            ssl=ssl.create_default_context(cafile=certifi.where()),
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(connector=connector, trust_env=True)
+        self._semaphore = asyncio.Semaphore(self.MAX_CONCURRENT_REQUESTS)
+        self.exchange = ccxt_async.binance({'enableRateLimit': True, 'session': self._session})
+        await self._load_markets()
+
+    async def _load_markets(self):
+        """从共享缓存装入市场数据，缓存为空或过期时下载并写入缓存"""
+        cache = MarketsCache.instance()
+        cached = cache.get()
+        if cached is None:
+            await self.exchange.load_markets(reload=True)
+            cache.store(self.exchange.markets, getattr(self.exchange, 'currencies', None))
+            return self.exchange.markets
+        markets, currencies = cached
+        self.exchange.set_markets(list(markets.values()), currencies)
+        return self.exchange.markets
+
+    def _submit(self, coroutine: Coroutine):
+        """把协程提交到客户端事件循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    def _run(self, coroutine: Coroutine, timeout: Optional[float] = None):
+        """在客户端事件循环中执行协程并阻塞等待结果"""
+        return self._submit(coroutine).result(timeout=timeout or self.REQUEST_TIMEOUT_SECONDS)
+
+    async def _request(self, method: str, *args, **kwargs):
+        """调用 ccxt 异步方法（限制同时进行的请求数，权重限速由 ccxt 处理，现货接口的已用权重反馈给调度器）"""
+        scheduled = method in self.SCHEDULED_METHODS
+        async with self._semaphore:
+            try:
+                result = await getattr(self.exchange, method)(*args, **kwargs)
+            except (ccxt_async.RateLimitExceeded, ccxt_async.DDoSProtection):
+                if scheduled:
+                    self._report_rate_limited()
+                raise
+            if scheduled:
+                self._report_used_weight()
+            return result
+
+    # ---------- 客户端事件循环中执行的协程 ----------
+
+    async def _get_klines(self, symbol: str, timeframe: str, limit: int, since: Optional[int]) -> Optional[List[Kline]]:
+        try:
+            ohlcv = await self._request('fetch_ohlcv', self._normalize_symbol(symbol), timeframe, since=since, limit=limit)
+            return self._to_klines(ohlcv, timeframe)
+        except Exception:
+            return None
+
+    async def _get_open_interest(self, symbol: str) -> Optional[float]:
+        symbol = self._normalize_symbol(symbol)
+        try:
+            return self._parse_open_interest(symbol, await self._request('fetch_open_interest', symbol))
+        except Exception as e:
+            logger.error(f"❌ 获取 {symbol} 持仓量失败: {e}", exc_info=True)
+            return None
+
+    async def _get_funding_rate(self, symbol: str) -> Optional[float]:
+        try:
+            data = await self._request('fetch_funding_rate', self._contract_symbol(symbol))
+            return self._parse_funding_rate(symbol, data)
+        except Exception as e:
+            logger.error(f"❌ 获取资金费率失败: {e}", exc_info=True)
+            return None
+
+    async def _get_funding_rates(self) -> Dict[str, float]:
+        try:
+            return self._parse_funding_rates(await self._request('fetch_funding_rates'))
+        except Exception as e:
+            logger.error(f"❌ 批量获取资金费率失败: {e}", exc_info=True)
+            return {}
+
+    async def _get_open_interests(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        values = await asyncio.gather(*(self._get_open_interest(symbol) for symbol in symbols))
+        return dict(zip(symbols, values))
+
+    async def _get_open_interest_history(self, symbol: str, period: str,
+                                         limit: int) -> Optional[List[Tuple[int, float]]]:
+        symbol = self._normalize_symbol(symbol)
+        try:
+            history = await self._request('fetch_open_interest_history', symbol, period, limit=limit)
+            return self._parse_open_interest_history(history)
+        except Exception as e:
+            logger.error(f"❌ 获取 {symbol} 持仓量历史失败: {e}", exc_info=True)
+            return None
+
+    async def _get_open_interest_histories(self, symbols: List[str], period: str,
+                                           limit: int) -> Dict[str, Optional[List[Tuple[int, float]]]]:
+        values = await asyncio.gather(*(self._get_open_interest_history(symbol, period, limit) for symbol in symbols))
+        return dict(zip(symbols, values))
+
+    async def _get_klines_many(self, requests: List[Tuple]) -> List[Optional[List[Kline]]]:
+        return await asyncio.gather(*(
+            self._get_klines(symbol, timeframe, limit, since[0] if since else None)
+            for symbol, timeframe, limit, *since in requests
+        ))
+
+    async def _get_derivatives(self, symbol: str) -> Tuple[Optional[float], Optional[float]]:
+        return tuple(await asyncio.gather(self._get_open_interest(symbol), self._get_funding_rate(symbol)))
+
+    # ---------- 异步接口（可在任意事件循环中 await） ----------
+
+    async def get_klines_async(self, symbol: str, timeframe: str, limit: int = 100,
+                               since: Optional[int] = None) -> Optional[List[Kline]]:
+        """异步获取K线数据"""
+        return await asyncio.wrap_future(self._submit(self._get_klines(symbol, timeframe, limit, since)))
+
+    async def get_open_interest_async(self, symbol: str) -> Optional[float]:
+        """异步获取持仓量"""
+        return await asyncio.wrap_future(self._submit(self._get_open_interest(symbol)))
+
+    async def get_funding_rate_async(self, symbol: str) -> Optional[float]:
+        """异步获取资金费率"""
+        return await asyncio.wrap_future(self._submit(self._get_funding_rate(symbol)))
+
+    # ---------- 同步接口（与 APIClient 一致） ----------
+
+    def get_Klines(self, symbol: str, timeframe: str, limit: int = 100, since: Optional[int] = None):
+        """获取K线数据（指定 since 时从该 open_time（毫秒）开始向后获取）"""
+        return self._run(self._get_klines(symbol, timeframe, limit, since))
+
+    def get_open_interest(self, symbol: str):
+        """获取持仓量（返回合约数量）"""
+        return self._run(self._get_open_interest(symbol))
+
+    def get_funding_rate(self, symbol: str):
+        """获取资金费率"""
+        return self._run(self._get_funding_rate(symbol))
+
+    def get_klines_many(self, requests: List[Tuple]) -> List[Optional[List[Kline]]]:
+        """并发获取多组K线 [(symbol, timeframe, limit) 或 (symbol, timeframe, limit, since)]，结果顺序与请求一致（失败为 None）"""
+        if not requests:
+            return []
+        # 请求在限速器中排队，总超时按批量大小放宽
+        timeout = self.REQUEST_TIMEOUT_SECONDS * max(1, len(requests) // self.MAX_CONCURRENT_REQUESTS)
+        return self._run(self._get_klines_many(requests), timeout=timeout)
+
+    def get_funding_rates(self) -> Dict[str, float]:
+        """批量获取所有永续合约的资金费率 {BTCUSDT: rate}"""
+        return self._run(self._get_funding_rates())
+
+    def get_open_interests(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        """并发获取一组交易对的持仓量"""
+        if not symbols:
+            return {}
+        timeout = self.REQUEST_TIMEOUT_SECONDS * max(1, len(symbols) // self.MAX_CONCURRENT_REQUESTS)
+        return self._run(self._get_open_interests(symbols), timeout=timeout)
+
+    def get_open_interest_history(self, symbol: str, period: str = '5m',
+                                  limit: int = 48) -> Optional[List[Tuple[int, float]]]:
+        """获取持仓量历史 [(timestamp_ms, 持仓量)]"""
+        return self._run(self._get_open_interest_history(symbol, period, limit))
+
+    def get_open_interest_histories(self, symbols: List[str], period: str = '5m',
+                                    limit: int = 48) -> Dict[str, Optional[List[Tuple[int, float]]]]:
+        """并发获取一组交易对的持仓量历史"""
+        if not symbols:
+            return {}
+        timeout = self.REQUEST_TIMEOUT_SECONDS * max(1, len(symbols) // self.MAX_CONCURRENT_REQUESTS)
+        return self._run(self._get_open_interest_histories(symbols, period, limit), timeout=timeout)
+
+    def get_derivatives(self, symbol: str) -> Tuple[Optional[float], Optional[float]]:
+        """并发获取持仓量和资金费率"""
+        return self._run(self._get_derivatives(symbol))
+
+    def load_markets(self):
+        """从共享缓存装入市场数据（缓存过期时重新下载）"""
+        return self._run(self._load_markets(), timeout=self.LOAD_MARKETS_TIMEOUT_SECONDS)
+
+    def is_closed(self) -> bool:
+        """是否已关闭（close 之后需要 reopen 才能继续请求）"""
+        return self._loop.is_closed()
+
+    def reopen(self):
+        """重新建立事件循环和共享会话（已关闭时；持有该实例的调用方无需替换引用）"""
+        if self.is_closed():
+            self._start()
+
+    def close(self):
+        """关闭交易所连接和共享会话，停止事件循环线程"""
+        if self._loop.is_closed():
+            return
+
+        async def close_all():
+            if self.exchange is not None:
+                await self.exchange.close()
+            if self._session is not None:
+                await self._session.close()
+
+        try:
+            self._run(close_all())
+        except Exception as e:
+            logger.warning(f"关闭 AsyncAPIClient 时出错: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
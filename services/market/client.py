@@ -1,19 +1,69 @@
-from typing import Dict, Callable, List, Optional
-from collections import defaultdict
+from typing import Awaitable, Dict, Callable, List, Optional, Tuple
+from collections import defaultdict, deque
 from utils.logger import logger
+from services.market.stream_dispatcher import StreamDispatcher
 
 import websockets
 import asyncio
 import json
+import math
+import time
+
+try:
+    import orjson  # 可选：更快的 JSON 解析
+except ImportError:
+    orjson = None
+
+RAW_STREAM_URL = "wss://fstream.binance.com/ws"
+COMBINED_STREAM_URL = "wss://fstream.binance.com/stream"
+
 
 class WSClient:
-    """统一的WebSocket客户端 - 用于实时数据流推送"""
+    """统一的WebSocket客户端 - 用于实时数据流推送
     
-    def __init__(self, base_url: str = "wss://fstream.binance.com/ws") -> None:
-        # 改为使用 /ws 端点，支持动态订阅
-        self.base_url = base_url
+    支持两种端点：
+    - /ws（默认）：推送原始数据对象，全市场流（如 !ticker@arr）直接推送数组
+    - /stream（combined=True）：组合流，消息包装为 {"stream": ..., "data": ...}，
+      连接时把已订阅的流直接放在 URL 中（?streams=a/b/c），无需额外发送 SUBSCRIBE
+    
+    传入 dispatcher 时，同步回调交给分发线程执行（按流有界排队），接收循环只负责解析和入队；
+    协程回调始终在事件循环中直接调用。
+    """
+    
+    # 全市场数组流：数组元素的事件类型 -> 流名称（/ws 端点下消息本身不带流名称）
+    ARRAY_STREAMS = {
+        "24hrTicker": "!ticker@arr",
+        "markPriceUpdate": "!markPrice@arr",
+    }
+    # 流名称后缀 -> 消息中的事件类型（e 字段），用于订阅时预先计算分发键
+    STREAM_EVENTS = {
+        "ticker": "24hrTicker",
+        "miniTicker": "24hrMiniTicker",
+        "markPrice": "markPriceUpdate",
+        "aggTrade": "aggTrade",
+        "bookTicker": "bookTicker",
+        "forceOrder": "forceOrder",
+    }
+    
+    MAX_STREAMS_PER_FRAME = 200  # 单个 SUBSCRIBE/UNSUBSCRIBE 请求最多包含的流数量
+    CONTROL_MESSAGES_PER_SECOND = 5  # 控制消息发送速率（币安限制每个连接每秒最多 10 条）
+    
+    def __init__(self, base_url: Optional[str] = None, combined: bool = False,
+                 json_loads: Optional[Callable] = None,
+                 dispatcher: Optional[StreamDispatcher] = None) -> None:
+        # 默认使用 /ws 端点，支持动态订阅；combined=True 时使用 /stream 组合流端点
+        self.combined = combined
+        self.base_url = base_url or (COMBINED_STREAM_URL if combined else RAW_STREAM_URL)
         self.conn: Optional[websockets.WebSocketClientProtocol] = None
         self.subscribers: Dict[str, List[Callable]] = defaultdict(list)
+        # 消息解析：默认优先使用 orjson（已安装时）
+        self._loads = json_loads or (orjson.loads if orjson is not None else json.loads)
+        # 订阅时预先计算的分发表，收到消息时只做一次字典查找：
+        # (交易对, 事件类型, K线周期) / 流名称 / 数组元素事件类型 -> [(回调, 是否协程)]
+        self._event_handlers: Dict[Tuple[str, str, Optional[str]], List[Tuple[Callable, bool]]] = {}
+        self._stream_handlers: Dict[str, List[Tuple[Callable, bool]]] = {}
+        self._array_handlers: Dict[str, List[Tuple[Callable, bool]]] = {}
+        self.dispatcher = dispatcher  # 由创建者负责停止（可被多个连接共享）
         self.reconnect = True
         self._running = False
         self._task: Optional[asyncio.Task] = None
@@ -23,6 +73,14 @@ class WSClient:
         self._max_reconnect_delay = 60
         self._request_id = 0  # 请求ID计数器
         
+        # 订阅控制消息：待发送队列按顺序合并为分块请求，并按速率限制发送
+        self._pending_control: deque = deque()  # (method, stream)
+        self._control_lock = asyncio.Lock()
+        self._last_control_sent = 0.0
+        # 重连回调：连接重新建立（并已重新订阅）后调用，WSClientPool 用它触发重新均衡
+        self.on_reconnect: Optional[Callable[['WSClient'], Awaitable[None]]] = None
+        self._connected_once = False
+        
         # WebSocket 连接配置
         self._open_timeout = 30.0  # 连接建立超时：30秒
         self._close_timeout = 10.0  # 关闭连接超时：10秒
@@ -53,9 +111,10 @@ class WSClient:
             
         try:
             # 添加连接超时和保活机制
+            url, url_stream_count = self._connect_url()
             self.conn = await asyncio.wait_for(
                 websockets.connect(
-                    self.base_url,
+                    url,
                     close_timeout=self._close_timeout,
                     ping_interval=self._ping_interval,
                     ping_timeout=self._ping_timeout,
@@ -64,9 +123,16 @@ class WSClient:
             )
             logger.info(f"✅ WebSocket连接已建立: {self.base_url}")
             
-            # 重新订阅之前的流
-            if self._subscribed_streams:
-                await self._resubscribe()
+            # 重新订阅之前的流（组合流模式下 URL 中已包含的部分无需再订阅）
+            if len(self._subscribed_streams) > url_stream_count:
+                await self._resubscribe(skip=url_stream_count)
+            
+            if self._connected_once and self.on_reconnect:
+                try:
+                    await self.on_reconnect(self)
+                except Exception as e:
+                    logger.error(f"重连回调执行失败: {e}", exc_info=True)
+            self._connected_once = True
                 
         except asyncio.TimeoutError:
             logger.error(f"❌ WebSocket连接超时: {self.base_url} (超时时间: {self._open_timeout}秒)")
@@ -77,115 +143,201 @@ class WSClient:
             self.conn = None
             raise
     
-    async def _resubscribe(self):
-        """重新订阅之前的流"""
-        if not self._subscribed_streams:
+    def _connect_url(self) -> Tuple[str, int]:
+        """连接地址，以及其中已包含的流数量（组合流模式下最多放入 MAX_STREAMS_PER_FRAME 个）"""
+        if not self.combined or not self._subscribed_streams:
+            return self.base_url, 0
+        streams = self._subscribed_streams[:self.MAX_STREAMS_PER_FRAME]
+        return f"{self.base_url}?streams={'/'.join(streams)}", len(streams)
+    
+    async def _resubscribe(self, skip: int = 0):
+        """重新订阅之前的流（分块发送，跳过连接 URL 中已包含的前 skip 个）"""
+        if len(self._subscribed_streams) <= skip:
             return
-            
-        subscribe_msg = {
-            "method": "SUBSCRIBE",
-            "params": self._subscribed_streams,
-            "id": self._get_next_id()
-        }
-        await self.conn.send(json.dumps(subscribe_msg))
-        logger.info(f"重新订阅流: {self._subscribed_streams}")
+        
+        async with self._control_lock:
+            # 新连接上没有任何订阅，队列中尚未发送的请求已包含在完整列表中
+            self._pending_control.clear()
+            streams = self._subscribed_streams[skip:]
+            for start in range(0, len(streams), self.MAX_STREAMS_PER_FRAME):
+                await self._send_control("SUBSCRIBE", streams[start:start + self.MAX_STREAMS_PER_FRAME])
+        logger.info(f"重新订阅流: {len(streams)} 个")
     
     async def subscribe(self, stream: str, callback: Callable):
         """订阅数据流"""
-        if stream not in self._subscribed_streams:
-            self._subscribed_streams.append(stream)
-            
-        self.subscribers[stream].append(callback)
+        await self.subscribe_many([(stream, callback)])
+    
+    async def subscribe_many(self, subscriptions: List[Tuple[str, Callable]]):
+        """批量订阅数据流（新增的流合并为分块的 SUBSCRIBE 请求）"""
+        new_streams = []
+        for stream, callback in subscriptions:
+            if stream not in self._subscribed_streams:
+                self._subscribed_streams.append(stream)
+                new_streams.append(stream)
+            self.subscribers[stream].append(callback)
         
-        if self.conn is not None:
-            subscribe_msg = {
-                "method": "SUBSCRIBE",
-                "params": [stream],
-                "id": self._get_next_id()
-            }
-            await self.conn.send(json.dumps(subscribe_msg))
-            logger.info(f"订阅流: {stream}")
+        self._rebuild_handlers(stream for stream, _ in subscriptions)
+        await self._enqueue_control("SUBSCRIBE", new_streams)
     
     async def unsubscribe(self, stream: str, callback: Optional[Callable] = None):
-        """取消订阅数据流"""
-        if callback:
-            if stream in self.subscribers:
-                self.subscribers[stream].remove(callback)
-        else:
+        """取消订阅数据流（指定 callback 时只移除该回调，最后一个回调移除后才发送 UNSUBSCRIBE）"""
+        callbacks = self.subscribers.get(stream)
+        if callback and callbacks:
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if callbacks:
+                self._rebuild_handlers([stream])
+                return
+        self.subscribers.pop(stream, None)
+        self._rebuild_handlers([stream])
+        await self._remove_streams([stream])
+    
+    async def unsubscribe_many(self, streams: List[str]):
+        """批量取消订阅数据流（合并为分块的 UNSUBSCRIBE 请求）"""
+        for stream in streams:
             self.subscribers.pop(stream, None)
-        
-        if stream in self._subscribed_streams:
+        self._rebuild_handlers(streams)
+        await self._remove_streams(streams)
+    
+    @classmethod
+    def _event_key(cls, stream: str) -> Optional[Tuple[str, str, Optional[str]]]:
+        """把流名称解析为消息的分发键，如 btcusdt@kline_3m -> ("BTCUSDT", "kline", "3m")"""
+        if stream.startswith("!") or "@" not in stream:
+            return None
+        symbol, name = stream.split("@", 1)
+        name = name.split("@", 1)[0]  # 去掉更新频率后缀，如 markPrice@1s
+        if name.startswith("kline_"):
+            return symbol.upper(), "kline", name[len("kline_"):]
+        return symbol.upper(), cls.STREAM_EVENTS.get(name, name), None
+    
+    def _rebuild_handlers(self, streams):
+        """重新计算若干流的分发表项（订阅变化时调用）"""
+        array_events = {stream: event for event, stream in self.ARRAY_STREAMS.items()}
+        for stream in streams:
+            handlers = [
+                (callback, asyncio.iscoroutinefunction(callback))
+                for callback in self.subscribers.get(stream, ())
+            ]
+            event_key = self._event_key(stream)
+            array_event = array_events.get(stream)
+            for table, key in ((self._stream_handlers, stream),
+                               (self._event_handlers, event_key),
+                               (self._array_handlers, array_event)):
+                if key is None:
+                    continue
+                if handlers:
+                    table[key] = handlers
+                else:
+                    table.pop(key, None)
+    
+    async def _remove_streams(self, streams: List[str]):
+        """从订阅列表移除并发送 UNSUBSCRIBE 请求"""
+        removed_streams = [stream for stream in streams if stream in self._subscribed_streams]
+        for stream in removed_streams:
             self._subscribed_streams.remove(stream)
-            
-        if self.conn is not None:
-            unsubscribe_msg = {
-                "method": "UNSUBSCRIBE",
-                "params": [stream],
-                "id": self._get_next_id()
-            }
-            await self.conn.send(json.dumps(unsubscribe_msg))
-            logger.info(f"取消订阅流: {stream}")
+        await self._enqueue_control("UNSUBSCRIBE", removed_streams)
+    
+    async def _enqueue_control(self, method: str, streams: List[str]):
+        """把订阅变更加入待发送队列并发送
+        
+        持有锁的调用方会把等待期间其他调用加入的请求一起发出，
+        同一方法的连续请求合并为最多 MAX_STREAMS_PER_FRAME 个流的一帧。
+        未连接时不发送，连接建立后 _resubscribe 会按完整订阅列表发送。
+        """
+        if not streams or self.conn is None:
+            return
+        self._pending_control.extend((method, stream) for stream in streams)
+        
+        async with self._control_lock:
+            while self._pending_control:
+                next_method = self._pending_control[0][0]
+                batch = []
+                while (self._pending_control and self._pending_control[0][0] == next_method
+                       and len(batch) < self.MAX_STREAMS_PER_FRAME):
+                    batch.append(self._pending_control.popleft()[1])
+                await self._send_control(next_method, batch)
+    
+    async def _send_control(self, method: str, streams: List[str]):
+        """发送一条订阅控制消息（调用方需持有 _control_lock，按速率限制间隔发送）"""
+        interval = 1.0 / self.CONTROL_MESSAGES_PER_SECOND
+        wait = self._last_control_sent + interval - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        
+        if self.conn is None:
+            return  # 连接已断开，重连后会重新订阅
+        message = {
+            "method": method,
+            "params": streams,
+            "id": self._get_next_id()
+        }
+        await self.conn.send(json.dumps(message))
+        self._last_control_sent = time.monotonic()
+        logger.info(f"{'订阅流' if method == 'SUBSCRIBE' else '取消订阅流'}: {len(streams)} 个")
     
     async def _handle_message(self, message: str):
-        """处理接收到的消息"""
+        """处理接收到的消息（按订阅时预先计算的分发表查找回调）"""
         try:
-            data = json.loads(message)
+            data = self._loads(message)
             
-            # 处理订阅确认消息
-            if "result" in data and "id" in data:
-                if data["result"] is None:
-                    logger.debug(f"订阅确认: {data}")
-                else:
-                    logger.warning(f"订阅响应: {data}")
+            # 全市场数组流（/ws 端点下直接推送数组，按元素的事件类型分发）
+            if type(data) is list:
+                if data:
+                    event = data[0].get("e")
+                    await self._invoke(event, self._array_handlers.get(event), data)
                 return
             
-            # Binance WebSocket 数据消息格式（使用 /ws 端点时的格式）
-            # 格式1: 直接的数据对象（单一流）
-            if "e" in data:  # 事件类型字段
-                # 这是单一流的数据格式
-                stream_name = f"{data.get('s', '').lower()}@{data.get('e', '').lower()}"
-                # 根据事件类型构建流名称
-                if data.get("e") == "kline":
-                    stream_name = f"{data.get('s', '').lower()}@kline_{data.get('k', {}).get('i', '')}"
-                elif data.get("e") == "24hrTicker":
-                    stream_name = f"{data.get('s', '').lower()}@ticker"
-                
-                if stream_name in self.subscribers:
-                    for callback in self.subscribers[stream_name]:
-                        try:
-                            if asyncio.iscoroutinefunction(callback):
-                                await callback(data)
-                            else:
-                                callback(data)
-                        except Exception as e:
-                            logger.error(f"回调函数执行失败: {e}", exc_info=True)
+            # 格式1: 直接的数据对象（/ws 端点的单一流）
+            event = data.get("e")
+            if event is not None:
+                if event == "kline":
+                    key = (data.get("s"), event, data["k"].get("i"))
+                else:
+                    key = (data.get("s"), event, None)
+                await self._invoke(key, self._event_handlers.get(key), data)
                 return
             
-            # 格式2: 组合流格式 {"stream": "...", "data": {...}}
+            # 格式2: 组合流格式 {"stream": "...", "data": {...}}（/stream 端点，data 也可能是数组）
             if "stream" in data and "data" in data:
                 stream = data["stream"]
-                payload = data["data"]
-                
-                # 通知所有订阅者
-                if stream in self.subscribers:
-                    for callback in self.subscribers[stream]:
-                        try:
-                            if asyncio.iscoroutinefunction(callback):
-                                await callback(payload)
-                            else:
-                                callback(payload)
-                        except Exception as e:
-                            logger.error(f"回调函数执行失败: {e}", exc_info=True)
+                await self._invoke(stream, self._stream_handlers.get(stream), data["data"])
+                return
+            
+            # 处理订阅确认消息
+            if "result" in data and "id" in data:
+                if data["result"] is None:
+                    logger.debug(f"订阅确认: {data}")
+                else:
+                    logger.warning(f"订阅响应: {data}")
                 return
             
             # 未知格式，记录日志
             logger.debug(f"收到未知格式消息: {data}")
                 
-        except json.JSONDecodeError as e:
+        except ValueError as e:
+            # json.JSONDecodeError 和 orjson.JSONDecodeError 都是 ValueError 的子类
             logger.error(f"JSON解析失败: {e}, 消息: {message}")
         except Exception as e:
             logger.error(f"处理消息失败: {e}", exc_info=True)
     
+    async def _invoke(self, key, handlers: Optional[List[Tuple[Callable, bool]]], payload):
+        """调用一组回调（是否为协程已在订阅时确定；有分发器时同步回调入队，由分发线程执行）"""
+        if not handlers:
+            return
+        dispatcher = self.dispatcher
+        if dispatcher is not None:
+            dispatcher.submit(key, handlers, payload)
+        for callback, is_coroutine in handlers:
+            if dispatcher is not None and not is_coroutine:
+                continue
+            try:
+                if is_coroutine:
+                    await callback(payload)
+                else:
+                    callback(payload)
+            except Exception as e:
+                logger.error(f"回调函数执行失败: {e}", exc_info=True)
+    
     async def _heartbeat_loop(self):
         """心跳循环 - 定期发送 ping 保持连接活跃"""
         while self._running:
@@ -308,6 +460,9 @@ class WSClient:
             return
             
         self._running = True
+        self.reconnect = True  # stop() 会关闭自动重连，重新启动时恢复
+        if self.dispatcher is not None:
+            self.dispatcher.start()
         await self.connect()
         self._task = asyncio.create_task(self._listen())
         self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
@@ -351,4 +506,176 @@ class WSClient:
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self.stop()
\ No newline at end of file
+        await self.stop()
+
+
+class WSClientPool:
+    """WebSocket 连接池 - 按每个连接的流数量上限把订阅分散到多个 WSClient
+    
+    接口与 WSClient 一致（start/stop/subscribe/subscribe_many/unsubscribe/unsubscribe_many）。
+    新订阅优先放入已有连接，满了再新建连接；任一连接重连后重新均衡各连接的流数量，
+    并关闭多余的空连接。
+    """
+    
+    DEFAULT_STREAMS_PER_CONNECTION = 200  # 币安单连接上限 1024，留足余量
+    
+    def __init__(self, base_url: Optional[str] = None,
+                 streams_per_connection: int = DEFAULT_STREAMS_PER_CONNECTION,
+                 combined: bool = False,
+                 dispatcher: Optional[StreamDispatcher] = None) -> None:
+        self.base_url = base_url
+        self.combined = combined
+        self.dispatcher = dispatcher  # 所有连接共享同一个回调分发线程
+        self.streams_per_connection = streams_per_connection
+        self.clients: List[WSClient] = []
+        self._stream_clients: Dict[str, WSClient] = {}  # 流 -> 所在连接
+        self._running = False
+        self._rebalance_lock = asyncio.Lock()
+        # 重连回调：某个连接重新建立后调用，参数为该连接上断线期间的流（MarketMonitor 用它回补K线）
+        self.on_reconnect: Optional[Callable[[List[str]], Awaitable[None]]] = None
+        self._create_client()
+    
+    @property
+    def subscribed_streams(self) -> List[str]:
+        """所有连接上已订阅的流"""
+        return list(self._stream_clients)
+    
+    def _create_client(self) -> WSClient:
+        client = WSClient(self.base_url, combined=self.combined, dispatcher=self.dispatcher)
+        client.on_reconnect = self._on_client_reconnect
+        self.clients.append(client)
+        return client
+    
+    def _client_streams(self, client: WSClient) -> List[str]:
+        return [stream for stream, owner in self._stream_clients.items() if owner is client]
+    
+    async def _client_with_capacity(self) -> WSClient:
+        """找到还有余量的连接，全部已满时新建（连接池运行中则立即启动）"""
+        counts = defaultdict(int)
+        for client in self._stream_clients.values():
+            counts[client] += 1
+        for client in self.clients:
+            if counts[client] < self.streams_per_connection:
+                return client
+        
+        client = self._create_client()
+        if self._running:
+            await client.start()
+        logger.info(f"WebSocket连接池扩容: {len(self.clients)} 个连接")
+        return client
+    
+    async def start(self):
+        """启动所有连接"""
+        self._running = True
+        for client in list(self.clients):
+            await client.start()
+    
+    async def stop(self):
+        """停止所有连接"""
+        self._running = False
+        for client in list(self.clients):
+            await client.stop()
+    
+    async def subscribe(self, stream: str, callback: Callable):
+        """订阅数据流"""
+        await self.subscribe_many([(stream, callback)])
+    
+    async def subscribe_many(self, subscriptions: List[Tuple[str, Callable]]):
+        """批量订阅数据流（按连接分组，每个连接合并发送）"""
+        grouped: Dict[WSClient, List[Tuple[str, Callable]]] = defaultdict(list)
+        for stream, callback in subscriptions:
+            client = self._stream_clients.get(stream)
+            if client is None:
+                client = await self._client_with_capacity()
+                self._stream_clients[stream] = client
+            grouped[client].append((stream, callback))
+        
+        for client, client_subscriptions in grouped.items():
+            await client.subscribe_many(client_subscriptions)
+    
+    async def unsubscribe(self, stream: str, callback: Optional[Callable] = None):
+        """取消订阅数据流（流还有其他回调时保留在原连接上）"""
+        client = self._stream_clients.get(stream)
+        if client is None:
+            return
+        await client.unsubscribe(stream, callback)
+        if not client.subscribers.get(stream):
+            self._stream_clients.pop(stream, None)
+    
+    async def unsubscribe_many(self, streams: List[str]):
+        """批量取消订阅数据流"""
+        grouped: Dict[WSClient, List[str]] = defaultdict(list)
+        for stream in streams:
+            client = self._stream_clients.pop(stream, None)
+            if client is not None:
+                grouped[client].append(stream)
+        
+        for client, client_streams in grouped.items():
+            await client.unsubscribe_many(client_streams)
+    
+    async def _on_client_reconnect(self, client: WSClient):
+        streams = self._client_streams(client)  # 断线期间没有收到数据的流
+        await self.rebalance(reconnecting=client)
+        if self.on_reconnect:
+            try:
+                await self.on_reconnect(streams)
+            except Exception as e:
+                logger.error(f"重连回调执行失败: {e}", exc_info=True)
+    
+    async def rebalance(self, reconnecting: Optional[WSClient] = None):
+        """重新均衡：按需要的最少连接数平均分配流，多余的空连接关闭
+        
+        迁移时先在目标连接订阅、再从原连接退订，避免迁移期间丢消息（K线写入按 open_time 去重）。
+        
+        Args:
+            reconnecting: 触发本次均衡的重连中连接。均衡运行在它自己的监听任务里，
+                不能在这里 stop 它（会等待自身任务），留给下一次均衡关闭
+        """
+        async with self._rebalance_lock:
+            total = len(self._stream_clients)
+            needed = max(1, math.ceil(total / self.streams_per_connection))
+            target = math.ceil(total / needed) if total else 0
+            
+            while len(self.clients) < needed:
+                client = self._create_client()
+                if self._running:
+                    await client.start()
+            
+            surplus: List[Tuple[WSClient, str]] = []
+            counts: Dict[WSClient, int] = {}
+            for index, client in enumerate(self.clients):
+                streams = self._client_streams(client)
+                keep = target if index < needed else 0
+                surplus.extend((client, stream) for stream in streams[keep:])
+                counts[client] = min(len(streams), keep)
+            
+            moves: Dict[Tuple[WSClient, WSClient], List[str]] = defaultdict(list)
+            destinations = iter(self.clients[:needed])
+            destination = next(destinations, None)
+            for source, stream in surplus:
+                while destination is not None and counts[destination] >= target:
+                    destination = next(destinations, None)
+                if destination is None:
+                    break
+                moves[(source, destination)].append(stream)
+                counts[destination] += 1
+            
+            for (source, destination), streams in moves.items():
+                await destination.subscribe_many([
+                    (stream, callback)
+                    for stream in streams
+                    for callback in list(source.subscribers.get(stream, []))
+                ])
+                await source.unsubscribe_many(streams)
+                for stream in streams:
+                    self._stream_clients[stream] = destination
+            
+            # 关闭多余的空连接（至少保留一个）
+            for client in self.clients[needed:]:
+                if client is not reconnecting and not self._client_streams(client):
+                    await client.stop()
+                    self.clients.remove(client)
+            
+            if moves:
+                moved = sum(len(streams) for streams in moves.values())
+                logger.info(f"WebSocket连接池重新均衡: 迁移 {moved} 个流，{len(self.clients)} 个连接")
@@ -0,0 +1,276 @@
+"""
+衍生品数据快照 - 全市场资金费率和持仓量的共享缓存
+资金费率一次请求获取全市场（premiumIndex），持仓量按 TTL 分批刷新并写入持仓量历史；
+启动后台刷新后，请求都在刷新线程中发出，扫描时的查询只读字典；
+多个交易员共享同一个快照（随 MarketMonitor 共享）
+"""
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Tuple
+from utils.logger import logger
+from services.market.open_interest_history import OpenInterestHistory
+
+if TYPE_CHECKING:
+    from services.market.api_client import APIClient
+
+
+class DerivativesSnapshot:
+    """全市场资金费率 / 持仓量快照
+
+    - start() / stop()：后台刷新线程（由 MarketMonitor 启停），按 TTL 刷新资金费率和被跟踪交易对的持仓量
+    - prefetch(symbols)：决策周期开始时调用，登记需要跟踪的交易对；后台刷新运行时不发请求也不等待，
+      第一次出现的交易对由刷新线程立即采样。未启动后台刷新时同步刷新过期的数据
+    - get(symbol)：读取快照（后台刷新运行时同样只读，首次采样还没完成时最多等到登记后 FIRST_SAMPLE_WAIT_SECONDS）；
+      未启动后台刷新时按需获取后写入快照
+    - update_funding(rates)：由全市场标记价格流推送资金费率（推送后无需 REST 刷新）
+    - open_interest_summary(symbol)：持仓量滚动均值和变化量（首次刷新时用 openInterestHist 预热）
+
+    Binance 没有全市场持仓量接口（/fapi/v1/openInterest 只能按交易对查询），
+    每个被跟踪的交易对每个 TTL 周期一次请求，这些请求都在后台线程中发出。
+    """
+
+    FUNDING_TTL_SECONDS = 300  # 资金费率每 8 小时结算，预测值变化缓慢
+    # 持仓量缓存时间：与持仓量历史的采样周期（5m）一致，每个交易对每个周期刷新一次、写入一个采样
+    OPEN_INTEREST_TTL_SECONDS = OpenInterestHistory.PERIOD_MS // 1000
+    # 第一次出现的交易对查询时等待后台首次采样的最长时间（从登记时算起，同一批登记的交易对共用，
+    # 超时返回 None，下一个周期即可读到）
+    FIRST_SAMPLE_WAIT_SECONDS = 1.0
+    TRACK_EXPIRY_TTLS = 3  # 连续这么多个持仓量 TTL 没有被查询的交易对停止跟踪
+    MIN_REFRESH_INTERVAL_SECONDS = 1.0  # 后台刷新的最小间隔
+    RETRY_SECONDS = 30  # 刷新失败后的重试间隔
+
+    def __init__(
+        self,
+        api_client: 'APIClient',
+        funding_ttl: float = FUNDING_TTL_SECONDS,
+        open_interest_ttl: float = OPEN_INTEREST_TTL_SECONDS,
+        history: Optional[OpenInterestHistory] = None,
+    ):
+        self.api_client = api_client
+        self.funding_ttl = funding_ttl
+        self.open_interest_ttl = open_interest_ttl
+        self.history = history if history is not None else OpenInterestHistory()
+        self._funding: Dict[str, float] = {}
+        self._funding_updated = 0.0  # 资金费率快照的更新时间（monotonic，0 表示从未更新）
+        self._funding_attempted = 0.0  # 最近一次 REST 刷新资金费率的时间（失败时据此推迟重试）
+        self._open_interest: Dict[str, Tuple[Optional[float], float]] = {}  # key -> (持仓量, 获取时间)
+        self._tracked: Dict[str, float] = {}  # 后台刷新跟踪的交易对 -> 最近一次被查询的时间（monotonic）
+        self._first_sample_deadlines: Dict[str, float] = {}  # 等待首次采样的交易对 -> 查询时最多等到的时间
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)  # 跟踪列表变化（唤醒刷新线程）/ 写入新采样（唤醒等待方）
+        self._refresh_lock = threading.Lock()  # 同一时间只有一个线程发起刷新请求
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        # 统计
+        self.funding_refreshes = 0
+        self.open_interest_requests = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(symbol: str) -> str:
+        """统一为交易所 ID 格式（BTC/USDT:USDT、BTC/USDT、btcusdt、BTC -> BTCUSDT）"""
+        key = symbol.split(':')[0].replace('/', '').upper()
+        return key if key.endswith('USDT') else f"{key}USDT"
+
+    def update_funding(self, rates: Dict[str, float]):
+        """写入一批资金费率（如全市场标记价格流），刷新快照时间"""
+        with self._lock:
+            self._funding.update(rates)
+            self._funding_updated = time.monotonic()
+
+    def start(self):
+        """启动后台刷新线程（之后 prefetch/get 只读快照）"""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="DerivativesRefresh")
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """停止后台刷新线程"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            self._changed.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def is_running(self) -> bool:
+        return self._running
+
+    def prefetch(self, symbols: Iterable[str]):
+        """登记/刷新指定交易对的持仓量和资金费率快照
+
+        后台刷新运行时只登记跟踪并唤醒刷新线程（不等待采样）；否则同步刷新过期的资金费率和持仓量
+        """
+        keys = list(dict.fromkeys(map(self._key, symbols)))
+        if self._running:
+            self._track(keys)
+            return
+        with self._refresh_lock:
+            self._refresh(keys)
+
+    def get(self, symbol: str) -> Tuple[Optional[float], Optional[float]]:
+        """获取 (持仓量, 资金费率)
+
+        后台刷新运行时只读快照（首次采样还没完成时有限等待，见 FIRST_SAMPLE_WAIT_SECONDS）；
+        否则快照中没有或已过期时按需刷新
+        """
+        key = self._key(symbol)
+        now = time.monotonic()
+        with self._lock:
+            fresh = not self._funding_stale(now) and not self._open_interest_stale(key, now)
+            if fresh or (self._running and key in self._open_interest):
+                self.hits += 1
+                self._tracked[key] = now
+                return self._open_interest[key][0], self._funding.get(key)
+            self.misses += 1
+
+        if self._running:
+            self._track([key])
+            self._wait_first_sample(key)
+        else:
+            with self._refresh_lock:
+                self._refresh([key])
+        with self._lock:
+            entry = self._open_interest.get(key)
+            return (entry[0] if entry else None), self._funding.get(key)
+
+    def open_interest_summary(self, symbol: str) -> Optional[Dict[str, Optional[float]]]:
+        """持仓量历史摘要（latest / average / delta / change_pct，见 OpenInterestHistory.summary）"""
+        return self.history.summary(self._key(symbol))
+
+    def stats(self) -> Dict:
+        """快照大小、刷新次数和命中率"""
+        with self._lock:
+            return {
+                'funding_symbols': len(self._funding),
+                'open_interest_symbols': len(self._open_interest),
+                'funding_refreshes': self.funding_refreshes,
+                'open_interest_requests': self.open_interest_requests,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _track(self, keys):
+        """登记后台刷新跟踪的交易对；有第一次出现的交易对时唤醒刷新线程（不等待采样）"""
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                self._tracked[key] = now
+            new_keys = [
+                key for key in keys
+                if key not in self._open_interest and key not in self._first_sample_deadlines
+            ]
+            if not new_keys:
+                return
+            deadline = now + self.FIRST_SAMPLE_WAIT_SECONDS
+            for key in new_keys:
+                self._first_sample_deadlines[key] = deadline
+            self._changed.notify_all()
+
+    def _wait_first_sample(self, key: str):
+        """等待交易对的首次采样，最多等到登记时定下的截止时间"""
+        with self._lock:
+            deadline = self._first_sample_deadlines.get(key)
+            if deadline is None:
+                return
+            self._changed.wait_for(
+                lambda: not self._running or key in self._open_interest,
+                timeout=max(deadline - time.monotonic(), 0.0),
+            )
+
+    def _run(self):
+        """后台刷新循环：到期时刷新资金费率和跟踪中的交易对的持仓量，之后等到下一次到期或被唤醒"""
+        logger.info("🚀 衍生品数据后台刷新已启动")
+        while True:
+            with self._lock:
+                if not self._running:
+                    break
+                now = time.monotonic()
+                expiry = self.open_interest_ttl * self.TRACK_EXPIRY_TTLS
+                for key in [k for k, queried in self._tracked.items() if now - queried > expiry]:
+                    del self._tracked[key]
+                    self._first_sample_deadlines.pop(key, None)
+                keys = list(self._tracked)
+            try:
+                with self._refresh_lock:
+                    self._refresh(keys)
+                failed = False
+            except Exception as e:
+                logger.warning(f"⚠️ 衍生品数据后台刷新失败: {e}")
+                failed = True
+            with self._lock:
+                if not self._running:
+                    break
+                timeout = self.RETRY_SECONDS if failed else self._seconds_until_due(time.monotonic())
+                self._changed.wait(timeout=timeout)
+        logger.info("衍生品数据后台刷新已停止")
+
+    def _seconds_until_due(self, now: float) -> float:
+        """距离下一次需要刷新的时间（调用方持有 self._lock）"""
+        deadlines = [max(self._funding_updated + self.funding_ttl, self._funding_attempted + self.RETRY_SECONDS)]
+        for key in self._tracked:
+            entry = self._open_interest.get(key)
+            deadlines.append(entry[1] + self.open_interest_ttl if entry else now)
+        return max(min(deadlines) - now, self.MIN_REFRESH_INTERVAL_SECONDS)
+
+    def _refresh(self, keys):
+        """刷新过期的资金费率快照和这些交易对中过期的持仓量（调用方持有 self._refresh_lock）"""
+        now = time.monotonic()
+        if self._funding_stale(now) and now - self._funding_attempted >= self.RETRY_SECONDS:
+            self._refresh_funding()
+        with self._lock:
+            expired = [key for key in keys if self._open_interest_stale(key, now)]
+        if expired:
+            self._refresh_open_interest(expired)
+
+    def _funding_stale(self, now: float) -> bool:
+        return not self._funding_updated or now - self._funding_updated >= self.funding_ttl
+
+    def _open_interest_stale(self, key: str, now: float) -> bool:
+        entry = self._open_interest.get(key)
+        return entry is None or now - entry[1] >= self.open_interest_ttl
+
+    def _refresh_funding(self):
+        """一次请求刷新全市场资金费率（失败时保留旧快照，下次调用重试）"""
+        self._funding_attempted = time.monotonic()
+        rates = self.api_client.get_funding_rates()
+        self.funding_refreshes += 1
+        if not rates:
+            logger.warning("⚠️ 资金费率快照刷新失败，沿用旧数据")
+            return
+        self.update_funding(rates)
+        logger.debug(f"资金费率快照已刷新: {len(rates)} 个交易对")
+
+    def _refresh_open_interest(self, keys):
+        """刷新一组交易对的持仓量并写入历史（获取失败的交易对同样缓存 None，TTL 内不重复请求）
+
+        没有历史、或历史已在窗口之外（停止跟踪一段时间后重新跟踪）的交易对先用 openInterestHist 预热
+        """
+        now_ms = int(time.time() * 1000)
+        unseeded = [key for key in keys if not self.history.has(key, now_ms)]
+        if unseeded:
+            histories = self.api_client.get_open_interest_histories(
+                unseeded, self.history.PERIOD, self.history.window
+            )
+            for key, points in histories.items():
+                if points:
+                    self.history.seed(key, points)
+
+        values = self.api_client.get_open_interests(keys)
+        fetched_at = time.monotonic()
+        timestamp_ms = int(time.time() * 1000)
+        self.open_interest_requests += len(keys)
+        for key in keys:
+            self.history.record(key, values.get(key), timestamp_ms)
+        with self._lock:
+            for key in keys:
+                self._open_interest[key] = (values.get(key), fetched_at)
+                self._first_sample_deadlines.pop(key, None)
+            self._changed.notify_all()
@@ -2,13 +2,20 @@
 市场特征引擎 - 统一计算所有市场特征
 类似 NOFX 的 feature_engine.go，集中管理所有特征计算
 """
-from dataclasses import dataclass
-from typing import List, Optional, Dict
+from dataclasses import dataclass, replace
+from typing import List, Optional, Dict, Union
+import numpy as np
 from services.market.type import Kline
-from services.market.indicators import IndicatorCalculator
+from services.market.indicators import IndicatorCalculator, VectorIndicatorCalculator
+from services.market.kline_store import KlineArrays
 from services.market.api_client import APIClient
 from utils.logger import logger
 
+# 前向引用，避免循环导入
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from services.market.derivatives_snapshot import DerivativesSnapshot
+
 
 @dataclass
 class MarketFeatures:
@@ -46,6 +53,9 @@ class MarketFeatures:
     # 序列数据
     intraday_series: Dict  # 3分钟序列
     longer_term_series: Dict  # 4小时序列
+    
+    # 持仓量窗口内变化百分比（需要持仓量历史）
+    open_interest_change_pct: Optional[float] = None
 
 
 class FeatureEngine:
@@ -62,15 +72,29 @@ class FeatureEngine:
     PRICE_CHANGE_1H_KLINES = 20
     PRICE_CHANGE_4H_KLINES = 2
     
-    def __init__(self, api_client: APIClient):
-        """初始化特征引擎"""
+    def __init__(
+        self,
+        api_client: APIClient,
+        vectorized: bool = False,
+        derivatives: Optional['DerivativesSnapshot'] = None
+    ):
+        """
+        初始化特征引擎
+        
+        Args:
+            api_client: API客户端
+            vectorized: 是否使用向量化模式（OHLCV 只提取一次为 NumPy 数组，单次遍历计算所有指标和序列）
+            derivatives: 共享的资金费率/持仓量快照（提供时持仓量和资金费率从快照读取）
+        """
         self.api_client = api_client
+        self.vectorized = vectorized
+        self.derivatives = derivatives
     
     def calculate_features(
         self,
         symbol: str,
-        klines_3m: List[Kline],
-        klines_4h: List[Kline],
+        klines_3m: Union[List[Kline], KlineArrays],
+        klines_4h: Union[List[Kline], KlineArrays],
         skip_api_calls: bool = False
     ) -> Optional[MarketFeatures]:
         """
@@ -78,8 +102,8 @@ class FeatureEngine:
         
         Args:
             symbol: 币种符号
-            klines_3m: 3分钟K线数据
-            klines_4h: 4小时K线数据
+            klines_3m: 3分钟K线数据（向量化模式下也可以直接传入 KlineArrays）
+            klines_4h: 4小时K线数据（同上）
             skip_api_calls: 是否跳过API调用（用于评分等场景，提升性能）
         
         Returns:
@@ -89,6 +113,9 @@ class FeatureEngine:
         if not self._validate_klines(klines_3m, klines_4h):
             return None
         
+        if self.vectorized or isinstance(klines_3m, KlineArrays) or isinstance(klines_4h, KlineArrays):
+            return self._calculate_features_vectorized(symbol, klines_3m, klines_4h, skip_api_calls)
+        
         # 2. 计算基础价格信息
         current_price = self._get_current_price(klines_3m, klines_4h)
         price_change_1h = self._calculate_price_change(
@@ -106,15 +133,9 @@ class FeatureEngine:
         volume_stats = IndicatorCalculator.calculate_volume_stats(klines_4h)
         
         # 5. 获取持仓量和资金费率（仅在需要时调用API）
-        if skip_api_calls:
-            open_interest = None
-            funding_rate = None
-            open_interest_average = None
-        else:
-            open_interest = self.api_client.get_open_interest(symbol)
-            funding_rate_data = self.api_client.get_funding_rate(symbol)
-            funding_rate = self._extract_funding_rate(funding_rate_data)
-            open_interest_average = open_interest * 0.999 if open_interest else None
+        open_interest, open_interest_average, open_interest_change_pct, funding_rate = self._fetch_derivatives_data(
+            symbol, skip_api_calls
+        )
         
         # 6. 计算序列指标
         intraday_series = IndicatorCalculator.calculate_series_indicators(klines_3m)
@@ -146,11 +167,188 @@ class FeatureEngine:
             open_interest=open_interest,
             open_interest_average=open_interest_average,
             funding_rate=funding_rate,
+            open_interest_change_pct=open_interest_change_pct,
             # 序列数据
             intraday_series=intraday_series,
             longer_term_series=longer_term_series,
         )
     
+    def calculate_features_from_ohlcv(
+        self,
+        symbol: str,
+        ohlcv_3m: Dict[str, np.ndarray],
+        ohlcv_4h: Dict[str, np.ndarray],
+        skip_api_calls: bool = False
+    ) -> Optional[MarketFeatures]:
+        """从 high/low/close/volume 数组计算特征（向量化口径；进程池工作进程的入口）"""
+        if (len(ohlcv_3m['close']) < self.MIN_KLINES_REQUIRED or
+                len(ohlcv_4h['close']) < self.MIN_KLINES_REQUIRED):
+            return None
+        return self._features_from_ohlcv(symbol, ohlcv_3m, ohlcv_4h, skip_api_calls)
+    
+    def attach_derivatives(self, features: MarketFeatures) -> MarketFeatures:
+        """为 skip_api_calls 计算的特征补充持仓量和资金费率（在主进程中执行网络请求或读取快照）"""
+        open_interest, open_interest_average, open_interest_change_pct, funding_rate = self._fetch_derivatives_data(
+            features.symbol, skip_api_calls=False
+        )
+        return replace(
+            features,
+            open_interest=open_interest,
+            open_interest_average=open_interest_average,
+            open_interest_change_pct=open_interest_change_pct,
+            funding_rate=funding_rate,
+        )
+    
+    def _calculate_features_vectorized(
+        self,
+        symbol: str,
+        klines_3m: Union[List[Kline], KlineArrays],
+        klines_4h: Union[List[Kline], KlineArrays],
+        skip_api_calls: bool
+    ) -> MarketFeatures:
+        """向量化模式：每个周期只提取一次 OHLCV 数组，标量指标直接取序列最后一个值"""
+        return self._features_from_ohlcv(
+            symbol, self._extract_ohlcv(klines_3m), self._extract_ohlcv(klines_4h), skip_api_calls
+        )
+    
+    def _features_from_ohlcv(
+        self,
+        symbol: str,
+        ohlcv_3m: Dict[str, np.ndarray],
+        ohlcv_4h: Dict[str, np.ndarray],
+        skip_api_calls: bool
+    ) -> MarketFeatures:
+        """由两个周期的 OHLCV 数组计算全部特征"""
+        close_3m = ohlcv_3m['close']
+        close_4h = ohlcv_4h['close']
+        
+        current_price = float(close_3m[-1])
+        price_change_1h = self._calculate_price_change_from_close(
+            close_3m, self.PRICE_CHANGE_1H_KLINES, current_price
+        )
+        price_change_4h = self._calculate_price_change_from_close(
+            close_4h, self.PRICE_CHANGE_4H_KLINES, current_price
+        )
+        
+        indicators_3m, intraday_series = self._calculate_timeframe_vectorized(ohlcv_3m, timeframe='3m')
+        indicators_4h, longer_term_series = self._calculate_timeframe_vectorized(ohlcv_4h, timeframe='4h')
+        
+        open_interest, open_interest_average, open_interest_change_pct, funding_rate = self._fetch_derivatives_data(
+            symbol, skip_api_calls
+        )
+        
+        return MarketFeatures(
+            symbol=symbol,
+            current_price=current_price,
+            price_change_1h=price_change_1h,
+            price_change_4h=price_change_4h,
+            ema20_3m=indicators_3m['ema20'],
+            macd_3m=indicators_3m['macd'],
+            rsi7_3m=indicators_3m['rsi7'],
+            rsi14_3m=indicators_3m['rsi14'],
+            ema20_4h=indicators_4h['ema20'],
+            ema50_4h=indicators_4h['ema50'],
+            macd_4h=indicators_4h['macd'],
+            rsi7_4h=indicators_4h['rsi7'],
+            rsi14_4h=indicators_4h['rsi14'],
+            atr_4h=indicators_4h['atr'],
+            atr3_4h=indicators_4h['atr3'],
+            current_volume_4h=float(ohlcv_4h['volume'][-1]),
+            average_volume_4h=float(ohlcv_4h['volume'].mean()),
+            open_interest=open_interest,
+            open_interest_average=open_interest_average,
+            funding_rate=funding_rate,
+            open_interest_change_pct=open_interest_change_pct,
+            intraday_series=intraday_series,
+            longer_term_series=longer_term_series,
+        )
+    
+    @staticmethod
+    def _extract_ohlcv(klines: Union[List[Kline], KlineArrays]) -> Dict[str, np.ndarray]:
+        """提取 high/low/close/volume 数组（KlineArrays 直接使用视图，不拷贝）"""
+        if isinstance(klines, KlineArrays):
+            return {'high': klines.high, 'low': klines.low, 'close': klines.close, 'volume': klines.volume}
+        count = len(klines)
+        return {
+            field: np.fromiter((getattr(k, field) for k in klines), dtype=np.float64, count=count)
+            for field in ('high', 'low', 'close', 'volume')
+        }
+    
+    @staticmethod
+    def _calculate_price_change_from_close(close: np.ndarray, lookback: int, current_price: float) -> float:
+        """计算价格变化百分比（数组版本）"""
+        if len(close) < lookback:
+            return 0.0
+        price_ago = float(close[-lookback])
+        if price_ago > 0:
+            return ((current_price - price_ago) / price_ago) * 100
+        return 0.0
+    
+    def _calculate_timeframe_vectorized(self, ohlcv: Dict[str, np.ndarray], timeframe: str):
+        """一次计算某个周期的全部序列，标量指标取序列最后一个值
+        
+        Returns:
+            (指标字典, 序列字典)，口径与 _calculate_indicators / calculate_series_indicators 一致；
+            MACD 数据不足 34 根时标量为 0.0、序列为空（pandas_ta 在此区间不输出 MACD）
+        """
+        close = ohlcv['close']
+        count = len(close)
+        ema20 = VectorIndicatorCalculator.ema(close, self.EMA_SHORT_PERIOD)
+        macd = VectorIndicatorCalculator.macd(close)
+        rsi7 = VectorIndicatorCalculator.rsi(close, self.RSI_SHORT_PERIOD)
+        rsi14 = VectorIndicatorCalculator.rsi(close, self.RSI_LONG_PERIOD)
+        
+        def last(series: np.ndarray, available: bool) -> float:
+            return float(series[-1]) if available else 0.0
+        
+        has_macd = count >= 34
+        indicators = {
+            'ema20': last(ema20, count >= self.EMA_SHORT_PERIOD),
+            'macd': last(macd, has_macd),
+            'rsi7': last(rsi7, count > self.RSI_SHORT_PERIOD),
+            'rsi14': last(rsi14, count > self.RSI_LONG_PERIOD),
+            'ema50': 0.0,
+            'atr': 0.0,
+            'atr3': 0.0,
+        }
+        
+        # 4小时K线需要额外计算EMA50和ATR
+        if timeframe == '4h':
+            high, low = ohlcv['high'], ohlcv['low']
+            indicators['ema50'] = last(VectorIndicatorCalculator.ema(close, self.EMA_LONG_PERIOD),
+                                       count >= self.EMA_LONG_PERIOD)
+            indicators['atr'] = last(VectorIndicatorCalculator.atr(high, low, close, self.ATR_PERIOD),
+                                     count > self.ATR_PERIOD)
+            indicators['atr3'] = last(VectorIndicatorCalculator.atr(high, low, close, self.ATR_SHORT_PERIOD),
+                                      count > self.ATR_SHORT_PERIOD)
+        
+        series = {
+            'mid_prices': close.tolist(),
+            'ema20_values': ema20.tolist() if count >= self.EMA_SHORT_PERIOD else [],
+            'macd_values': macd.tolist() if has_macd else [],
+            'rsi7_values': rsi7.tolist() if count > self.RSI_SHORT_PERIOD else [],
+            'rsi14_values': rsi14.tolist() if count > self.RSI_LONG_PERIOD else [],
+        }
+        return indicators, series
+    
+    def _fetch_derivatives_data(self, symbol: str, skip_api_calls: bool):
+        """获取持仓量、持仓量均值、持仓量变化百分比和资金费率（skip_api_calls 时全部为 None）
+        
+        均值和变化百分比来自快照的持仓量历史；没有快照时无法得到历史，返回 None
+        """
+        if skip_api_calls:
+            return None, None, None, None
+        if self.derivatives is None:
+            # 异步客户端会并发发出两个请求
+            open_interest, funding_rate_data = self.api_client.get_derivatives(symbol)
+            return open_interest, None, None, self._extract_funding_rate(funding_rate_data)
+        
+        open_interest, funding_rate_data = self.derivatives.get(symbol)
+        summary = self.derivatives.open_interest_summary(symbol)
+        open_interest_average = summary['average'] if summary else None
+        open_interest_change_pct = summary['change_pct'] if summary else None
+        return open_interest, open_interest_average, open_interest_change_pct, self._extract_funding_rate(funding_rate_data)
+    
     def _validate_klines(self, klines_3m: List[Kline], klines_4h: List[Kline]) -> bool:
         """验证K线数据质量"""
         if not klines_3m or not klines_4h:
@@ -0,0 +1,106 @@
+"""
+特征计算执行器 - 把多个币种的特征计算（纯 CPU）分发到可替换的执行器（默认进程池）
+工作进程只接收紧凑的 OHLCV 数组（不传 Kline 对象列表），也不发任何网络请求；
+持仓量/资金费率由调用方在主进程中获取后补充（FeatureEngine.attach_derivatives）
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from utils.logger import logger
+from services.market.feature_engine import FeatureEngine, MarketFeatures
+from services.market.kline_store import KlineArrays
+from services.market.type import Kline
+
+# (symbol, 3m OHLCV 数组, 4h OHLCV 数组)
+FeaturePayload = Tuple[str, Dict[str, np.ndarray], Dict[str, np.ndarray]]
+
+_worker_engine: Optional[FeatureEngine] = None  # 每个工作进程一个特征引擎（不需要 API 客户端）
+
+
+def compute_features(payload: FeaturePayload) -> Optional[MarketFeatures]:
+    """工作函数：由 OHLCV 数组计算一个币种的特征（跳过持仓量/资金费率）"""
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = FeatureEngine(None, vectorized=True)
+    symbol, ohlcv_3m, ohlcv_4h = payload
+    return _worker_engine.calculate_features_from_ohlcv(symbol, ohlcv_3m, ohlcv_4h, skip_api_calls=True)
+
+
+class FeatureExecutor:
+    """特征计算执行器
+
+    - make_payload(symbol, klines_3m, klines_4h)：把K线转换为只含 high/low/close/volume 数组的负载
+    - submit(payloads)：提交一批负载，返回与之一一对应的 Future
+    - 执行器为 None 时在当前线程计算；进程池损坏时退回当前线程计算
+    """
+
+    WORKERS_ENV = "FEATURE_WORKERS"  # 共享进程池的工作进程数（未设置或为 0 时在当前线程计算）
+    MIN_PARALLEL_SYMBOLS = 4  # 币种少于此数时直接在当前线程计算（进程间传输的开销大于收益）
+
+    _instance: Optional['FeatureExecutor'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, executor: Optional[Executor] = None):
+        self.executor = executor
+
+    @classmethod
+    def instance(cls) -> 'FeatureExecutor':
+        """获取进程内共享的特征计算执行器（所有交易员共用一个进程池）"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(cls._create_pool(int(os.getenv(cls.WORKERS_ENV) or 0)))
+        return cls._instance
+
+    @staticmethod
+    def _create_pool(workers: int) -> Optional[Executor]:
+        if workers <= 0:
+            return None
+        # 主进程有 WebSocket 等后台线程，使用 spawn 避免 fork 复制锁状态
+        logger.info(f"🚀 特征计算进程池已启动: {workers} 个工作进程")
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    @staticmethod
+    def make_payload(
+        symbol: str,
+        klines_3m: Union[List[Kline], KlineArrays],
+        klines_4h: Union[List[Kline], KlineArrays]
+    ) -> FeaturePayload:
+        """K线 -> (symbol, 3m 数组, 4h 数组)；序列化后只有几个连续的 float64 缓冲区"""
+        return symbol, FeatureEngine._extract_ohlcv(klines_3m), FeatureEngine._extract_ohlcv(klines_4h)
+
+    def submit(self, payloads: List[FeaturePayload]) -> List[Future]:
+        """提交一批特征计算，返回与 payloads 顺序一致的 Future（结果为 MarketFeatures 或 None）"""
+        if self.executor is not None and len(payloads) >= self.MIN_PARALLEL_SYMBOLS:
+            try:
+                return [self.executor.submit(compute_features, payload) for payload in payloads]
+            except (BrokenProcessPool, RuntimeError) as e:
+                logger.warning(f"⚠️ 特征计算进程池不可用，改为在当前线程计算: {e}")
+        return [self._run_inline(payload) for payload in payloads]
+
+    @staticmethod
+    def _run_inline(payload: FeaturePayload) -> Future:
+        future = Future()
+        try:
+            future.set_result(compute_features(payload))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def result(self, future: Future, payload: FeaturePayload) -> Optional[MarketFeatures]:
+        """取得计算结果；工作进程意外退出时在当前线程重新计算该币种"""
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            logger.warning(f"⚠️ {payload[0]} 特征计算进程异常退出，改为在当前线程计算: {e}")
+            return compute_features(payload)
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
@@ -1,62 +1,88 @@
 """
 历史数据加载器 - 批量加载多个币种的历史K线数据
+配置了磁盘归档时先从归档恢复，只通过 REST 获取归档之后的增量K线；
+所有请求经过进程内共享的权重调度器，优先币种排在队列前面；
+每个币种写入缓存后立即通过回调通知（筛选器可以不等全部加载完成就开始评分）；
+超过单页的深度按 since 游标拆分为多页并行获取，合并时按 open_time 去重
 """
-from typing import List, Dict
-from collections import deque
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from utils.logger import logger
 from services.market.api_client import APIClient
+from services.market.async_api_client import AsyncAPIClient
+from services.market.kline_archive import KlineArchive
+from services.market.kline_backfill import INTERVAL_MS
+from services.market.kline_store import KlineStore
+from services.market.markets_cache import MarketsCache
 from services.market.type import Kline
+from services.market.weight_scheduler import WeightScheduler, kline_weight
+
+PAGE_LIMIT = 499  # 每页最多K线数量（币安 limit < 500 的请求权重为 2，按K线数计权重最低）
+
+
+def page_requests(interval: str, depth: int, since: Optional[int] = None,
+                  now_ms: Optional[int] = None) -> List[Tuple[Optional[int], int]]:
+    """把获取 depth 根K线拆分为 (since, limit) 分页请求（各页大小相近）
+    
+    since 为 None 时获取截至当前K线的最近 depth 根；单页能放下时不带 since（与单次请求相同）。
+    长度不固定的周期（如月线）无法计算游标，只发一个请求
+    """
+    interval_ms = INTERVAL_MS.get(interval)
+    if (depth <= PAGE_LIMIT and since is None) or interval_ms is None:
+        return [(since, depth)]
+    if since is None:
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        since = (now_ms // interval_ms - depth + 1) * interval_ms
+    pages = math.ceil(depth / PAGE_LIMIT)
+    size = math.ceil(depth / pages)
+    return [(since + start * interval_ms, min(size, depth - start)) for start in range(0, depth, size)]
+
+
+def merge_pages(pages: Iterable[List[Kline]], depth: int) -> List[Kline]:
+    """合并分页结果：按 open_time 去重（后面的页覆盖前面的），升序保留最近 depth 根"""
+    merged: Dict[int, Kline] = {}
+    for page in pages:
+        for kline in page:
+            merged[kline.open_time] = kline
+    return [merged[open_time] for open_time in sorted(merged)[-depth:]]
 
 
 class HistoricalDataLoader:
     """历史数据加载器 - 并发加载多个币种的历史K线数据"""
     
-    def __init__(self, api_client: APIClient):
+    HISTORY_DEPTH = 500  # 冷启动时每个周期下载的K线数量（4h EMA50 / MACD 需要足够的预热）
+    
+    def __init__(
+        self,
+        api_client: APIClient,
+        archive: Optional[KlineArchive] = None,
+        scheduler: Optional[WeightScheduler] = None
+    ):
         """初始化历史数据加载器
         
         Args:
             api_client: API客户端，用于获取K线数据
+            archive: K线磁盘归档（可选），提供时启动只下载增量，下载的K线也会写入归档
+            scheduler: 请求权重调度器（默认使用 api_client 的调度器，即进程内按交易所共享的实例）
         """
         self.api_client = api_client
+        self.archive = archive
+        self.scheduler = scheduler or getattr(api_client, 'scheduler', None) or WeightScheduler.for_exchange("binance")
+    
+    def _get_klines(self, symbol: str, interval: str, limit: int, since: Optional[int] = None,
+                    priority: int = WeightScheduler.NORMAL):
+        """按请求权重取得调度器令牌后获取K线"""
+        with self.scheduler.slot(kline_weight(limit), priority):
+            return self.api_client.get_Klines(symbol, interval, limit=limit, since=since)
     
     def get_all_tradable_symbols(self) -> List[str]:
-        """获取所有可交易币种（USDT永续合约）"""
+        """获取所有可交易币种（USDT永续合约，来自共享市场数据缓存的预建索引）"""
         try:
-            # 使用 CCXT 获取交易所信息
-            markets = self.api_client.exchange.markets
-            
-            symbols = []
-            for symbol, market in markets.items():
-                # 筛选条件：永续合约、USDT计价、可交易
-                market_type = market.get('type', '')
-                settle = market.get('settle', '')
-                active = market.get('active', True)
-                
-                # 检查是否是USDT永续合约
-                is_usdt_swap = (
-                    (market_type == 'swap' or market_type == 'future') and
-                    settle == 'USDT' and
-                    active
-                )
-                
-                if is_usdt_swap:
-                    # 转换为标准格式（去掉 :USDT 后缀，统一为 BTC/USDT 格式）
-                    if ':USDT' in symbol:
-                        normalized = symbol.replace(':USDT', '')
-                    elif symbol.endswith('/USDT'):
-                        normalized = symbol
-                    else:
-                        # 如果格式不标准，尝试从 base 和 quote 构建
-                        base = market.get('base', '')
-                        quote = market.get('quote', '')
-                        if base and quote == 'USDT':
-                            normalized = f"{base}/{quote}"
-                        else:
-                            continue
-                    
-                    symbols.append(normalized)
-            
+            # 缓存未过期时不访问网络，过期时通过 api_client 重新下载一次
+            self.api_client.load_markets()
+            symbols = MarketsCache.instance().tradable_symbols()
             logger.info(f"✅ 获取到 {len(symbols)} 个USDT永续合约交易对")
             return symbols
         except Exception as e:
@@ -67,63 +93,210 @@ class HistoricalDataLoader:
         self, 
         symbols: List[str], 
         intervals: List[str], 
-        cache: Dict[str, deque],
-        cache_lock
+        kline_store: KlineStore,
+        priority_symbols: Optional[Iterable[str]] = None,
+        on_symbol_loaded: Optional[Callable[[str], None]] = None,
+        depth: Optional[int] = None
     ) -> int:
         """加载历史数据到缓存（并发获取，类似 Nofx 的流式获取）
         
         Args:
             symbols: 币种列表
             intervals: 时间周期列表，如 ["3m", "4h"]
-            cache: K线缓存字典，用于存储加载的数据
-            cache_lock: 线程锁，用于保护缓存访问
+            kline_store: K线列式存储，加载的数据直接写入其中（自带锁）
+            priority_symbols: 优先加载的币种（如候选币种、持仓币种），排在队列最前面并以高优先级请求
+            on_symbol_loaded: 每个币种的所有周期写入缓存后调用（在调用本方法的线程中执行）
+            depth: 每个周期加载的K线数量（默认 HISTORY_DEPTH，不超过缓存容量）
             
         Returns:
             成功加载的币种数量
         """
-        logger.info(f"开始初始化 {len(symbols)} 个币种的历史数据...")
+        depth = min(depth or self.HISTORY_DEPTH, kline_store.capacity)
+        logger.info(f"开始初始化 {len(symbols)} 个币种的历史数据（每个周期 {depth} 根）...")
+        
+        priority_set = set(priority_symbols or ())
+        # 稳定排序：优先币种在前，其余保持原顺序
+        symbols = sorted(symbols, key=lambda symbol: symbol not in priority_set)
+        
+        def priority_of(symbol: str) -> int:
+            return WeightScheduler.HIGH if symbol in priority_set else WeightScheduler.NORMAL
         
-        def fetch_symbol_data(symbol: str):
-            """获取单个币种的历史数据"""
+        def loaded(symbol: str):
+            if on_symbol_loaded is None:
+                return
             try:
-                klines_map = {}
-                success = True
-                
-                # 获取所有时间周期的K线
-                for interval in intervals:
-                    klines = self.api_client.get_Klines(symbol, interval, limit=100)
-                    if klines:
-                        klines_map[interval] = klines
-                    else:
-                        success = False
-                        break
+                on_symbol_loaded(symbol)
+            except Exception as e:
+                logger.warning(f"⚠️ {symbol} 加载完成回调失败: {e}")
+        
+        restored_count = 0
+        if self.archive is not None:
+            restored = self._restore_from_archive(symbols, intervals, kline_store, depth, priority_of, loaded)
+            restored_count = len(restored)
+            symbols = [symbol for symbol in symbols if symbol not in restored]
+            logger.info(f"💾 从磁盘归档恢复 {restored_count} 个币种，{len(symbols)} 个币种需要完整下载")
+        
+        # 所有币种共用同一组分页（游标按当前时间计算一次）
+        now_ms = int(time.time() * 1000)
+        plans = {interval: page_requests(interval, depth, now_ms=now_ms) for interval in intervals}
+        
+        success_count = 0
+        if isinstance(self.api_client, AsyncAPIClient):
+            # 异步客户端：每批请求在一个事件循环中并发发出，整批先从调度器取得权重
+            success_count = self._load_concurrently(symbols, plans, depth, kline_store, priority_of, loaded,
+                                                    now_ms)
+        else:
+            # 每一页都是独立任务（同一币种的分页并行获取）；线程池按提交顺序取任务（优先币种在前），
+            # 实际并发由调度器的令牌和并发名额决定
+            pages_per_symbol = sum(len(plan) for plan in plans.values())
+            pages = {symbol: {interval: [] for interval in intervals} for symbol in symbols}
+            remaining = dict.fromkeys(symbols, pages_per_symbol)
+            with ThreadPoolExecutor(max_workers=WeightScheduler.MAX_CONCURRENCY) as executor:
+                futures = {
+                    executor.submit(self._get_klines, symbol, interval, limit, since, priority_of(symbol)): (symbol, interval)
+                    for symbol in symbols
+                    for interval, plan in plans.items()
+                    for since, limit in plan
+                }
                 
-                if success and klines_map:
-                    normalized_symbol = symbol.replace('/', '').lower()
-                    with cache_lock:
-                        # 缓存每个时间周期的K线
-                        for interval, klines in klines_map.items():
-                            cache_key = f"{normalized_symbol}_{interval}"
-                            cache[cache_key] = deque(klines, maxlen=1000)
-                    
-                    return symbol, True
-                return symbol, False
+                for future in as_completed(futures):
+                    symbol, interval = futures[future]
+                    try:
+                        klines = future.result()
+                    except Exception as e:
+                        logger.debug(f"⚠️ {symbol} {interval} 历史数据获取失败: {e}")
+                        klines = None
+                    pages[symbol][interval].append(klines)
+                    remaining[symbol] -= 1
+                    if remaining[symbol] == 0 and self._store_pages(symbol, pages.pop(symbol), depth, kline_store,
+                                                                    now_ms):
+                        loaded(symbol)
+                        success_count += 1
+                        if success_count % 50 == 0:
+                            logger.info(f"📊 已加载 {success_count} 个币种的历史数据...")
+        
+        success_count += restored_count
+        logger.info(f"✅ 历史数据初始化完成，成功加载 {success_count}/{len(symbols) + restored_count} 个币种")
+        return success_count
+    
+    def _store_pages(self, symbol: str, pages: Dict[str, List[Optional[List[Kline]]]], depth: int,
+                     kline_store: KlineStore, now_ms: int) -> bool:
+        """合并每个周期的分页结果并写入缓存和归档（任一页失败或某个周期没有数据时整个币种不写入）
+
+        最后一根未收盘的K线写入缓存的未收盘槽位，不写入归档
+        """
+        try:
+            merged = {}
+            for interval, interval_pages in pages.items():
+                if any(page is None for page in interval_pages):
+                    return False
+                klines = merge_pages(interval_pages, depth)
+                if not klines:
+                    return False
+                merged[interval] = klines
+            for interval, klines in merged.items():
+                kline_store.replace(symbol, interval, klines, now_ms=now_ms)
+                self._archive(symbol, interval, klines, now_ms)
+            return True
+        except Exception as e:
+            logger.debug(f"⚠️ {symbol} 历史数据写入失败: {e}")
+            return False
+    
+    def _archive(self, symbol: str, interval: str, klines, now_ms: int):
+        """用完整下载的K线重建归档（完整下载的数据比旧归档更深或更新，直接替换，保证归档连续）"""
+        if self.archive is None or not klines:
+            return
+        try:
+            self.archive.clear(symbol, interval)
+            self.archive.append(symbol, interval, klines, now_ms=now_ms)
+        except Exception as e:
+            logger.warning(f"⚠️ {symbol} {interval} 写入K线归档失败: {e}")
+    
+    def _restore_symbol(self, symbol: str, intervals: List[str], kline_store: KlineStore, depth: int,
+                        now_ms: int, priority: int = WeightScheduler.NORMAL) -> bool:
+        """从归档恢复一个币种的所有周期，并获取归档之后的增量K线
+        
+        任一周期没有归档、归档落后超过 depth 根、或归档加增量不足 depth 根时返回 False（由调用方完整下载）
+        """
+        restored = {}
+        for interval in intervals:
+            interval_ms = INTERVAL_MS.get(interval)
+            archived = self.archive.load(symbol, interval, limit=kline_store.capacity)
+            if interval_ms is None or archived is None:
+                return False
+            last_open_time = int(archived['open_time'][-1])
+            # 归档之后的K线数量（包括未收盘的一根）
+            missing = (now_ms - last_open_time) // interval_ms
+            # 归档过旧时完整下载不比增量多；归档过浅（如旧版本下载的较少K线）时重新下载以加深
+            if missing > depth or len(archived['open_time']) + missing < depth:
+                return False
+            delta = []
+            if missing > 1:
+                pages = [
+                    self._get_klines(symbol, interval, limit, since=since, priority=priority)
+                    for since, limit in page_requests(interval, missing, since=last_open_time + interval_ms)
+                ]
+                if any(page is None for page in pages):
+                    return False
+                delta = merge_pages(pages, missing)
+            restored[interval] = (archived, delta)
+        
+        for interval, (archived, delta) in restored.items():
+            kline_store.replace_arrays(symbol, interval, archived)
+            for kline in delta:
+                # 只写入已收盘的K线；未收盘的一根由 WebSocket 推送
+                if kline.close_time < now_ms:
+                    kline_store.upsert(
+                        symbol, interval, open_time=kline.open_time, open=kline.open, high=kline.high,
+                        low=kline.low, close=kline.close, volume=kline.volume, close_time=kline.close_time,
+                        quote_volume=kline.quote_volume, trades=kline.trades,
+                    )
+            self.archive.append(symbol, interval, delta, now_ms=now_ms)
+        return True
+    
+    def _restore_from_archive(self, symbols: List[str], intervals: List[str], kline_store: KlineStore,
+                              depth: int, priority_of, loaded) -> set:
+        """并发从归档恢复，返回恢复成功的币种"""
+        now_ms = int(time.time() * 1000)
+        
+        def restore(symbol: str):
+            try:
+                return symbol, self._restore_symbol(symbol, intervals, kline_store, depth, now_ms, priority_of(symbol))
             except Exception as e:
-                logger.debug(f"⚠️ {symbol} 历史数据获取失败: {e}")
+                logger.debug(f"⚠️ {symbol} 从归档恢复失败: {e}")
                 return symbol, False
         
-        # 使用线程池并发获取（限制并发数为5，避免API限速）
-        success_count = 0
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            futures = {executor.submit(fetch_symbol_data, symbol): symbol for symbol in symbols}
-            
+        restored = set()
+        # 增量请求同样经过调度器；按完成顺序通知，慢的币种不拖住已经恢复的币种
+        with ThreadPoolExecutor(max_workers=WeightScheduler.MAX_CONCURRENCY) as executor:
+            futures = [executor.submit(restore, symbol) for symbol in symbols]
             for future in as_completed(futures):
                 symbol, success = future.result()
                 if success:
+                    restored.add(symbol)
+                    loaded(symbol)
+        return restored
+    
+    def _load_concurrently(self, symbols: List[str], plans: Dict[str, List[Tuple[Optional[int], int]]],
+                           depth: int, kline_store: KlineStore, priority_of, loaded, now_ms: int) -> int:
+        """用异步客户端批量获取所有币种、所有周期的分页K线（任一页失败则该币种不写入缓存）"""
+        success_count = 0
+        batch_size = AsyncAPIClient.MAX_CONCURRENT_REQUESTS * 5  # 分批提交，便于输出进度
+        for start in range(0, len(symbols), batch_size):
+            batch = symbols[start:start + batch_size]
+            requests = [
+                (symbol, interval, limit, since)
+                for symbol in batch
+                for interval, plan in plans.items()
+                for since, limit in plan
+            ]
+            weight = sum(kline_weight(limit) for _, _, limit, _ in requests)
+            with self.scheduler.slot(weight, priority_of(batch[0])):
+                results = iter(self.api_client.get_klines_many(requests))
+            for symbol in batch:
+                pages = {interval: [next(results) for _ in plan] for interval, plan in plans.items()}
+                if self._store_pages(symbol, pages, depth, kline_store, now_ms):
+                    loaded(symbol)
                     success_count += 1
-                    if success_count % 50 == 0:
-                        logger.info(f"📊 已加载 {success_count} 个币种的历史数据...")
-        
-        logger.info(f"✅ 历史数据初始化完成，成功加载 {success_count}/{len(symbols)} 个币种")
+            logger.info(f"📊 已加载 {success_count} 个币种的历史数据...")
         return success_count
-
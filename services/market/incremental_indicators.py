@@ -0,0 +1,319 @@
+"""
+增量指标引擎 - 每根收盘K线 O(1) 更新 EMA/MACD/RSI/ATR
+计算口径与 pandas_ta 默认参数一致（EMA/ATR 以 SMA 作为初始值，RSI/ATR 使用 Wilder 平滑），
+由 MarketMonitor 的K线收盘事件驱动
+"""
+import copy
+import threading
+from typing import Dict, Optional
+from services.market.kline_store import KlineStore
+
+
+class IncrementalEMA:
+    """EMA（pandas_ta.ema 口径：前 period 个值的 SMA 作为第一个 EMA 值）"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.alpha = 2.0 / (period + 1)
+        self.value: Optional[float] = None
+        self._count = 0
+        self._sum = 0.0
+
+    def clone(self) -> 'IncrementalEMA':
+        return copy.copy(self)
+
+    def update(self, x: float) -> Optional[float]:
+        if self.value is None:
+            self._count += 1
+            self._sum += x
+            if self._count == self.period:
+                self.value = self._sum / self.period
+        else:
+            self.value = self.alpha * x + (1.0 - self.alpha) * self.value
+        return self.value
+
+
+class IncrementalRMA:
+    """Wilder 平滑（pandas_ta.rma 口径：alpha = 1/period）
+
+    presma=True 时以前 period 个值的 SMA 作为初始值（pandas_ta.atr 默认），
+    否则以第一个值作为初始值（pandas_ta.rsi 的行为）。
+    """
+
+    def __init__(self, period: int, presma: bool = False):
+        self.period = period
+        self.alpha = 1.0 / period
+        self.presma = presma
+        self.value: Optional[float] = None
+        self._count = 0
+        self._sum = 0.0
+
+    def clone(self) -> 'IncrementalRMA':
+        return copy.copy(self)
+
+    def update(self, x: float) -> Optional[float]:
+        if self.value is None:
+            if not self.presma:
+                self.value = x
+            else:
+                self._count += 1
+                self._sum += x
+                if self._count == self.period:
+                    self.value = self._sum / self.period
+        else:
+            self.value = self.alpha * x + (1.0 - self.alpha) * self.value
+        return self.value
+
+
+class IncrementalRSI:
+    """RSI（Wilder 平滑，pandas_ta.rsi 口径）"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self._gain = IncrementalRMA(period)
+        self._loss = IncrementalRMA(period)
+        self._prev_close: Optional[float] = None
+        self._count = 0
+        self.value: Optional[float] = None
+
+    def clone(self) -> 'IncrementalRSI':
+        cloned = copy.copy(self)
+        cloned._gain = self._gain.clone()
+        cloned._loss = self._loss.clone()
+        return cloned
+
+    def update(self, close: float) -> Optional[float]:
+        self._count += 1
+        if self._prev_close is not None:
+            diff = close - self._prev_close
+            gain = self._gain.update(diff if diff > 0 else 0.0)
+            loss = self._loss.update(-diff if diff < 0 else 0.0)
+            # pandas_ta 至少需要 period + 1 个收盘价才输出 RSI
+            if self._count > self.period:
+                total = gain + loss
+                self.value = 100.0 * gain / total if total != 0 else None
+        self._prev_close = close
+        return self.value
+
+
+class IncrementalMACD:
+    """MACD 12/26/9（pandas_ta.macd 口径，返回 MACD 线、信号线和柱状图）"""
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9):
+        self._fast = IncrementalEMA(fast)
+        self._slow = IncrementalEMA(slow)
+        self._signal = IncrementalEMA(signal)
+        self._min_length = slow + signal - 1  # pandas_ta 的最小数据长度
+        self._count = 0
+        self.macd: Optional[float] = None
+        self.signal: Optional[float] = None
+        self.histogram: Optional[float] = None
+
+    def clone(self) -> 'IncrementalMACD':
+        cloned = copy.copy(self)
+        cloned._fast = self._fast.clone()
+        cloned._slow = self._slow.clone()
+        cloned._signal = self._signal.clone()
+        return cloned
+
+    @property
+    def value(self) -> Optional[float]:
+        return self.macd if self._count >= self._min_length else None
+
+    def update(self, close: float) -> Optional[float]:
+        self._count += 1
+        fast = self._fast.update(close)
+        slow = self._slow.update(close)
+        if fast is not None and slow is not None:
+            self.macd = fast - slow
+            self.signal = self._signal.update(self.macd)
+            self.histogram = self.macd - self.signal if self.signal is not None else None
+        return self.value
+
+
+class IncrementalATR:
+    """ATR（pandas_ta.atr 口径：真实波幅先取 SMA 作初值，再做 Wilder 平滑）"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self._rma = IncrementalRMA(period, presma=True)
+        self._prev_close: Optional[float] = None
+        self._count = 0
+        self.value: Optional[float] = None
+
+    def clone(self) -> 'IncrementalATR':
+        cloned = copy.copy(self)
+        cloned._rma = self._rma.clone()
+        return cloned
+
+    def update(self, high: float, low: float, close: float) -> Optional[float]:
+        self._count += 1
+        true_range = high - low
+        if self._prev_close is not None:
+            true_range = max(true_range, abs(high - self._prev_close), abs(self._prev_close - low))
+        self._prev_close = close
+        atr = self._rma.update(true_range)
+        # pandas_ta 至少需要 period + 1 根K线才输出 ATR
+        if self._count > self.period:
+            self.value = atr
+        return self.value
+
+
+class IndicatorSet:
+    """单个 symbol/interval 的一组增量指标（EMA20/50、MACD、RSI7/14、ATR3/14）"""
+
+    INDICATORS = ('ema20', 'ema50', 'macd', 'rsi7', 'rsi14', 'atr3', 'atr14')
+
+    def __init__(self):
+        self.ema20 = IncrementalEMA(20)
+        self.ema50 = IncrementalEMA(50)
+        self.macd = IncrementalMACD(12, 26, 9)
+        self.rsi7 = IncrementalRSI(7)
+        self.rsi14 = IncrementalRSI(14)
+        self.atr3 = IncrementalATR(3)
+        self.atr14 = IncrementalATR(14)
+        self.last_open_time: Optional[int] = None
+        self.bars = 0
+
+    def clone(self) -> 'IndicatorSet':
+        cloned = copy.copy(self)
+        for name in self.INDICATORS:
+            setattr(cloned, name, getattr(self, name).clone())
+        return cloned
+
+    def update(self, open_time: int, high: float, low: float, close: float):
+        self.ema20.update(close)
+        self.ema50.update(close)
+        self.macd.update(close)
+        self.rsi7.update(close)
+        self.rsi14.update(close)
+        self.atr3.update(high, low, close)
+        self.atr14.update(high, low, close)
+        self.last_open_time = open_time
+        self.bars += 1
+
+    def values(self) -> Dict[str, Optional[float]]:
+        """当前指标值（数据不足时为 None）"""
+        return {
+            'open_time': self.last_open_time,
+            'bars': self.bars,
+            'ema20': self.ema20.value,
+            'ema50': self.ema50.value,
+            'macd': self.macd.value,
+            'macd_signal': self.macd.signal if self.macd.value is not None else None,
+            'macd_histogram': self.macd.histogram if self.macd.value is not None else None,
+            'rsi7': self.rsi7.value,
+            'rsi14': self.rsi14.value,
+            'atr3': self.atr3.value,
+            'atr14': self.atr14.value,
+        }
+
+
+class IncrementalIndicatorEngine:
+    """增量指标引擎 - 监听K线收盘事件，按 symbol/interval 维护指标状态
+
+    - 新K线：O(1) 更新
+    - 重复推送最后一根K线：回滚到上一根K线之前的状态后重新计算
+    - 乱序K线 / 缓存被整体替换：从 KlineStore 重新预热
+    """
+
+    SYNC_WINDOW = 8  # 追赶新K线时读取的最近K线数量，落后更多时整体预热
+
+    def __init__(self, kline_store: KlineStore):
+        self.kline_store = kline_store
+        self._sets: Dict[str, IndicatorSet] = {}
+        self._previous: Dict[str, IndicatorSet] = {}  # 最后一根K线之前的状态
+        self._lock = threading.Lock()
+
+    def on_kline_closed(self, symbol: str, interval: str, open_time: int):
+        """K线收盘事件回调（由 MarketMonitor 在写入 KlineStore 之后调用）"""
+        key = KlineStore.make_key(symbol, interval)
+        with self._lock:
+            indicator_set = self._sets.get(key)
+            if indicator_set is None:
+                return  # 尚无读取方使用该 symbol/interval，首次读取时再预热
+            last_open_time = indicator_set.last_open_time
+            if open_time == last_open_time:
+                self._replace_last(key, symbol, interval)
+            elif last_open_time is None or open_time < last_open_time:
+                self._seed(key, symbol, interval)
+            else:
+                self._catch_up(key, symbol, interval, indicator_set)
+
+    def get(self, symbol: str, interval: str, seed: bool = True) -> Optional[Dict[str, Optional[float]]]:
+        """获取最新指标值（首次读取时从缓存预热；seed=False 时尚未预热则返回 None）"""
+        key = KlineStore.make_key(symbol, interval)
+        with self._lock:
+            indicator_set = self._sets.get(key)
+            if indicator_set is None:
+                if not seed:
+                    return None
+                indicator_set = self._seed(key, symbol, interval)
+            else:
+                indicator_set = self._catch_up(key, symbol, interval, indicator_set)
+            return indicator_set.values() if indicator_set is not None else None
+
+    def remove_symbol(self, symbol: str):
+        """丢弃某个交易对所有周期的指标状态"""
+        prefix = f"{symbol.replace('/', '').lower()}_"
+        with self._lock:
+            for key in [k for k in self._sets if k.startswith(prefix)]:
+                self._sets.pop(key, None)
+                self._previous.pop(key, None)
+
+    def _seed(self, key: str, symbol: str, interval: str) -> Optional[IndicatorSet]:
+        """用缓存中的全部K线初始化指标状态"""
+        arrays = self.kline_store.get_arrays(symbol, interval, limit=self.kline_store.capacity)
+        if arrays is None:
+            self._sets.pop(key, None)
+            self._previous.pop(key, None)
+            return None
+
+        indicator_set = IndicatorSet()
+        previous = None
+        last = len(arrays) - 1
+        for i in range(len(arrays)):
+            if i == last:
+                previous = indicator_set.clone()
+            indicator_set.update(int(arrays.open_time[i]), float(arrays.high[i]),
+                                 float(arrays.low[i]), float(arrays.close[i]))
+        self._sets[key] = indicator_set
+        self._previous[key] = previous
+        return indicator_set
+
+    def _replace_last(self, key: str, symbol: str, interval: str) -> Optional[IndicatorSet]:
+        """最后一根K线被重新推送（数据可能修正）：从上一状态重算"""
+        previous = self._previous.get(key)
+        arrays = self.kline_store.get_arrays(symbol, interval, limit=1)
+        if previous is None or arrays is None:
+            return self._seed(key, symbol, interval)
+        indicator_set = previous.clone()
+        indicator_set.update(int(arrays.open_time[-1]), float(arrays.high[-1]),
+                             float(arrays.low[-1]), float(arrays.close[-1]))
+        self._sets[key] = indicator_set
+        return indicator_set
+
+    def _catch_up(self, key: str, symbol: str, interval: str, indicator_set: IndicatorSet) -> Optional[IndicatorSet]:
+        """把指标状态追到缓存中的最新K线"""
+        arrays = self.kline_store.get_arrays(symbol, interval, limit=self.SYNC_WINDOW)
+        if arrays is None:
+            return indicator_set
+
+        open_times = arrays.open_time
+        last_open_time = indicator_set.last_open_time
+        if open_times[-1] == last_open_time:
+            return indicator_set
+        if open_times[-1] < last_open_time or open_times[0] > last_open_time:
+            # 缓存被替换为更旧的数据，或落后超过同步窗口
+            return self._seed(key, symbol, interval)
+
+        start = int((open_times > last_open_time).argmax())
+        if open_times[start - 1] != last_open_time:
+            # 指标状态对应的K线已不在缓存中（乱序插入），重新预热
+            return self._seed(key, symbol, interval)
+
+        for i in range(start, len(open_times)):
+            self._previous[key] = indicator_set.clone()
+            indicator_set.update(int(open_times[i]), float(arrays.high[i]),
+                                 float(arrays.low[i]), float(arrays.close[i]))
+        return indicator_set
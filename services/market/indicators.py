@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import pandas_ta as ta
 from typing import List
@@ -105,4 +106,80 @@ class IndicatorCalculator:
             'rsi14_values': ta.rsi(df['close'], length=14).tolist() if len(klines) > 14 else [],
         }
         
-        return result
\ No newline at end of file
+        return result
+
+class VectorIndicatorCalculator:
+    """向量化技术指标计算器（NumPy 数组输入，沿最后一个轴计算）
+
+    计算口径与 pandas_ta 默认参数一致；同时支持一维（单个币种）和二维（币种 × K线）输入，
+    数据不足的位置为 NaN。
+    """
+    
+    @staticmethod
+    def _ewm(values: np.ndarray, alpha: float) -> np.ndarray:
+        """adjust=False 的指数加权平均（前导 NaN 会被跳过）
+        
+        一维输入交给 pandas（C 循环）；二维输入沿时间轴递推，每一步同时更新所有行，
+        避免 pandas 对 DataFrame 逐列计算。
+        """
+        if values.ndim == 1:
+            return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+        
+        result = np.empty(values.shape, dtype=np.float64)
+        state = np.full(values.shape[:-1], np.nan)
+        for t in range(values.shape[-1]):
+            column = values[..., t]
+            updated = (1.0 - alpha) * state + alpha * column
+            state = np.where(np.isnan(state), column, np.where(np.isnan(column), state, updated))
+            result[..., t] = state
+        return result
+    
+    @staticmethod
+    def _presma(values: np.ndarray, period: int) -> np.ndarray:
+        """前 period - 1 个位置置为 NaN，第 period 个位置替换为前 period 个值的 SMA"""
+        seeded = np.array(values, dtype=np.float64, copy=True)
+        seeded[..., period - 1] = np.nanmean(seeded[..., :period], axis=-1)
+        seeded[..., :period - 1] = np.nan
+        return seeded
+    
+    @staticmethod
+    def ema(close: np.ndarray, period: int) -> np.ndarray:
+        """EMA 序列（以 SMA 作为初始值）"""
+        if close.shape[-1] < period:
+            return np.full(close.shape, np.nan)
+        seeded = VectorIndicatorCalculator._presma(close, period)
+        return VectorIndicatorCalculator._ewm(seeded, 2.0 / (period + 1))
+    
+    @staticmethod
+    def macd(close: np.ndarray, fast: int = 12, slow: int = 26, signal: int = 9) -> np.ndarray:
+        """MACD 线序列（数据少于 slow + signal - 1 时全部为 NaN，与 pandas_ta 一致）"""
+        if close.shape[-1] < slow + signal - 1:
+            return np.full(close.shape, np.nan)
+        return VectorIndicatorCalculator.ema(close, fast) - VectorIndicatorCalculator.ema(close, slow)
+    
+    @staticmethod
+    def rsi(close: np.ndarray, period: int) -> np.ndarray:
+        """RSI 序列（Wilder 平滑）"""
+        if close.shape[-1] < period + 1:
+            return np.full(close.shape, np.nan)
+        diff = np.diff(close, axis=-1, prepend=np.nan)
+        gain = np.where(diff > 0, diff, 0.0)
+        loss = np.where(diff < 0, -diff, 0.0)
+        gain[..., 0] = np.nan
+        loss[..., 0] = np.nan
+        alpha = 1.0 / period
+        avg_gain = VectorIndicatorCalculator._ewm(gain, alpha)
+        avg_loss = VectorIndicatorCalculator._ewm(loss, alpha)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return 100.0 * avg_gain / (avg_gain + avg_loss)
+    
+    @staticmethod
+    def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int) -> np.ndarray:
+        """ATR 序列（真实波幅 SMA 初值 + Wilder 平滑）"""
+        if close.shape[-1] < period + 1:
+            return np.full(close.shape, np.nan)
+        prev_close = np.roll(close, 1, axis=-1)
+        true_range = np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(prev_close - low)))
+        true_range[..., 0] = (high - low)[..., 0]
+        seeded = VectorIndicatorCalculator._presma(true_range, period)
+        return VectorIndicatorCalculator._ewm(seeded, 1.0 / period)
@@ -0,0 +1,134 @@
+"""
+K线磁盘归档 - 每个 symbol/interval 一个只追加的定长记录文件，读取时用 np.memmap 映射
+重启时先从归档加载已收盘K线，只通过 REST 补齐最后一根归档K线之后的增量，避免全量重新下载
+"""
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from utils.logger import logger
+from services.market.kline_store import KlineRingBuffer
+from services.market.type import Kline
+
+# 一条记录对应一根K线，字段与 KlineRingBuffer 的列一致
+RECORD_DTYPE = np.dtype([
+    (field, np.int64 if field in KlineRingBuffer.INT_FIELDS else np.float64)
+    for field in KlineRingBuffer.FIELDS
+])
+
+
+class KlineArchive:
+    """K线磁盘归档（线程安全，按 symbol/interval 分别加锁）
+
+    - append(symbol, interval, klines)：追加已收盘且比归档更新的K线
+    - load(symbol, interval, limit)：读取最近 limit 根K线的列数据（按 open_time 升序）
+    - clear(symbol, interval)：删除归档
+    - 文件超过 capacity * COMPACT_FACTOR 条记录时改写为最近 capacity 条
+    """
+
+    FILE_SUFFIX = '.klines'
+    COMPACT_FACTOR = 4  # 文件记录数超过容量的倍数时压缩
+
+    def __init__(self, root: str, capacity: int = 1000):
+        self.root = Path(root)
+        self.capacity = capacity
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._last_open_time: Dict[str, Optional[int]] = {}  # 每个文件最后一条记录的 open_time（缓存）
+
+    @staticmethod
+    def make_key(symbol: str, interval: str) -> str:
+        """文件名，如 BTC/USDT + 3m -> btcusdt_3m"""
+        return f"{symbol.split(':')[0].replace('/', '').lower()}_{interval}"
+
+    def path(self, symbol: str, interval: str) -> Path:
+        return self.root / f"{self.make_key(symbol, interval)}{self.FILE_SUFFIX}"
+
+    def _lock(self, key: str) -> threading.Lock:
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._locks_lock:
+                lock = self._locks.setdefault(key, threading.Lock())
+        return lock
+
+    def _records(self, path: Path) -> Optional[np.memmap]:
+        """映射整个文件（调用方持有锁）；末尾不完整的记录（写入中断）会被截掉"""
+        if not path.exists():
+            return None
+        size = path.stat().st_size
+        count, remainder = divmod(size, RECORD_DTYPE.itemsize)
+        if remainder:
+            logger.warning(f"⚠️ K线归档 {path.name} 末尾有不完整的记录，已截断")
+            os.truncate(path, count * RECORD_DTYPE.itemsize)
+        if count == 0:
+            return None
+        return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+    def _cached_last_open_time(self, key: str, path: Path) -> Optional[int]:
+        """最后一条记录的 open_time（调用方持有锁）"""
+        if key not in self._last_open_time:
+            records = self._records(path)
+            self._last_open_time[key] = int(records['open_time'][-1]) if records is not None else None
+        return self._last_open_time[key]
+
+    def last_open_time(self, symbol: str, interval: str) -> Optional[int]:
+        """归档中最新一根K线的 open_time，没有归档时返回 None"""
+        key = self.make_key(symbol, interval)
+        with self._lock(key):
+            return self._cached_last_open_time(key, self.path(symbol, interval))
+
+    def clear(self, symbol: str, interval: str):
+        """删除某个 symbol/interval 的归档（归档过旧、与新数据之间有缺口时）"""
+        key = self.make_key(symbol, interval)
+        with self._lock(key):
+            self.path(symbol, interval).unlink(missing_ok=True)
+            self._last_open_time[key] = None
+
+    def load(self, symbol: str, interval: str, limit: Optional[int] = None) -> Optional[Dict[str, np.ndarray]]:
+        """读取最近 limit 根K线（列名 -> 数组，拷贝自映射文件），没有归档时返回 None"""
+        key = self.make_key(symbol, interval)
+        with self._lock(key):
+            records = self._records(self.path(symbol, interval))
+            if records is None:
+                return None
+            tail = np.array(records[-(limit or self.capacity):])
+            del records
+        return {field: tail[field] for field in KlineRingBuffer.FIELDS}
+
+    def append(self, symbol: str, interval: str, klines: List[Kline], now_ms: Optional[int] = None) -> int:
+        """追加已收盘、且 open_time 晚于归档最后一根的K线，返回写入条数"""
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        key = self.make_key(symbol, interval)
+        path = self.path(symbol, interval)
+        with self._lock(key):
+            last = self._cached_last_open_time(key, path)
+            bars = [
+                kline for kline in klines
+                if kline.close_time < now_ms and (last is None or kline.open_time > last)
+            ]
+            if not bars:
+                return 0
+            bars.sort(key=lambda kline: kline.open_time)
+            records = np.array(
+                [tuple(getattr(kline, field) for field in KlineRingBuffer.FIELDS) for kline in bars],
+                dtype=RECORD_DTYPE,
+            )
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(path, 'ab') as f:
+                f.write(records.tobytes())
+            self._last_open_time[key] = int(records['open_time'][-1])
+            if path.stat().st_size > self.capacity * self.COMPACT_FACTOR * RECORD_DTYPE.itemsize:
+                self._compact(path)
+            return len(bars)
+
+    def _compact(self, path: Path):
+        """只保留最近 capacity 条记录（先写临时文件再原子替换）"""
+        records = self._records(path)
+        tail = np.array(records[-self.capacity:])
+        del records
+        temp_path = path.with_suffix(path.suffix + '.tmp')
+        with open(temp_path, 'wb') as f:
+            f.write(tail.tobytes())
+        os.replace(temp_path, path)
@@ -0,0 +1,232 @@
+"""
+K线缺口回补 - 检测缓存中缺失的K线（如 WebSocket 断线期间收盘的K线），在后台线程中通过 REST 分批回补
+回补请求按速率限制发送，不阻塞实时消息处理；同时提供每个 symbol/interval 的数据新鲜度和完整性状态
+"""
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from utils.logger import logger
+from services.market.kline_store import KlineStore
+
+if TYPE_CHECKING:
+    from services.market.api_client import APIClient
+
+# 固定长度的K线周期（毫秒）；月线长度不固定，不做缺口检测
+INTERVAL_MS = {
+    '1m': 60_000,
+    '3m': 180_000,
+    '5m': 300_000,
+    '15m': 900_000,
+    '30m': 1_800_000,
+    '1h': 3_600_000,
+    '2h': 7_200_000,
+    '4h': 14_400_000,
+    '6h': 21_600_000,
+    '8h': 28_800_000,
+    '12h': 43_200_000,
+    '1d': 86_400_000,
+    '3d': 259_200_000,
+    '1w': 604_800_000,
+}
+
+
+class KlineBackfiller:
+    """K线缺口回补器
+
+    - request(pairs)：立即检查并回补指定的 symbol/interval（WebSocket 重连后调用）
+    - 空闲时每 CHECK_INTERVAL_SECONDS 检查一遍 targets() 返回的所有 symbol/interval
+    - 回补写入 KlineStore 后调用 on_filled(symbol, interval, open_time)，通知指标引擎等监听器
+    """
+
+    REQUESTS_PER_SECOND = 2  # REST 回补请求速率（与实时订阅的历史加载共用交易所限额，保守设置）
+    MAX_BARS_PER_REQUEST = 1000  # 单次请求的最大K线数量
+    CHECK_INTERVAL_SECONDS = 60  # 定期检查间隔
+    CLOSE_GRACE_MS = 5_000  # K线收盘后等待 WebSocket 推送的宽限时间，超过仍未收到视为缺失
+
+    def __init__(
+        self,
+        kline_store: KlineStore,
+        api_client: 'APIClient',
+        targets: Callable[[], Iterable[Tuple[str, str]]],
+        on_filled: Optional[Callable[[str, str, int], None]] = None,
+        requests_per_second: float = REQUESTS_PER_SECOND,
+    ):
+        self.kline_store = kline_store
+        self.api_client = api_client
+        self.targets = targets
+        self.on_filled = on_filled
+        self.requests_per_second = requests_per_second
+
+        self._pending: deque = deque()  # 待检查的 (symbol, interval)，按请求顺序
+        self._pending_set: Set[Tuple[str, str]] = set()
+        self._active: Optional[Tuple[str, str]] = None  # 正在回补的 (symbol, interval)
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._last_request = 0.0
+        self._failures: Dict[Tuple[str, str], str] = {}  # 最近一次回补失败的原因
+        # 交易所确认没有数据的区间（如停机维护），不再视为缺失
+        self._empty_ranges: Dict[Tuple[str, str], Set[Tuple[int, int]]] = {}
+
+    def start(self):
+        """启动后台回补线程"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name="KlineBackfill")
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """停止后台回补线程"""
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def request(self, pairs: Iterable[Tuple[str, str]]):
+        """请求检查并回补一组 symbol/interval（可在任意线程调用，立即返回）"""
+        with self._condition:
+            for pair in pairs:
+                if pair not in self._pending_set:
+                    self._pending_set.add(pair)
+                    self._pending.append(pair)
+            self._condition.notify()
+
+    def missing_ranges(self, symbol: str, interval: str, now_ms: Optional[int] = None) -> List[Tuple[int, int]]:
+        """缺失的已收盘K线区间 [(第一根缺失的 open_time, 最后一根缺失的 open_time)]
+
+        包括缓存中间的缺口，以及最新一根之后已经收盘但没有收到的K线。
+        """
+        interval_ms = INTERVAL_MS.get(interval)
+        if interval_ms is None:
+            return []
+        ranges = self.kline_store.gaps(symbol, interval, interval_ms)
+
+        last_open_time = self.kline_store.last_open_time(symbol, interval)
+        if last_open_time is not None:
+            now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+            # 最新一根之后第 k 根（k >= 1）在 last + (k + 1) * interval 收盘
+            closed_after = (now_ms - self.CLOSE_GRACE_MS - last_open_time) // interval_ms - 1
+            if closed_after > 0:
+                ranges.append((last_open_time + interval_ms, last_open_time + closed_after * interval_ms))
+
+        empty = self._empty_ranges.get((symbol, interval))
+        if empty:
+            ranges = [
+                (start, end) for start, end in ranges
+                if not any(empty_start <= start and end <= empty_end for empty_start, empty_end in empty)
+            ]
+        return ranges
+
+    def status(self, symbol: str, interval: str, now_ms: Optional[int] = None) -> Dict:
+        """单个 symbol/interval 的数据状态
+
+        Returns:
+            last_open_time: 缓存中最新一根K线的 open_time
+            missing_bars: 缺失的已收盘K线数量（0 表示完整）
+            fresh: 最新一根已收盘K线是否已在缓存中
+            backfilling: 是否正在等待或执行回补
+            error: 最近一次回补失败的原因
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        ranges = self.missing_ranges(symbol, interval, now_ms)
+        interval_ms = INTERVAL_MS.get(interval, 0)
+        last_open_time = self.kline_store.last_open_time(symbol, interval)
+        pair = (symbol, interval)
+        with self._condition:
+            backfilling = pair in self._pending_set or self._active == pair
+            error = self._failures.get(pair)
+        return {
+            'last_open_time': last_open_time,
+            'missing_bars': sum((end - start) // interval_ms + 1 for start, end in ranges) if interval_ms else 0,
+            'fresh': last_open_time is not None and not (ranges and ranges[-1][1] > last_open_time),
+            'backfilling': backfilling,
+            'error': error,
+        }
+
+    def backfill(self, symbol: str, interval: str) -> int:
+        """同步回补一个 symbol/interval 的所有缺口，返回写入的K线数量"""
+        interval_ms = INTERVAL_MS.get(interval)
+        if interval_ms is None:
+            return 0
+
+        filled = 0
+        last_filled = None
+        for start, end in self.missing_ranges(symbol, interval):
+            since = start
+            while since <= end:
+                limit = min(self.MAX_BARS_PER_REQUEST, (end - since) // interval_ms + 1)
+                self._throttle()
+                klines = self.api_client.get_Klines(symbol, interval, limit=limit, since=since)
+                if klines is None:
+                    raise RuntimeError("REST 获取K线失败")
+                bars = [kline for kline in klines if since <= kline.open_time <= end]
+                for kline in bars:
+                    self.kline_store.upsert(
+                        symbol, interval, open_time=kline.open_time, open=kline.open, high=kline.high,
+                        low=kline.low, close=kline.close, volume=kline.volume, close_time=kline.close_time,
+                        quote_volume=kline.quote_volume, trades=kline.trades,
+                    )
+                if not bars:
+                    # 交易所在该区间没有K线（如停机维护），记录下来避免反复请求
+                    self._empty_ranges.setdefault((symbol, interval), set()).add((since, end))
+                    break
+                filled += len(bars)
+                last_filled = max(last_filled or 0, bars[-1].open_time)
+                if len(klines) < limit:
+                    break
+                since = bars[-1].open_time + interval_ms
+
+        if filled and self.on_filled:
+            self.on_filled(symbol, interval, last_filled)
+        return filled
+
+    def _throttle(self):
+        """按 requests_per_second 限制 REST 请求间隔"""
+        wait = self._last_request + 1.0 / self.requests_per_second - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_request = time.monotonic()
+
+    def _next(self) -> Optional[Tuple[str, str]]:
+        """取出下一个待检查的 symbol/interval；空闲超时后把所有 targets 加入队列"""
+        with self._condition:
+            if not self._pending and self._running:
+                if not self._condition.wait(timeout=self.CHECK_INTERVAL_SECONDS) and self._running:
+                    for pair in self.targets():
+                        if pair not in self._pending_set:
+                            self._pending_set.add(pair)
+                            self._pending.append(pair)
+            if not self._running or not self._pending:
+                return None
+            pair = self._pending.popleft()
+            self._pending_set.discard(pair)
+            self._active = pair
+            return pair
+
+    def _run(self):
+        """后台线程主循环"""
+        while self._running:
+            pair = self._next()
+            if pair is None:
+                continue
+            symbol, interval = pair
+            try:
+                filled = self.backfill(symbol, interval)
+                with self._condition:
+                    self._failures.pop(pair, None)
+                if filled:
+                    logger.info(f"🔧 已回补 {symbol} {interval} 缺失K线: {filled} 根")
+            except Exception as e:
+                with self._condition:
+                    self._failures[pair] = str(e)
+                logger.error(f"❌ 回补 {symbol} {interval} K线失败: {e}", exc_info=True)
+            finally:
+                with self._condition:
+                    self._active = None
@@ -0,0 +1,366 @@
+"""
+K线列式存储 - 用预分配的 NumPy 环形缓冲区替代 deque[Kline]
+每个 symbol/interval 一组列数组（open_time/OHLCV/quote_volume/trades），读取时返回零拷贝只读视图
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from services.market.lock_stats import InstrumentedLock, summarize_lock_stats
+from services.market.type import Kline
+
+
+@dataclass(frozen=True)
+class KlineArrays:
+    """K线列式数据（只读视图，按 open_time 升序）"""
+    open_time: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    close_time: np.ndarray
+    quote_volume: np.ndarray
+    trades: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.open_time)
+
+    def copy(self) -> 'KlineArrays':
+        """复制为独立数组（脱离环形缓冲区，之后的写入不会影响它）"""
+        return KlineArrays(*(np.array(getattr(self, field)) for field in KlineRingBuffer.FIELDS))
+
+    def to_klines(self) -> List[Kline]:
+        """转换为 Kline 列表（兼容旧接口，会分配对象）"""
+        return [
+            Kline(
+                open_time=int(self.open_time[i]),
+                open=float(self.open[i]),
+                high=float(self.high[i]),
+                low=float(self.low[i]),
+                close=float(self.close[i]),
+                volume=float(self.volume[i]),
+                close_time=int(self.close_time[i]),
+                quote_volume=float(self.quote_volume[i]),
+                trades=int(self.trades[i]),
+            )
+            for i in range(len(self.open_time))
+        ]
+
+
+class KlineRingBuffer:
+    """单个 symbol/interval 的K线环形缓冲区
+
+    环形共有 capacity + 1 个槽位，每列分配两倍空间，每次写入同时写 p 和 p + slots（镜像写入），
+    这样任意"最近 N 根"窗口在内存中都是连续的，可以直接切片返回视图而无需拷贝。
+
+    多出的一个槽位（head，下一次写入的位置）从不属于已收盘K线窗口，
+    用来原地存放未收盘的K线（forming bar），读取时可选择是否把它接在窗口末尾。
+    """
+
+    INT_FIELDS = ('open_time', 'close_time', 'trades')
+    FLOAT_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'quote_volume')
+    FIELDS = ('open_time', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'trades')
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self._slots = capacity + 1
+        self._columns: Dict[str, np.ndarray] = {}
+        for field in self.INT_FIELDS:
+            self._columns[field] = np.zeros(2 * self._slots, dtype=np.int64)
+        for field in self.FLOAT_FIELDS:
+            self._columns[field] = np.zeros(2 * self._slots, dtype=np.float64)
+        self._head = 0  # 下一次写入的槽位（同时也是未收盘K线的槽位）
+        self._count = 0  # 当前有效的已收盘K线数量
+        self._forming = False  # head 槽位中是否有未收盘K线
+        self.lock = InstrumentedLock()  # 分片锁，由 KlineStore 持有后再读写
+
+    def __len__(self) -> int:
+        return self._count
+
+    def clear(self):
+        """清空缓冲区（不释放内存）"""
+        self._head = 0
+        self._count = 0
+        self._forming = False
+
+    def append(self, open_time: int, open: float, high: float, low: float, close: float,
+               volume: float, close_time: int, quote_volume: float, trades: int):
+        """追加一根已收盘K线（缓冲区满时覆盖最旧的一根）"""
+        forming = None
+        if self._forming:
+            if self._columns['open_time'][self._head] > open_time:
+                # 未收盘K线比新写入的更晚（如回补旧K线），挪到新的 head 槽位
+                forming = [self._columns[field][self._head] for field in self.FIELDS]
+            self._forming = False
+        self._write(self._head, open_time, open, high, low, close, volume, close_time, quote_volume, trades)
+        self._head = (self._head + 1) % self._slots
+        if self._count < self.capacity:
+            self._count += 1
+        if forming is not None:
+            self._write(self._head, *forming)
+            self._forming = True
+
+    def append_kline(self, kline: Kline):
+        """追加一根 Kline 对象"""
+        self.append(kline.open_time, kline.open, kline.high, kline.low, kline.close,
+                    kline.volume, kline.close_time, kline.quote_volume, kline.trades)
+
+    def _write(self, slot: int, open_time: int, open: float, high: float, low: float, close: float,
+               volume: float, close_time: int, quote_volume: float, trades: int):
+        """写入指定槽位（同时写镜像槽位）"""
+        columns = self._columns
+        for index in (slot, slot + self._slots):
+            columns['open_time'][index] = open_time
+            columns['open'][index] = open
+            columns['high'][index] = high
+            columns['low'][index] = low
+            columns['close'][index] = close
+            columns['volume'][index] = volume
+            columns['close_time'][index] = close_time
+            columns['quote_volume'][index] = quote_volume
+            columns['trades'][index] = trades
+
+    def _window(self, limit: Optional[int] = None, include_forming: bool = False) -> slice:
+        """最近 limit 根K线在镜像数组中的连续区间（include_forming 时末尾包含未收盘K线）"""
+        end = self._head + self._slots
+        available = self._count
+        if include_forming and self._forming:
+            end += 1
+            available += 1
+        n = available if limit is None else max(0, min(limit, available))
+        return slice(end - n, end)
+
+    def extend(self, columns: Dict[str, np.ndarray]):
+        """批量写入一组按 open_time 升序的列数据（覆盖现有内容，仅保留最新 capacity 根）"""
+        n = min(len(columns['open_time']), self.capacity)
+        for field in self.FIELDS:
+            values = np.asarray(columns[field])
+            values = values[len(values) - n:]
+            self._columns[field][:n] = values
+            self._columns[field][self._slots:self._slots + n] = values
+        self._head = n
+        self._count = n
+        self._forming = False
+
+    def last_open_time(self) -> Optional[int]:
+        """最新一根已收盘K线的 open_time"""
+        if self._count == 0:
+            return None
+        return int(self._columns['open_time'][self._head + self._slots - 1])
+
+    def set_forming(self, open_time: int, open: float, high: float, low: float, close: float,
+                    volume: float, close_time: int, quote_volume: float, trades: int):
+        """原地更新未收盘K线（不移动 head、不分配内存）
+
+        比最新已收盘K线更旧或相同的推送会被忽略（收盘消息已经写入）。
+        """
+        last_open_time = self.last_open_time()
+        if last_open_time is not None and open_time <= last_open_time:
+            return
+        self._write(self._head, open_time, open, high, low, close, volume, close_time, quote_volume, trades)
+        self._forming = True
+
+    def has_forming(self) -> bool:
+        """是否有未收盘K线"""
+        return self._forming
+
+    def upsert(self, open_time: int, open: float, high: float, low: float, close: float,
+               volume: float, close_time: int, quote_volume: float, trades: int):
+        """按 open_time 更新已收盘K线：已存在则原地替换，否则按时间顺序插入
+
+        常见情况（重复推送最新一根 / 新K线）只比较尾部槽位，O(1)；
+        乱序的旧K线走二分查找，只有需要插入到中间时才整体重写窗口。
+        """
+        last_open_time = self.last_open_time()
+        if last_open_time is None or open_time > last_open_time:
+            self.append(open_time, open, high, low, close, volume, close_time, quote_volume, trades)
+            return
+        if open_time == last_open_time:
+            self._write((self._head - 1) % self._slots, open_time, open, high, low, close,
+                        volume, close_time, quote_volume, trades)
+            return
+
+        # 乱序K线：在有序窗口中二分查找
+        window = self._window()
+        open_times = self._columns['open_time'][window]
+        position = int(np.searchsorted(open_times, open_time))
+        if open_times[position] == open_time:
+            slot = (window.start + position) % self._slots
+            self._write(slot, open_time, open, high, low, close, volume, close_time, quote_volume, trades)
+            return
+        if position == 0 and self._count == self.capacity:
+            # 比缓冲区内最旧的K线还旧，且缓冲区已满，直接丢弃
+            return
+
+        values = dict(open_time=open_time, open=open, high=high, low=low, close=close,
+                      volume=volume, close_time=close_time, quote_volume=quote_volume, trades=trades)
+        forming = [self._columns[field][self._head] for field in self.FIELDS] if self._forming else None
+        self.extend({
+            field: np.insert(self._columns[field][window], position, values[field])
+            for field in self.FIELDS
+        })
+        if forming is not None:
+            # 整体重写会清除未收盘K线，写回新的 head 槽位
+            self._write(self._head, *forming)
+            self._forming = True
+
+    def view(self, limit: Optional[int] = None, include_forming: bool = False) -> KlineArrays:
+        """返回最近 limit 根K线的只读视图（零拷贝）
+
+        include_forming=True 时末尾包含未收盘K线（如果有），它会随推送原地变化。
+        注意：视图与缓冲区共享内存，之后约 capacity - limit 次写入内数据保持有效，
+        需要长期持有时请自行 copy。
+        """
+        window = self._window(limit, include_forming)
+        views = {}
+        for field in self.FIELDS:
+            column_view = self._columns[field][window]
+            column_view.flags.writeable = False
+            views[field] = column_view
+        return KlineArrays(**views)
+
+    @property
+    def nbytes(self) -> int:
+        """缓冲区占用的内存（字节）"""
+        return sum(column.nbytes for column in self._columns.values())
+
+
+class KlineStore:
+    """K线列式存储 - 管理所有 symbol/interval 的环形缓冲区（线程安全）
+
+    锁按 symbol/interval 分片：每个缓冲区有自己的锁，且读取只在切片时短暂持锁，
+    不同交易对的读写互不阻塞。字典本身只在创建/删除缓冲区时加锁。
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self._buffers: Dict[str, KlineRingBuffer] = {}
+        self._buffers_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(symbol: str, interval: str) -> str:
+        """生成缓存键，如 BTC/USDT + 3m -> btcusdt_3m"""
+        return f"{symbol.replace('/', '').lower()}_{interval}"
+
+    def _get_or_create(self, key: str) -> KlineRingBuffer:
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            with self._buffers_lock:
+                buffer = self._buffers.get(key)
+                if buffer is None:
+                    buffer = KlineRingBuffer(self.capacity)
+                    self._buffers[key] = buffer
+        return buffer
+
+    def replace(self, symbol: str, interval: str, klines: List[Kline], now_ms: Optional[int] = None):
+        """用一批K线（按时间升序）整体替换缓存
+
+        REST 返回的最后一根K线通常尚未收盘（close_time >= now_ms），写入未收盘槽位，
+        之后的 WebSocket 推送继续原地更新它，收盘消息到达时再成为已收盘K线。
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        forming = klines[-1] if klines and klines[-1].close_time >= now_ms else None
+        closed = klines[:-1] if forming is not None else klines
+        columns = {
+            field: [getattr(kline, field) for kline in closed[-self.capacity:]]
+            for field in KlineRingBuffer.FIELDS
+        }
+        buffer = self._get_or_create(self.make_key(symbol, interval))
+        with buffer.lock:
+            buffer.extend(columns)
+            if forming is not None:
+                buffer.set_forming(forming.open_time, forming.open, forming.high, forming.low, forming.close,
+                                   forming.volume, forming.close_time, forming.quote_volume, forming.trades)
+
+    def replace_arrays(self, symbol: str, interval: str, columns: Dict[str, np.ndarray]):
+        """用一组按 open_time 升序的列数据整体替换缓存（如从磁盘归档加载）"""
+        buffer = self._get_or_create(self.make_key(symbol, interval))
+        with buffer.lock:
+            buffer.extend(columns)
+
+    def upsert(self, symbol: str, interval: str, open_time: int, open: float, high: float,
+               low: float, close: float, volume: float, close_time: int,
+               quote_volume: float, trades: int):
+        """写入一根K线（按 open_time 去重）"""
+        buffer = self._get_or_create(self.make_key(symbol, interval))
+        with buffer.lock:
+            buffer.upsert(open_time, open, high, low, close, volume, close_time, quote_volume, trades)
+
+    def update_forming(self, symbol: str, interval: str, open_time: int, open: float, high: float,
+                       low: float, close: float, volume: float, close_time: int,
+                       quote_volume: float, trades: int):
+        """原地更新未收盘K线（每次推送都会调用，不分配内存）"""
+        buffer = self._get_or_create(self.make_key(symbol, interval))
+        with buffer.lock:
+            buffer.set_forming(open_time, open, high, low, close, volume, close_time, quote_volume, trades)
+
+    def get_arrays(self, symbol: str, interval: str, limit: int = 100,
+                   include_forming: bool = False, copy: bool = False) -> Optional[KlineArrays]:
+        """获取最近 limit 根K线的只读列视图，没有数据时返回 None
+
+        include_forming=True 时末尾包含未收盘K线（如果有）。
+        copy=True 时在分片锁内复制出独立数组，避免读到并发写入的半行数据。
+        """
+        buffer = self._buffers.get(self.make_key(symbol, interval))
+        if buffer is None:
+            return None
+        with buffer.lock:
+            if len(buffer) == 0 and not (include_forming and buffer.has_forming()):
+                return None
+            arrays = buffer.view(limit, include_forming)
+            return arrays.copy() if copy else arrays
+
+    def get_klines(self, symbol: str, interval: str, limit: int = 100,
+                   include_forming: bool = False) -> List[Kline]:
+        """获取最近 limit 根K线（Kline 列表，兼容旧接口）"""
+        arrays = self.get_arrays(symbol, interval, limit, include_forming, copy=True)
+        return arrays.to_klines() if arrays is not None else []
+
+    def gaps(self, symbol: str, interval: str, interval_ms: int) -> List[Tuple[int, int]]:
+        """缓存中缺失的K线区间 [(第一根缺失的 open_time, 最后一根缺失的 open_time)]"""
+        arrays = self.get_arrays(symbol, interval, limit=self.capacity, copy=True)
+        if arrays is None or len(arrays) < 2:
+            return []
+        open_times = arrays.open_time
+        breaks = np.flatnonzero(np.diff(open_times) > interval_ms)
+        return [(int(open_times[i]) + interval_ms, int(open_times[i + 1]) - interval_ms) for i in breaks]
+
+    def last_open_time(self, symbol: str, interval: str) -> Optional[int]:
+        """最新一根已收盘K线的 open_time，没有数据时返回 None"""
+        buffer = self._buffers.get(self.make_key(symbol, interval))
+        if buffer is None:
+            return None
+        with buffer.lock:
+            return buffer.last_open_time()
+
+    def count(self, symbol: str, interval: str) -> int:
+        """获取缓存的K线数量"""
+        buffer = self._buffers.get(self.make_key(symbol, interval))
+        return len(buffer) if buffer is not None else 0
+
+    def remove_symbol(self, symbol: str):
+        """移除某个交易对所有周期的缓存"""
+        prefix = f"{symbol.replace('/', '').lower()}_"
+        with self._buffers_lock:
+            for key in [k for k in self._buffers if k.startswith(prefix)]:
+                del self._buffers[key]
+
+    def keys(self) -> List[str]:
+        """所有缓存键"""
+        with self._buffers_lock:
+            return list(self._buffers.keys())
+
+    def lock_stats(self) -> Dict[str, float]:
+        """所有分片锁的竞争统计汇总"""
+        with self._buffers_lock:
+            buffers = list(self._buffers.values())
+        return summarize_lock_stats(buffer.lock for buffer in buffers)
+
+    @property
+    def nbytes(self) -> int:
+        """所有缓冲区占用的内存（字节）"""
+        with self._buffers_lock:
+            buffers = list(self._buffers.values())
+        return sum(buffer.nbytes for buffer in buffers)
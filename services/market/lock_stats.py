@@ -0,0 +1,77 @@
+"""
+带竞争统计的锁 - 记录每次获取锁的等待时间，用于观察缓存锁竞争
+"""
+import threading
+import time
+from typing import Dict, Iterable
+
+
+class InstrumentedLock:
+    """可统计等待时间的互斥锁（接口与 threading.Lock 一致，可用于 with 语句）
+
+    先尝试非阻塞获取，只有发生竞争时才计时，无竞争路径几乎没有额外开销。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0  # 获取次数
+        self.contended = 0  # 发生等待的次数
+        self.total_wait = 0.0  # 累计等待时间（秒）
+        self.max_wait = 0.0  # 最长一次等待（秒）
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            self.acquisitions += 1
+            return True
+        if not blocking:
+            return False
+
+        started = time.perf_counter()
+        acquired = self._lock.acquire(True, timeout)
+        if acquired:
+            # 以下计数在持有锁时更新，不存在竞争
+            waited = time.perf_counter() - started
+            self.acquisitions += 1
+            self.contended += 1
+            self.total_wait += waited
+            if waited > self.max_wait:
+                self.max_wait = waited
+        return acquired
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def summarize_lock_stats(locks: Iterable[InstrumentedLock]) -> Dict[str, float]:
+    """汇总一组锁的竞争统计"""
+    acquisitions = 0
+    contended = 0
+    total_wait = 0.0
+    max_wait = 0.0
+    shards = 0
+    for lock in locks:
+        shards += 1
+        acquisitions += lock.acquisitions
+        contended += lock.contended
+        total_wait += lock.total_wait
+        max_wait = max(max_wait, lock.max_wait)
+
+    return {
+        'shards': shards,
+        'acquisitions': acquisitions,
+        'contended': contended,
+        'contention_ratio': contended / acquisitions if acquisitions else 0.0,
+        'total_wait_ms': total_wait * 1000,
+        'avg_wait_us': total_wait / acquisitions * 1_000_000 if acquisitions else 0.0,
+        'max_wait_ms': max_wait * 1000,
+    }
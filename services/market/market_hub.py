@@ -0,0 +1,121 @@
+"""
+行情数据中心 - 进程内所有 AutoTrader 共享的 MarketMonitor（按交易所引用计数）
+同一交易所只建立一个 APIClient / WebSocket 连接 / K线缓存，订阅取并集，
+最后一个交易员释放后才退订对应的流并停止监控器
+"""
+import threading
+from typing import Dict, List, Optional, Set
+from utils.logger import logger
+from services.market.monitor import MarketMonitor
+
+
+class MarketDataHub:
+    """进程级行情数据中心（由 TraderManager 创建并分发给每个交易员）"""
+
+    _instance: Optional['MarketDataHub'] = None
+    _instance_lock = threading.Lock()
+
+    # MarketMonitor 创建时读取的配置项：共享监控器只按第一个交易员的配置创建，之后的交易员与之不同会被忽略
+    MONITOR_CONFIG_KEYS = (
+        'async_rest_client', 'ws_offload_callbacks', 'ws_dispatch_queue_size', 'ws_streams_per_connection',
+        'ws_combined_streams', 'backfill_requests_per_second', 'kline_archive_dir',
+        'funding_rate_ttl', 'open_interest_ttl', 'market_wide_streams',
+    )
+
+    def __init__(self):
+        self._monitors: Dict[str, MarketMonitor] = {}  # 交易所 -> 共享监控器
+        self._configs: Dict[str, dict] = {}  # 交易所 -> 创建监控器时使用的配置
+        self._owners: Dict[str, Set[str]] = {}  # 交易所 -> 正在使用的交易员
+        self._lock = threading.Lock()  # 只保护上面的字典，持有期间不做阻塞操作
+        self._lifecycle_locks: Dict[str, threading.Lock] = {}  # 交易所 -> 串行化监控器的启动/停止
+
+    @classmethod
+    def instance(cls) -> 'MarketDataHub':
+        """获取进程内唯一的行情数据中心"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def _exchange_key(exchange_config: Optional[dict]) -> str:
+        """行情源标识（APIClient/WSClient 目前固定使用 Binance 行情）"""
+        return "binance"
+
+    @classmethod
+    def _config_conflicts(cls, created: dict, requested: dict) -> List[str]:
+        """requested 中与创建监控器时取值不同的监控器配置项"""
+        return [
+            key for key in cls.MONITOR_CONFIG_KEYS
+            if key in requested and requested[key] != created.get(key)
+        ]
+
+    def get_monitor(self, exchange_config: Optional[dict] = None) -> MarketMonitor:
+        """获取交易所对应的共享监控器（不存在则创建，不会启动）"""
+        key = self._exchange_key(exchange_config)
+        config = exchange_config or {}
+        with self._lock:
+            monitor = self._monitors.get(key)
+            if monitor is None:
+                monitor = MarketMonitor(config)
+                self._monitors[key] = monitor
+                self._configs[key] = dict(config)
+                self._owners[key] = set()
+                self._lifecycle_locks[key] = threading.Lock()
+                logger.info(f"✅ 创建共享 MarketMonitor: {key}")
+                return monitor
+            conflicts = self._config_conflicts(self._configs[key], config)
+        if conflicts:
+            logger.warning(
+                f"⚠️ 共享 MarketMonitor（{key}）已按第一个交易员的配置创建，以下配置项不同将被忽略: "
+                f"{', '.join(conflicts)}"
+            )
+        return monitor
+
+    def acquire(self, owner: str, exchange_config: Optional[dict] = None) -> MarketMonitor:
+        """登记交易员使用共享监控器（第一个使用者负责启动）"""
+        monitor = self.get_monitor(exchange_config)
+        key = self._exchange_key(exchange_config)
+        # 生命周期锁保证不会与正在进行的 stop 交错（停止后又被判断为"运行中"）
+        with self._lifecycle_locks[key]:
+            with self._lock:
+                self._owners[key].add(owner)
+                count = len(self._owners[key])
+            if not monitor.is_running():
+                monitor.start()
+        logger.info(f"📡 {owner} 已接入共享 MarketMonitor（{key}，使用者: {count}）")
+        return monitor
+
+    def release(self, owner: str, exchange_config: Optional[dict] = None):
+        """交易员释放共享监控器（退订其独占的流，最后一个使用者离开时停止监控器）"""
+        key = self._exchange_key(exchange_config)
+        with self._lock:
+            monitor = self._monitors.get(key)
+            owners = self._owners.get(key, set())
+            if monitor is None or owner not in owners:
+                return
+            owners.discard(owner)
+
+        # 退订和停止可能阻塞数秒，不持有 self._lock，其他交易所/交易员的 get_monitor、get_status 不受影响
+        monitor.release_owner_threadsafe(owner)
+        with self._lifecycle_locks[key]:
+            with self._lock:
+                remaining = len(owners)
+            if remaining == 0 and monitor.is_running():
+                monitor.stop()
+                logger.info(f"✅ 共享 MarketMonitor 已停止（{key}，无使用者）")
+                return
+        logger.info(f"📡 {owner} 已释放共享 MarketMonitor（{key}，剩余使用者: {remaining}）")
+
+    def get_status(self) -> Dict[str, dict]:
+        """各交易所监控器的使用情况"""
+        with self._lock:
+            return {
+                key: {
+                    'owners': sorted(self._owners.get(key, set())),
+                    'is_running': monitor.is_running(),
+                    'monitored_symbols': len(monitor._monitored_symbols),
+                }
+                for key, monitor in self._monitors.items()
+            }
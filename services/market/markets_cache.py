@@ -0,0 +1,165 @@
+"""
+交易所市场数据缓存 - 进程内所有 APIClient 共享一份 load_markets 结果
+过期前新建的客户端直接 set_markets（不访问网络）；可选的磁盘快照让重启后也无需重新下载。
+同时预先建立交易对索引（USDT 永续合约列表、交易所 ID -> 市场），供加载器和筛选直接查表
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from utils.logger import logger
+
+try:
+    import orjson  # 可选：更快的快照读写
+except ImportError:
+    orjson = None
+
+
+class MarketsCache:
+    """进程级市场数据缓存（按 TTL 刷新）
+
+    - apply(exchange)：把缓存的市场数据装入 ccxt 交易所实例，缓存为空或过期时用该实例下载一次
+    - get() / store(markets, currencies)：供异步客户端自己 await load_markets 时使用
+    - tradable_symbols() / perpetual(symbol)：预先建立的交易对索引
+    """
+
+    TTL_SECONDS = 3600  # 市场数据刷新间隔（新上线/下线的交易对在此时间内生效）
+    SNAPSHOT_ENV = "MARKETS_SNAPSHOT_PATH"  # 磁盘快照路径的环境变量（未设置时不写磁盘）
+
+    _instance: Optional['MarketsCache'] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, ttl_seconds: float = TTL_SECONDS, snapshot_path: Optional[str] = None):
+        self.ttl_seconds = ttl_seconds
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self._markets: Optional[Dict[str, dict]] = None
+        self._currencies: Optional[Dict[str, dict]] = None
+        self._fetched_at = 0.0  # 下载时间（time.time()，快照中同样保存）
+        self._version = 0  # 每次更新加一，已装入当前版本的交易所实例不再重复 set_markets
+        self._tradable_symbols: List[str] = []
+        self._perpetuals: Dict[str, dict] = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def instance(cls) -> 'MarketsCache':
+        """获取进程内唯一的市场数据缓存"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls(snapshot_path=os.getenv(cls.SNAPSHOT_ENV))
+        return cls._instance
+
+    def _fresh(self) -> bool:
+        return self._markets is not None and time.time() - self._fetched_at < self.ttl_seconds
+
+    def get(self) -> Optional[Tuple[Dict[str, dict], Optional[Dict[str, dict]]]]:
+        """未过期的 (markets, currencies)；内存中没有时尝试读取磁盘快照，都不可用时返回 None"""
+        with self._lock:
+            if not self._fresh() and self.snapshot_path is not None:
+                self._load_snapshot()
+            return (self._markets, self._currencies) if self._fresh() else None
+
+    def store(self, markets: Dict[str, dict], currencies: Optional[Dict[str, dict]] = None,
+              fetched_at: Optional[float] = None, persist: bool = True):
+        """写入一份新下载的市场数据并重建索引"""
+        with self._lock:
+            self._markets = dict(markets)
+            self._currencies = dict(currencies) if currencies else None
+            self._fetched_at = time.time() if fetched_at is None else fetched_at
+            self._version += 1
+            self._build_index()
+            if persist and self.snapshot_path is not None:
+                self._save_snapshot()
+
+    def apply(self, exchange) -> Dict[str, dict]:
+        """把缓存装入 ccxt 交易所实例（同步接口）；缓存不可用时用该实例下载并写入缓存"""
+        with self._lock:
+            cached = self.get()
+            if cached is None:
+                exchange.load_markets(reload=True)
+                self.store(exchange.markets, getattr(exchange, 'currencies', None))
+                exchange._markets_cache_version = self._version
+                logger.info(f"✅ 已下载市场数据: {len(self._markets)} 个交易对")
+                return exchange.markets
+            version = self._version
+        if getattr(exchange, '_markets_cache_version', None) != version:
+            markets, currencies = cached
+            exchange.set_markets(list(markets.values()), currencies)
+            exchange._markets_cache_version = version
+        return exchange.markets
+
+    def tradable_symbols(self, exchange=None) -> List[str]:
+        """所有可交易的 USDT 永续/交割合约（BTC/USDT 格式）；传入 exchange 时缓存过期会先刷新"""
+        if exchange is not None:
+            self.apply(exchange)
+        with self._lock:
+            return list(self._tradable_symbols)
+
+    def perpetual(self, symbol: str) -> Optional[dict]:
+        """按任意格式（BTC、BTCUSDT、BTC/USDT、BTC/USDT:USDT）查找 USDT 永续合约市场"""
+        key = symbol.split(':')[0].replace('/', '').upper()
+        if not key.endswith('USDT'):
+            key += 'USDT'
+        return self._perpetuals.get(key)
+
+    def _build_index(self):
+        """建立 USDT 合约列表和交易所 ID -> 永续合约市场的索引（调用方持有锁）"""
+        tradable = []
+        perpetuals = {}
+        for symbol, market in self._markets.items():
+            # 筛选条件：永续合约、USDT计价、可交易
+            market_type = market.get('type', '')
+            is_usdt_contract = (
+                market_type in ('swap', 'future') and
+                market.get('settle', '') == 'USDT' and
+                market.get('active', True)
+            )
+            if not is_usdt_contract:
+                continue
+            if market_type == 'swap' and market.get('id'):
+                perpetuals[market['id'].upper()] = market
+
+            # 转换为标准格式（去掉 :USDT 后缀，统一为 BTC/USDT 格式）
+            if ':USDT' in symbol:
+                tradable.append(symbol.replace(':USDT', ''))
+            elif symbol.endswith('/USDT'):
+                tradable.append(symbol)
+            else:
+                # 如果格式不标准，尝试从 base 和 quote 构建
+                base = market.get('base', '')
+                if base and market.get('quote', '') == 'USDT':
+                    tradable.append(f"{base}/USDT")
+        self._tradable_symbols = tradable
+        self._perpetuals = perpetuals
+
+    def _load_snapshot(self):
+        """读取磁盘快照（调用方持有锁；快照过期或损坏时忽略）"""
+        try:
+            if not self.snapshot_path.exists():
+                return
+            raw = self.snapshot_path.read_bytes()
+            snapshot = orjson.loads(raw) if orjson is not None else json.loads(raw)
+            fetched_at = float(snapshot['fetched_at'])
+            if time.time() - fetched_at >= self.ttl_seconds:
+                return
+            self.store(snapshot['markets'], snapshot.get('currencies'), fetched_at=fetched_at, persist=False)
+            logger.info(f"💾 已从磁盘快照加载市场数据: {len(self._markets)} 个交易对")
+        except Exception as e:
+            logger.warning(f"⚠️ 读取市场数据快照失败: {e}")
+
+    def _save_snapshot(self):
+        """写入磁盘快照（调用方持有锁；先写临时文件再原子替换）"""
+        snapshot = {'fetched_at': self._fetched_at, 'markets': self._markets, 'currencies': self._currencies}
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            if orjson is not None:
+                data = orjson.dumps(snapshot, default=str)
+            else:
+                data = json.dumps(snapshot, default=str).encode()
+            temp_path = self.snapshot_path.with_suffix(self.snapshot_path.suffix + '.tmp')
+            temp_path.write_bytes(data)
+            os.replace(temp_path, self.snapshot_path)
+        except Exception as e:
+            logger.warning(f"⚠️ 写入市场数据快照失败: {e}")
@@ -3,35 +3,105 @@
 类似 Nofx 的 monitor.go
 """
 import asyncio
+import concurrent.futures
+import math
 import threading
-from typing import Dict, List, Optional, Set
-from collections import defaultdict, deque
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
 from datetime import datetime
 from utils.logger import logger
-from services.market.client import WSClient
+from services.market.client import WSClientPool
+from services.market.stream_dispatcher import StreamDispatcher
 from services.market.api_client import APIClient
+from services.market.async_api_client import AsyncAPIClient
+from services.market.kline_store import KlineStore, KlineArrays
+from services.market.incremental_indicators import IncrementalIndicatorEngine
+from services.market.kline_backfill import KlineBackfiller
+from services.market.kline_archive import KlineArchive
+from services.market.derivatives_snapshot import DerivativesSnapshot
+from services.market.historical_loader import merge_pages, page_requests
 from services.market.type import Kline
 
 class MarketMonitor:
     """市场数据监控器 - 后台运行，缓存实时数据"""
     
+    KLINE_CACHE_SIZE = 1000  # 每个 symbol/interval 最多保存1000根K线
+    HISTORY_FETCH_CONCURRENCY = 5  # 订阅时并发加载历史K线的 symbol/interval 数
+    HISTORY_DEPTH = 500  # 订阅时每个周期加载的历史K线数量（与 HistoricalDataLoader 一致）
+    HISTORY_REQUEST_SECONDS = 3.0  # 估算订阅耗时时每个历史K线请求的预算（含权重调度器的限速等待）
+    MARKET_TICKER_STREAM = "!ticker@arr"  # 全市场 24h Ticker（每秒推送有变化的交易对）
+    MARKET_MARK_PRICE_STREAM = "!markPrice@arr"  # 全市场标记价格和资金费率
+    DEFAULT_OWNER = "default"  # 未指定订阅者时使用的 owner
+    ARCHIVE_SYNC_WINDOW = 8  # 收盘时写入归档前检查的最近K线数量
+    
     def __init__(self, exchange_config: dict):
         self.exchange_config = exchange_config
-        self.api_client = APIClient()
-        self.ws_client = WSClient()
+        config = exchange_config or {}
+        # REST 客户端：async_rest_client 开启时使用共享会话的异步客户端（同步接口不变）
+        self.api_client = AsyncAPIClient() if config.get('async_rest_client', False) else APIClient()
+        # 消息回调在独立的分发线程中执行（按流有界排队），读缓存的一方持锁时不阻塞 socket 读取
+        self.dispatcher: Optional[StreamDispatcher] = None
+        if config.get('ws_offload_callbacks', True):
+            self.dispatcher = StreamDispatcher(
+                max_queue_size=config.get('ws_dispatch_queue_size', StreamDispatcher.MAX_QUEUE_SIZE)
+            )
+        # 订阅按每连接流数量上限分散到多个 WebSocket 连接
+        self.ws_client = WSClientPool(
+            streams_per_connection=config.get(
+                'ws_streams_per_connection', WSClientPool.DEFAULT_STREAMS_PER_CONNECTION
+            ),
+            combined=config.get('ws_combined_streams', False),
+            dispatcher=self.dispatcher,
+        )
+        self.ws_client.on_reconnect = self._on_ws_reconnect
         
         # 数据缓存
-        self.kline_cache: Dict[str, deque] = defaultdict(lambda: deque(maxlen=1000))  # 最多保存1000根K线
+        self.kline_store = KlineStore(capacity=self.KLINE_CACHE_SIZE)  # 列式环形缓冲区
+        
+        # K线收盘事件监听器：callback(symbol, interval, open_time)
+        self._kline_listeners: List[Callable[[str, str, int], None]] = []
+        # 增量指标引擎（由K线收盘事件驱动）
+        self.indicator_engine = IncrementalIndicatorEngine(self.kline_store)
+        self.add_kline_listener(self.indicator_engine.on_kline_closed)
+        # K线缺口回补（WebSocket 重连后立即检查，空闲时定期检查），回补后同样触发K线收盘事件
+        self.backfiller = KlineBackfiller(
+            self.kline_store,
+            self.api_client,
+            targets=self._backfill_targets,
+            on_filled=self._notify_kline_closed,
+            requests_per_second=config.get('backfill_requests_per_second', KlineBackfiller.REQUESTS_PER_SECOND),
+        )
+        # K线磁盘归档（配置 kline_archive_dir 时开启）：收盘K线追加到磁盘，重启时只需下载增量
+        # 磁盘写入在独立的写入线程中执行（按 symbol/interval 合并），不阻塞消息分发线程上的其他监听器
+        self.kline_archive: Optional[KlineArchive] = None
+        self._archive_writer: Optional[StreamDispatcher] = None
+        if config.get('kline_archive_dir'):
+            self.kline_archive = KlineArchive(config['kline_archive_dir'], capacity=self.KLINE_CACHE_SIZE)
+            self._archive_writer = StreamDispatcher(name="KlineArchiveWriter")
+            self.add_kline_listener(self._queue_archive_write)
         self.price_cache: Dict[str, float] = {}  # 最新价格
         self.ticker_cache: Dict[str, dict] = {}  # Ticker数据
+        self.mark_price_cache: Dict[str, dict] = {}  # 标记价格和资金费率（全市场流模式）
+        # 全市场资金费率/持仓量快照（随 MarketMonitor 在交易员之间共享）
+        self.derivatives = DerivativesSnapshot(
+            self.api_client,
+            funding_ttl=config.get('funding_rate_ttl', DerivativesSnapshot.FUNDING_TTL_SECONDS),
+            open_interest_ttl=config.get('open_interest_ttl', DerivativesSnapshot.OPEN_INTEREST_TTL_SECONDS),
+        )
+        self._market_wide = False  # 是否已订阅全市场流（开启后不再逐个订阅 Ticker）
         
         # 运行状态
         self._running = False
         self._monitor_thread: Optional[threading.Thread] = None
         self._monitored_symbols: Set[str] = set()
+        self._symbol_owners: Dict[str, Set[str]] = {}  # 交易对 -> 使用它的交易员（引用计数）
+        self._symbol_intervals: Dict[str, Set[str]] = {}  # 交易对 -> 已订阅的K线周期
+        self._loop: Optional[asyncio.AbstractEventLoop] = None  # 监控线程的事件循环
         
-        # 线程安全锁
-        self._cache_lock = threading.Lock()
+        # 线程安全：kline_store 内部按 symbol/interval 分片加锁；
+        # price_cache/ticker_cache 只由回调线程整键赋值，读取方直接 dict.get，无需加锁
+        
+        if config.get('market_wide_streams', False):
+            self.enable_market_streams()
         
         logger.info("MarketMonitor 初始化完成")
         
@@ -42,6 +112,8 @@ class MarketMonitor:
             return
         
         self._running = True
+        if isinstance(self.api_client, AsyncAPIClient):
+            self.api_client.reopen()  # 停止时已关闭会话，重新启动时恢复
         self._monitor_thread = threading.Thread(
             target=self._run_event_loop,
             daemon=True,
@@ -63,12 +135,17 @@ class MarketMonitor:
         if self._monitor_thread:
             self._monitor_thread.join(timeout=10)  # 增加超时时间
         
+        # 异步客户端持有自己的事件循环线程和 aiohttp 会话，需要显式关闭
+        if isinstance(self.api_client, AsyncAPIClient):
+            self.api_client.close()
+        
         logger.info("✅ MarketMonitor 已停止")
     
     def _run_event_loop(self):
         """在独立线程中运行异步事件循环"""
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
+        self._loop = loop
         
         try:
             loop.run_until_complete(self._monitor_loop())
@@ -87,11 +164,16 @@ class MarketMonitor:
             except Exception as e:
                 logger.error(f"清理任务时出错: {e}")
             finally:
+                self._loop = None
                 loop.close()
     
     async def _monitor_loop(self):
         """监控循环（异步）"""
-        # 启动 WebSocket 客户端
+        # 启动 WebSocket 客户端、K线回补线程和衍生品数据后台刷新
+        self.backfiller.start()
+        self.derivatives.start()
+        if self._archive_writer is not None:
+            self._archive_writer.start()
         await self.ws_client.start()
         logger.info("WebSocket 客户端已启动")
         
@@ -101,64 +183,231 @@ class MarketMonitor:
         
         # 停止 WebSocket 客户端（在同一个事件循环中）
         await self.ws_client.stop()
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+        self.backfiller.stop()
+        self.derivatives.stop()
+        if self._archive_writer is not None:
+            # 未写入的收盘K线在下次启动时作为增量重新下载
+            self._archive_writer.stop()
         logger.info("WebSocket 客户端已停止")
     
-    async def add_symbol(self, symbol: str, intervals: List[str] = ["3m", "4h"]):
-        """添加监控的交易对"""
-        if symbol in self._monitored_symbols:
-            logger.info(f"{symbol} 已在监控中")
-            return
+    async def add_symbol(self, symbol: str, intervals: List[str] = ["3m", "4h"], owner: str = DEFAULT_OWNER):
+        """添加监控的交易对（按 owner 引用计数，多个交易员订阅同一交易对时流只订阅一次）"""
+        await self.add_symbols([symbol], intervals, owner)
+    
+    async def add_symbols(self, symbols: List[str], intervals: List[str] = ["3m", "4h"], owner: str = DEFAULT_OWNER):
+        """批量添加监控的交易对（必须在监控器的事件循环中执行）
         
-        self._monitored_symbols.add(symbol)
-        normalized_symbol = symbol.replace('/', '').lower()
+        历史K线并发加载（异步客户端直接 await，否则在线程池中执行，均不阻塞事件循环），
+        所有新增的流合并为一个 SUBSCRIBE 请求。
+        交易对在历史数据写入缓存后才标记为监控中，此前读取方会回退到 REST API；
+        历史数据加载失败的 symbol/interval 不订阅，撤销占位后可以再次添加。
+        """
+        pending = []  # (symbol, 新增周期)
+        for symbol in symbols:
+            self._symbol_owners.setdefault(symbol, set()).add(owner)
+            subscribed_intervals = self._symbol_intervals.setdefault(symbol, set())
+            new_intervals = [interval for interval in intervals if interval not in subscribed_intervals]
+            if not new_intervals:
+                logger.info(f"{symbol} 已在监控中")
+                continue
+            subscribed_intervals.update(new_intervals)  # 先占位，避免并发调用重复加载
+            pending.append((symbol, new_intervals))
+        
+        if not pending:
+            return
         
         # 使用 API 获取历史数据初始化缓存
-        try:
-            for interval in intervals:
-                klines = self.api_client.get_Klines(symbol, interval, limit=200)
-                if klines:
-                    cache_key = f"{normalized_symbol}_{interval}"
-                    with self._cache_lock:
-                        self.kline_cache[cache_key] = deque(klines, maxlen=1000)
-                    logger.info(f"✅ 已加载 {symbol} {interval} 历史K线: {len(klines)} 根")
-        except Exception as e:
-            logger.error(f"❌ 加载 {symbol} 历史数据失败: {e}", exc_info=True)
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.HISTORY_FETCH_CONCURRENCY)
+        
+        async def fetch_page(symbol: str, interval: str, since: Optional[int], limit: int):
+            if isinstance(self.api_client, AsyncAPIClient):
+                return await self.api_client.get_klines_async(symbol, interval, limit=limit, since=since)
+            return await loop.run_in_executor(
+                None, lambda: self.api_client.get_Klines(symbol, interval, limit=limit, since=since)
+            )
         
-        # 订阅 WebSocket 流
-        for interval in intervals:
-            stream_name = f"{normalized_symbol}@kline_{interval}"
-            await self.ws_client.subscribe(stream_name, self._on_kline_message)
-            logger.info(f"✅ 已订阅: {stream_name}")
+        async def load_history(symbol: str, interval: str) -> bool:
+            """加载一个 symbol/interval 的历史K线，返回是否已写入缓存"""
+            async with semaphore:
+                try:
+                    # 超过单页的深度按 since 游标分页并行获取，合并时按 open_time 去重
+                    pages = await asyncio.gather(*(
+                        fetch_page(symbol, interval, since, limit)
+                        for since, limit in page_requests(interval, self.HISTORY_DEPTH)
+                    ))
+                    klines = None
+                    if all(page is not None for page in pages):
+                        klines = merge_pages(pages, self.HISTORY_DEPTH)
+                    if klines:
+                        self.kline_store.replace(symbol, interval, klines)
+                        logger.info(f"✅ 已加载 {symbol} {interval} 历史K线: {len(klines)} 根")
+                        return True
+                    logger.warning(f"⚠️ {symbol} {interval} 没有获取到历史K线")
+                except Exception as e:
+                    logger.error(f"❌ 加载 {symbol} 历史数据失败: {e}", exc_info=True)
+                return False
         
-        # 订阅 Ticker（获取最新价格）
-        ticker_stream = f"{normalized_symbol}@ticker"
-        await self.ws_client.subscribe(ticker_stream, self._on_ticker_message)
-        logger.info(f"✅ 已订阅: {ticker_stream}")
+        requests = [(symbol, interval) for symbol, new_intervals in pending for interval in new_intervals]
+        results = await asyncio.gather(*(load_history(symbol, interval) for symbol, interval in requests))
+        loaded = {request for request, ok in zip(requests, results) if ok}
+        
+        # 订阅 WebSocket 流（只订阅加载成功的新增周期，已有的流与其他交易员共享；新交易对额外订阅 Ticker）
+        subscriptions = []
+        symbol_count = 0
+        for symbol, new_intervals in pending:
+            loaded_intervals = [interval for interval in new_intervals if (symbol, interval) in loaded]
+            failed_intervals = [interval for interval in new_intervals if (symbol, interval) not in loaded]
+            if failed_intervals:
+                self._rollback_intervals(symbol, failed_intervals, owner)
+            if not loaded_intervals:
+                continue
+            
+            symbol_count += 1
+            normalized_symbol = symbol.replace('/', '').lower()
+            for interval in loaded_intervals:
+                subscriptions.append((f"{normalized_symbol}@kline_{interval}", self._on_kline_message))
+            if symbol not in self._monitored_symbols and not self._market_wide:
+                subscriptions.append((f"{normalized_symbol}@ticker", self._on_ticker_message))
+            self._monitored_symbols.add(symbol)
+        
+        if subscriptions:
+            await self.ws_client.subscribe_many(subscriptions)
+        logger.info(f"✅ 已订阅 {symbol_count} 个交易对的 {len(subscriptions)} 个流")
     
-    async def remove_symbol(self, symbol: str):
-        """移除监控的交易对"""
+    def _rollback_intervals(self, symbol: str, intervals: List[str], owner: str):
+        """撤销历史数据加载失败的周期占位（交易对没有任何周期时一并撤销 owner 登记）"""
+        subscribed_intervals = self._symbol_intervals.get(symbol, set())
+        subscribed_intervals.difference_update(intervals)
+        logger.warning(f"⚠️ {symbol} {', '.join(intervals)} 历史数据加载失败，暂不订阅")
+        if subscribed_intervals or symbol in self._monitored_symbols:
+            return
+        self._symbol_intervals.pop(symbol, None)
+        owners = self._symbol_owners.get(symbol, set())
+        owners.discard(owner)
+        if not owners:
+            self._symbol_owners.pop(symbol, None)
+    
+    def history_load_timeout(self, symbol_count: int, intervals: List[str]) -> float:
+        """add_symbols 加载 symbol_count 个交易对历史K线的预计耗时上限（秒）
+        
+        每个 symbol/interval 的分页请求按 HISTORY_FETCH_CONCURRENCY 分批执行，每页一个请求预算
+        """
+        loads = symbol_count * len(intervals)
+        if not loads:
+            return 0.0
+        pages = max(len(page_requests(interval, self.HISTORY_DEPTH)) for interval in intervals)
+        batches = math.ceil(loads / self.HISTORY_FETCH_CONCURRENCY)
+        return batches * pages * self.HISTORY_REQUEST_SECONDS
+    
+    def subscribe_many(
+        self,
+        symbols: List[str],
+        intervals: List[str] = ["3m", "4h"],
+        owner: str = DEFAULT_OWNER
+    ) -> concurrent.futures.Future:
+        """在任意线程中批量订阅交易对（调度到监控器自己的事件循环执行，不创建线程或事件循环）
+        
+        Returns:
+            concurrent.futures.Future，完成时表示历史数据已加载、订阅请求已发送
+        """
+        return self._run_threadsafe(lambda: self.add_symbols(symbols, intervals, owner))
+    
+    def enable_market_streams(self) -> concurrent.futures.Future:
+        """开启全市场流模式（可在任意线程调用，重复调用无副作用）
+        
+        订阅 !ticker@arr 和 !markPrice@arr，一条消息更新所有交易对的价格、Ticker 和资金费率；
+        之后新增的交易对只订阅K线流，不再单独订阅 Ticker。
+        """
+        self._market_wide = True
+        return self._run_threadsafe(self._subscribe_market_streams)
+    
+    async def _subscribe_market_streams(self):
+        if self.MARKET_TICKER_STREAM in self.ws_client.subscribed_streams:
+            return
+        await self.ws_client.subscribe_many([
+            (self.MARKET_TICKER_STREAM, self._on_ticker_array_message),
+            (self.MARKET_MARK_PRICE_STREAM, self._on_mark_price_array_message),
+        ])
+        logger.info("✅ 已订阅全市场 Ticker 和标记价格流")
+    
+    def _run_threadsafe(self, coroutine_factory: Callable[[], Awaitable]) -> concurrent.futures.Future:
+        """把协程调度到监控器的事件循环执行；事件循环未运行时在当前线程直接执行"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            try:
+                return asyncio.run_coroutine_threadsafe(coroutine_factory(), loop)
+            except RuntimeError:
+                pass  # 事件循环正在关闭
+        
+        # 事件循环未运行（监控器未启动）：直接执行，流会在 WebSocket 连接建立后统一订阅
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        try:
+            future.set_result(asyncio.run(coroutine_factory()))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
+    async def remove_symbol(self, symbol: str, owner: Optional[str] = None):
+        """移除监控的交易对（指定 owner 时，只有最后一个 owner 释放后才真正退订并清理缓存）"""
         if symbol not in self._monitored_symbols:
             return
         
-        self._monitored_symbols.remove(symbol)
+        if owner is not None:
+            owners = self._symbol_owners.get(symbol, set())
+            owners.discard(owner)
+            if owners:
+                logger.debug(f"{symbol} 仍被 {len(owners)} 个交易员使用，保留订阅")
+                return
+        
+        await self._unsubscribe_symbol(symbol)
         normalized_symbol = symbol.replace('/', '').lower()
         
         # 清理缓存
-        with self._cache_lock:
-            # 清理相关缓存键
-            keys_to_remove = [k for k in self.kline_cache.keys() if k.startswith(normalized_symbol)]
-            for key in keys_to_remove:
-                del self.kline_cache[key]
-            
-            if normalized_symbol.upper() in self.price_cache:
-                del self.price_cache[normalized_symbol.upper()]
-            if normalized_symbol.upper() in self.ticker_cache:
-                del self.ticker_cache[normalized_symbol.upper()]
+        self.indicator_engine.remove_symbol(symbol)
+        self.kline_store.remove_symbol(symbol)
+        self.price_cache.pop(normalized_symbol.upper(), None)
+        self.ticker_cache.pop(normalized_symbol.upper(), None)
         
         logger.info(f"✅ 已移除监控: {symbol}")
     
+    async def release_owner(self, owner: str):
+        """释放某个交易员持有的所有订阅（仅退订不再被任何交易员使用的流，保留K线缓存）"""
+        for symbol in [s for s, owners in self._symbol_owners.items() if owner in owners]:
+            owners = self._symbol_owners[symbol]
+            owners.discard(owner)
+            if not owners and symbol in self._monitored_symbols:
+                await self._unsubscribe_symbol(symbol)
+                logger.info(f"✅ 已退订: {symbol}（最后一个交易员已释放）")
+    
+    def release_owner_threadsafe(self, owner: str, timeout: float = 10):
+        """在任意线程中释放交易员的订阅（调度到监控器自己的事件循环执行）"""
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            future = asyncio.run_coroutine_threadsafe(self.release_owner(owner), loop)
+            try:
+                future.result(timeout=timeout)
+            except Exception as e:
+                logger.error(f"❌ 释放 {owner} 的订阅失败: {e}", exc_info=True)
+        else:
+            # 事件循环未运行（没有活动连接），只需更新订阅记录
+            asyncio.run(self.release_owner(owner))
+    
+    async def _unsubscribe_symbol(self, symbol: str):
+        """退订交易对的所有 WebSocket 流"""
+        self._monitored_symbols.discard(symbol)
+        self._symbol_owners.pop(symbol, None)
+        intervals = self._symbol_intervals.pop(symbol, set())
+        normalized_symbol = symbol.replace('/', '').lower()
+        
+        streams = [f"{normalized_symbol}@kline_{interval}" for interval in intervals]
+        streams.append(f"{normalized_symbol}@ticker")
+        await self.ws_client.unsubscribe_many(streams)
+    
     def _on_kline_message(self, message: dict):
-        """处理K线消息（在WebSocket线程中调用）"""
+        """处理K线消息（在回调分发线程中调用，未开启分发线程时在 WebSocket 线程中调用）"""
         try:
             # Binance K线数据格式
             kline_data = message.get("k", {})
@@ -169,71 +418,194 @@ class MarketMonitor:
             interval = kline_data.get("i", "")  # 1m, 3m, 4h等
             is_closed = kline_data.get("x", False)  # K线是否已结束
             
+            # 直接写入列式存储，不创建 Kline 对象
+            close = float(kline_data["c"])
+            open_time = int(kline_data["t"])
+            # 已收盘K线写入环形缓冲区；未收盘K线原地更新 forming 槽位（读取方可选择是否包含）
+            write = self.kline_store.upsert if is_closed else self.kline_store.update_forming
+            write(
+                symbol,
+                interval,
+                open_time=open_time,
+                open=float(kline_data["o"]),
+                high=float(kline_data["h"]),
+                low=float(kline_data["l"]),
+                close=close,
+                volume=float(kline_data.get("v", 0)),
+                close_time=int(kline_data["T"]),
+                quote_volume=float(kline_data.get("q", 0)),
+                trades=int(kline_data.get("n", 0))
+            )
+            
+            # 更新最新价格
+            self.price_cache[symbol] = close
+            
             if is_closed:
-                # 只有K线结束时才更新缓存
-                kline = Kline(
-                    open_time=int(kline_data["t"]),
-                    open=float(kline_data["o"]),
-                    high=float(kline_data["h"]),
-                    low=float(kline_data["l"]),
-                    close=float(kline_data["c"]),
-                    volume=float(kline_data.get("v", 0)),
-                    close_time=int(kline_data["T"]),
-                    quote_volume=float(kline_data.get("q", 0)),
-                    trades=int(kline_data.get("n", 0))
-                )
-                
-                cache_key = f"{symbol.lower()}_{interval}"
-                with self._cache_lock:
-                    # 如果已存在相同时间的K线，替换它；否则添加新的
-                    existing = False
-                    for i, existing_kline in enumerate(self.kline_cache[cache_key]):
-                        if existing_kline.open_time == kline.open_time:
-                            self.kline_cache[cache_key][i] = kline
-                            existing = True
-                            break
-                    
-                    if not existing:
-                        self.kline_cache[cache_key].append(kline)
-                    
-                    # 更新最新价格
-                    self.price_cache[symbol] = float(kline_data["c"])
-                
-                logger.debug(f"📊 K线更新: {symbol} {interval} @ {kline.close}")
+                self._notify_kline_closed(symbol, interval, open_time)
+                logger.debug(f"📊 K线更新: {symbol} {interval} @ {close}")
         except Exception as e:
             logger.error(f"❌ 处理K线消息失败: {e}", exc_info=True)
     
+    def add_kline_listener(self, callback: Callable[[str, str, int], None]):
+        """注册K线收盘事件监听器（在处理K线消息的线程中同步调用，回调应尽快返回）"""
+        if callback not in self._kline_listeners:
+            self._kline_listeners.append(callback)
+    
+    def remove_kline_listener(self, callback: Callable[[str, str, int], None]):
+        """移除K线收盘事件监听器"""
+        if callback in self._kline_listeners:
+            self._kline_listeners.remove(callback)
+    
+    def _notify_kline_closed(self, symbol: str, interval: str, open_time: int):
+        """通知所有监听器某根K线已收盘并写入缓存"""
+        for callback in list(self._kline_listeners):
+            try:
+                callback(symbol, interval, open_time)
+            except Exception as e:
+                logger.error(f"❌ K线收盘监听器执行失败: {e}", exc_info=True)
+    
+    def _queue_archive_write(self, symbol: str, interval: str, open_time: int):
+        """K线收盘监听器：把归档写入交给写入线程（同一 symbol/interval 未执行的写入只保留一次）"""
+        self._archive_writer.submit(
+            (symbol, interval),
+            [(self._archive_closed_kline, False)],
+            {'symbol': symbol, 'interval': interval, 'open_time': open_time},
+        )
+    
+    def _archive_closed_kline(self, event: dict):
+        """把收盘K线追加到磁盘归档（连同缓存中归档之后的最近几根，覆盖回补和合并掉的K线）"""
+        symbol, interval = event['symbol'], event['interval']
+        klines = self.kline_store.get_klines(symbol, interval, limit=self.ARCHIVE_SYNC_WINDOW)
+        if klines:
+            self.kline_archive.append(symbol, interval, klines, now_ms=klines[-1].close_time + 1)
+    
+    def _backfill_targets(self) -> List[Tuple[str, str]]:
+        """需要检查缺口的所有 symbol/interval"""
+        return [
+            (symbol, interval)
+            for symbol in list(self._monitored_symbols)
+            for interval in self._symbol_intervals.get(symbol, ())
+        ]
+    
+    async def _on_ws_reconnect(self, streams: List[str]):
+        """WebSocket 连接重新建立后，回补该连接上断线期间收盘的K线（后台执行，不阻塞消息处理）"""
+        kline_streams = set(streams)
+        pairs = [
+            (symbol, interval)
+            for symbol, interval in self._backfill_targets()
+            if f"{symbol.replace('/', '').lower()}@kline_{interval}" in kline_streams
+        ]
+        if pairs:
+            logger.info(f"🔧 WebSocket 已重连，检查 {len(pairs)} 个K线流的缺口")
+            self.backfiller.request(pairs)
+    
+    def _on_ticker_array_message(self, message: list):
+        """处理全市场 Ticker 数组（每个元素与单个交易对的 Ticker 消息格式相同）"""
+        try:
+            for ticker in message:
+                symbol = ticker.get("s", "").upper()
+                self.ticker_cache[symbol] = ticker
+                self.price_cache[symbol] = float(ticker.get("c", 0))
+        except Exception as e:
+            logger.error(f"❌ 处理全市场Ticker消息失败: {e}", exc_info=True)
+    
+    def _on_mark_price_array_message(self, message: list):
+        """处理全市场标记价格数组"""
+        try:
+            funding_rates = {}
+            for item in message:
+                symbol = item.get("s", "").upper()
+                self.mark_price_cache[symbol] = {
+                    'mark_price': float(item.get("p", 0)),
+                    'index_price': float(item.get("i", 0)),
+                    'funding_rate': float(item.get("r") or 0),
+                    'next_funding_time': int(item.get("T", 0)),
+                }
+                if item.get("r"):
+                    funding_rates[symbol] = float(item["r"])
+            if funding_rates:
+                # 流推送的资金费率直接写入快照，快照不再需要 REST 刷新
+                self.derivatives.update_funding(funding_rates)
+        except Exception as e:
+            logger.error(f"❌ 处理全市场标记价格消息失败: {e}", exc_info=True)
+    
     def _on_ticker_message(self, message: dict):
         """处理Ticker消息"""
         try:
             symbol = message.get("s", "").upper()
-            with self._cache_lock:
-                self.ticker_cache[symbol] = message
-                self.price_cache[symbol] = float(message.get("c", 0))
+            self.ticker_cache[symbol] = message
+            self.price_cache[symbol] = float(message.get("c", 0))
         except Exception as e:
             logger.error(f"❌ 处理Ticker消息失败: {e}", exc_info=True)
     
-    def get_klines(self, symbol: str, interval: str, limit: int = 100) -> List[Kline]:
-        """获取缓存的K线数据（线程安全）"""
-        normalized_symbol = symbol.replace('/', '').upper()
-        cache_key = f"{normalized_symbol.lower()}_{interval}"
-        
-        with self._cache_lock:
-            klines = list(self.kline_cache.get(cache_key, deque()))
-            return klines[-limit:] if len(klines) > limit else klines
+    def get_klines(self, symbol: str, interval: str, limit: int = 100,
+                   include_forming: bool = False) -> List[Kline]:
+        """获取缓存的K线数据（线程安全，返回 Kline 列表；include_forming 时最后一根为未收盘K线）"""
+        return self.kline_store.get_klines(symbol, interval, limit, include_forming)
+    
+    def get_kline_arrays(self, symbol: str, interval: str, limit: int = 100,
+                         include_forming: bool = False) -> Optional[KlineArrays]:
+        """获取缓存的K线列式数据（线程安全，零拷贝只读视图；include_forming 时最后一根为未收盘K线）"""
+        return self.kline_store.get_arrays(symbol, interval, limit, include_forming)
+    
+    def get_indicators(self, symbol: str, interval: str,
+                       seed: bool = True) -> Optional[Dict[str, Optional[float]]]:
+        """获取增量指标引擎维护的最新指标（EMA20/50、MACD、RSI7/14、ATR3/14）
+
+        seed=False 时只读取已预热的指标，未预热返回 None（预热需要遍历全部缓存K线）
+        """
+        return self.indicator_engine.get(symbol, interval, seed)
     
     def get_latest_price(self, symbol: str) -> Optional[float]:
         """获取最新价格（线程安全）"""
         normalized_symbol = symbol.replace('/', '').upper()
-        with self._cache_lock:
-            return self.price_cache.get(normalized_symbol)
+        return self.price_cache.get(normalized_symbol)
     
     def get_ticker(self, symbol: str) -> Optional[dict]:
         """获取Ticker数据（线程安全）"""
         normalized_symbol = symbol.replace('/', '').upper()
-        with self._cache_lock:
-            return self.ticker_cache.get(normalized_symbol)
+        return self.ticker_cache.get(normalized_symbol)
+    
+    def get_mark_price(self, symbol: str) -> Optional[dict]:
+        """获取标记价格和资金费率（需开启全市场流模式）"""
+        normalized_symbol = symbol.replace('/', '').upper()
+        return self.mark_price_cache.get(normalized_symbol)
+    
+    def get_data_status(self, symbol: str) -> Optional[Dict]:
+        """获取交易对的数据新鲜度和完整性状态（未监控时返回 None）
+        
+        Returns:
+            complete: 所有周期都有数据、没有缺失的已收盘K线，且没有进行中的回补
+            fresh: 所有周期最新一根已收盘K线都已在缓存中
+            intervals: 各周期的详细状态（见 KlineBackfiller.status）
+        """
+        intervals = self._symbol_intervals.get(symbol)
+        if symbol not in self._monitored_symbols or not intervals:
+            return None
+        statuses = {interval: self.backfiller.status(symbol, interval) for interval in sorted(intervals)}
+        return {
+            'complete': all(
+                s['last_open_time'] is not None and s['missing_bars'] == 0 and not s['backfilling']
+                for s in statuses.values()
+            ),
+            'fresh': all(s['fresh'] for s in statuses.values()),
+            'intervals': statuses,
+        }
     
-    def is_monitoring(self, symbol: str) -> bool:
-        """检查是否正在监控某个交易对"""
-        return symbol in self._monitored_symbols
\ No newline at end of file
+    def get_lock_stats(self) -> Dict[str, float]:
+        """获取K线缓存锁的竞争统计（获取次数、等待次数、平均/最长等待时间）"""
+        return self.kline_store.lock_stats()
+    
+    def get_dispatch_stats(self) -> Optional[Dict]:
+        """获取回调分发队列的统计（排队深度、合并/丢弃条数），未开启分发线程时返回 None"""
+        return self.dispatcher.stats() if self.dispatcher is not None else None
+    
+    def is_running(self) -> bool:
+        """监控器是否在运行"""
+        return self._running
+    
+    def is_monitoring(self, symbol: str, owner: Optional[str] = None) -> bool:
+        """检查是否正在监控某个交易对（指定 owner 时检查该订阅者是否已登记）"""
+        if symbol not in self._monitored_symbols:
+            return False
+        return owner is None or owner in self._symbol_owners.get(symbol, set())
\ No newline at end of file
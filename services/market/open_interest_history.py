@@ -0,0 +1,195 @@
+"""
+持仓量历史 - 按交易对保存固定周期的持仓量采样（环形缓冲区）
+采样来自 DerivativesSnapshot 的定期刷新，首次出现的交易对用 openInterestHist 预热；
+滚动均值和变化量由运行中的累加值 O(1) 读取，告警和流动性过滤不再需要额外的 REST 请求
+"""
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+
+
+class OpenInterestRing:
+    """单个交易对的持仓量环形缓冲区（每个采样周期一个槽位）
+
+    同一周期内的多次采样只保留最新值；更早周期的采样被忽略。
+    槽位按周期对齐：中间缺失的周期写入 NaN，均值和最早值跳过缺失的周期；
+    间隔超过整个窗口（如停止跟踪后重新跟踪）时旧采样全部丢弃，重新开始累积。
+    """
+
+    def __init__(self, capacity: int, period_ms: int):
+        self.capacity = capacity
+        self.period_ms = period_ms
+        self._values = np.full(capacity, np.nan, dtype=np.float64)
+        self._head = 0  # 下一个写入位置
+        self._count = 0  # 已覆盖的周期数（含缺失的周期）
+        self._samples = 0  # 其中有采样的周期数
+        self._sum = 0.0
+        self._last_bucket: Optional[int] = None
+
+    def __len__(self) -> int:
+        return self._samples
+
+    @property
+    def full(self) -> bool:
+        """是否已覆盖整个窗口（窗口内最早和最新的周期都在缓冲区中）"""
+        return self._count == self.capacity
+
+    def clear(self):
+        self._values.fill(np.nan)
+        self._head = 0
+        self._count = 0
+        self._samples = 0
+        self._sum = 0.0
+        self._last_bucket = None
+
+    def record(self, timestamp_ms: int, value: float) -> bool:
+        """写入一次采样，返回是否被接受"""
+        bucket = timestamp_ms // self.period_ms
+        if self._last_bucket is not None and bucket < self._last_bucket:
+            return False
+        if bucket == self._last_bucket:
+            # 同一周期：替换最新值
+            index = (self._head - 1) % self.capacity
+            self._sum += value - self._values[index]
+            self._values[index] = value
+            return True
+
+        if self._last_bucket is not None:
+            gap = bucket - self._last_bucket
+            if gap >= self.capacity:
+                # 缓冲区里的采样都已在窗口之外
+                self.clear()
+            else:
+                for _ in range(gap - 1):
+                    self._push(np.nan)
+        self._push(value)
+        self._last_bucket = bucket
+        return True
+
+    def _push(self, value: float):
+        """写入下一个周期的槽位（NaN 表示该周期没有采样）"""
+        if self._count == self.capacity:
+            evicted = self._values[self._head]
+            if not np.isnan(evicted):
+                self._sum -= evicted
+                self._samples -= 1
+        else:
+            self._count += 1
+        self._values[self._head] = value
+        if not np.isnan(value):
+            self._sum += value
+            self._samples += 1
+        self._head = (self._head + 1) % self.capacity
+        if self._head == 0:
+            # 每写满一圈重新求和一次，消除累加的浮点误差
+            self._sum = float(np.nansum(self._values[:self._count]))
+
+    @property
+    def latest(self) -> Optional[float]:
+        # 最新的周期总是有采样（缺失的周期只在写入新采样前补齐）
+        return float(self._values[(self._head - 1) % self.capacity]) if self._samples else None
+
+    @property
+    def oldest(self) -> Optional[float]:
+        """窗口内最早的一个采样"""
+        if not self._samples:
+            return None
+        values = self.values()
+        return float(values[~np.isnan(values)][0])
+
+    @property
+    def average(self) -> Optional[float]:
+        return self._sum / self._samples if self._samples else None
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        return self._last_bucket * self.period_ms if self._last_bucket is not None else None
+
+    def values(self) -> np.ndarray:
+        """按时间升序的每个周期的采样值（副本，缺失的周期为 NaN）"""
+        start = (self._head - self._count) % self.capacity
+        return np.roll(self._values, -start)[:self._count].copy()
+
+
+class OpenInterestHistory:
+    """全部交易对的持仓量历史
+
+    - record(symbol, value, timestamp_ms)：写入一次采样
+    - seed(symbol, points)：用 openInterestHist 的历史数据预热（只在没有覆盖当前窗口的数据时写入）
+    - summary(symbol)：最新值、滚动均值、窗口内变化量和变化百分比（均值和变化量只在采样覆盖整个窗口后给出）
+    """
+
+    PERIOD = '5m'  # 采样周期（与 openInterestHist 的 period 参数一致）
+    PERIOD_MS = 300_000
+    WINDOW = 48  # 保留的采样数量（5m × 48 = 4 小时，与 4h K线对齐）
+
+    def __init__(self, window: int = WINDOW, period_ms: int = PERIOD_MS):
+        self.window = window
+        self.period_ms = period_ms
+        self._rings: Dict[str, OpenInterestRing] = {}
+        self._lock = threading.Lock()
+
+    def _ring(self, key: str) -> OpenInterestRing:
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = OpenInterestRing(self.window, self.period_ms)
+        return ring
+
+    def has(self, key: str, timestamp_ms: Optional[int] = None) -> bool:
+        """是否已有采样（给出 timestamp_ms 时要求最新采样仍在该时刻的窗口内）"""
+        ring = self._rings.get(key)
+        if ring is None or not len(ring):
+            return False
+        return timestamp_ms is None or timestamp_ms // self.period_ms - ring.last_timestamp // self.period_ms < self.window
+
+    def record(self, key: str, value: Optional[float], timestamp_ms: int):
+        """写入一次采样（None 或非正值忽略）"""
+        if value is None or value <= 0:
+            return
+        with self._lock:
+            self._ring(key).record(timestamp_ms, float(value))
+
+    def seed(self, key: str, points: Iterable[Tuple[int, float]]):
+        """用历史数据 [(timestamp_ms, 持仓量)] 预热（已有窗口内的采样时不覆盖，只剩过期采样时整体替换）"""
+        points = sorted(points)
+        if not points:
+            return
+        with self._lock:
+            if self.has(key, points[-1][0]):
+                return
+            ring = self._ring(key)
+            ring.clear()
+            for timestamp_ms, value in points:
+                if value and value > 0:
+                    ring.record(timestamp_ms, float(value))
+
+    def average(self, key: str) -> Optional[float]:
+        """窗口内的持仓量均值（采样尚未覆盖整个窗口时为 None）"""
+        ring = self._rings.get(key)
+        return ring.average if ring is not None and ring.full else None
+
+    def summary(self, key: str) -> Optional[Dict[str, Optional[float]]]:
+        """最新值、均值、窗口内变化量（最新 - 最早）和变化百分比
+
+        采样还没有覆盖整个窗口时（刚开始跟踪、或中断后重新跟踪），均值和变化量跨度不足一个窗口，
+        此时只给出最新值，其余为 None
+        """
+        with self._lock:
+            ring = self._rings.get(key)
+            if ring is None or not len(ring):
+                return None
+            latest, oldest = ring.latest, ring.oldest
+            full = ring.full
+            return {
+                'latest': latest,
+                'average': ring.average if full else None,
+                'delta': latest - oldest if full else None,
+                'change_pct': (latest / oldest - 1) * 100 if full and oldest else None,
+                'samples': len(ring),
+                'last_timestamp': ring.last_timestamp,
+            }
+
+    def remove(self, key: str):
+        """丢弃某个交易对的历史"""
+        with self._lock:
+            self._rings.pop(key, None)
@@ -0,0 +1,159 @@
+"""
+WebSocket 回调分发器 - 接收循环与同步回调之间按流划分的有界队列
+接收循环只负责入队，同步回调在独立的分发线程中执行，回调变慢（如等待缓存锁）时不再阻塞 socket 读取。
+
+合并策略（按消息内容决定）：
+- 已收盘的K线：从不丢弃
+- Ticker、未收盘K线等快照类消息：同一个流上只保留最新一条
+- 全市场数组流：只包含有变化的交易对，不能合并，按顺序排队，队列满时丢弃最旧的一条
+"""
+import threading
+from collections import deque
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+from utils.logger import logger
+
+
+class StreamDispatcher:
+    """同步回调的分发线程（可由多个 WSClient 共享）
+
+    start() 可重复调用；由创建者负责 stop()。
+    """
+
+    MAX_QUEUE_SIZE = 64  # 每个流最多排队的消息数（已收盘K线不受限制）
+
+    KEEP = "keep"  # 从不丢弃
+    LATEST = "latest"  # 只保留最新一条
+    QUEUE = "queue"  # 排队，满时丢弃最旧的一条
+
+    def __init__(self, max_queue_size: int = MAX_QUEUE_SIZE, name: str = "WSDispatcher"):
+        self.max_queue_size = max_queue_size
+        self.name = name
+        # 流 -> [(回调列表, 消息, 合并策略)]
+        self._queues: Dict[Hashable, deque] = {}
+        self._ready: deque = deque()  # 有待处理消息的流（轮转处理，避免单个流占满分发线程）
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        # 统计
+        self.enqueued = 0
+        self.processed = 0
+        self.coalesced = 0  # 被同一个流上更新的消息替换掉的条数
+        self.dropped = 0  # 队列满时丢弃的条数
+        self.max_depth = 0  # 单个流出现过的最大排队深度
+        self._dropped_by_stream: Dict[Hashable, int] = {}
+
+    @classmethod
+    def message_policy(cls, payload) -> str:
+        """按消息内容确定合并策略"""
+        if type(payload) is list:
+            return cls.QUEUE
+        if payload.get("e") == "kline" and payload["k"].get("x"):
+            return cls.KEEP
+        return cls.LATEST
+
+    def start(self):
+        """启动分发线程"""
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5):
+        """停止分发线程（未处理的消息被丢弃）"""
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        with self._condition:
+            self._queues.clear()
+            self._ready.clear()
+
+    def submit(self, stream: Hashable, handlers: List[Tuple[Callable, bool]], payload):
+        """把一条消息放入流的队列（在接收循环中调用，只做入队）"""
+        policy = self.message_policy(payload)
+        with self._condition:
+            self.enqueued += 1
+            queue = self._queues.get(stream)
+            if queue is None:
+                queue = self._queues[stream] = deque()
+
+            if policy == self.LATEST and queue and queue[-1][2] == self.LATEST:
+                # 尚未处理的旧快照直接被最新一条替换
+                queue[-1] = (handlers, payload, policy)
+                self.coalesced += 1
+                return
+
+            queue.append((handlers, payload, policy))
+            if len(queue) > self.max_queue_size:
+                self._drop_oldest(stream, queue)
+            if len(queue) > self.max_depth:
+                self.max_depth = len(queue)
+            if len(queue) == 1:
+                self._ready.append(stream)
+                self._condition.notify()
+
+    def _drop_oldest(self, stream: Hashable, queue: deque):
+        """丢弃最旧的一条可丢弃消息（调用方持有锁；全是已收盘K线时不丢弃）"""
+        for index, (_, _, policy) in enumerate(queue):
+            if policy != self.KEEP:
+                del queue[index]
+                self.dropped += 1
+                self._dropped_by_stream[stream] = self._dropped_by_stream.get(stream, 0) + 1
+                return
+
+    def depth(self, stream: Hashable) -> int:
+        """某个流当前的排队深度"""
+        with self._condition:
+            queue = self._queues.get(stream)
+            return len(queue) if queue else 0
+
+    def stats(self) -> Dict:
+        """队列深度与丢弃统计"""
+        with self._condition:
+            return {
+                'streams': len(self._queues),
+                'pending': sum(len(queue) for queue in self._queues.values()),
+                'max_depth': self.max_depth,
+                'enqueued': self.enqueued,
+                'processed': self.processed,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'dropped_by_stream': {str(stream): count for stream, count in self._dropped_by_stream.items()},
+            }
+
+    def _next(self):
+        """取出下一条待处理消息（无消息时等待），停止后返回 None"""
+        with self._condition:
+            while self._running and not self._ready:
+                self._condition.wait()
+            if not self._running:
+                return None
+            stream = self._ready.popleft()
+            queue = self._queues[stream]
+            item = queue.popleft()
+            if queue:
+                self._ready.append(stream)
+            return item
+
+    def _run(self):
+        """分发线程主循环"""
+        while True:
+            item = self._next()
+            if item is None:
+                break
+            handlers, payload, _ = item
+            for callback, is_coroutine in handlers:
+                if is_coroutine:
+                    continue  # 协程回调由 WSClient 在事件循环中直接调用
+                try:
+                    callback(payload)
+                except Exception as e:
+                    logger.error(f"回调函数执行失败: {e}", exc_info=True)
+            self.processed += 1
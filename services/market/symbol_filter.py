@@ -2,11 +2,14 @@
 币种筛选器 - 管理筛选后的币种列表（对应 Nofx 的 FilterSymbol）
 整合了币种评分功能
 """
+import heapq
 import threading
 import time
-from typing import List, Optional
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
 from utils.logger import logger
-from services.market.indicators import IndicatorCalculator
+from services.market.indicators import IndicatorCalculator, VectorIndicatorCalculator
 from services.market.feature_engine import FeatureEngine
 from services.market.api_client import APIClient
 
@@ -17,10 +20,18 @@ if TYPE_CHECKING:
 
 
 class SymbolFilter:
-    """币种筛选器 - 管理筛选后的币种列表（整合了评分功能）"""
+    """币种筛选器 - 管理筛选后的币种列表（整合了评分功能）
+    
+    由 MarketMonitor 的K线收盘事件驱动：只对K线发生变化的币种重新评分，
+    其余币种沿用上次的分数，Top N 通过堆从全部分数中选出。
+    币种第一次评分后在增量指标引擎中预热，之后的评分直接读取 O(1) 更新的指标。
+    """
     
     # 筛选配置常量
     TOP_N = 20  # 选择Top N个币种
+    SCORED_INTERVALS = ("3m", "4h")  # 参与评分的K线周期
+    DEBOUNCE_SECONDS = 1.0  # 收到收盘事件后稍等，合并同一时刻收盘的一批K线
+    IDLE_CHECK_SECONDS = 1.0  # 无事件时检查停止标志的间隔
     
     def __init__(
         self, 
@@ -32,23 +43,33 @@ class SymbolFilter:
         """初始化币种筛选器
         
         Args:
-            market_monitor: 市场监控器，用于获取K线数据
+            market_monitor: 市场监控器，用于获取K线数据和K线收盘事件
             api_client: API客户端（用于FeatureEngine，可选）
             all_symbols: 所有可交易币种列表
             running_flag: 运行标志，用于控制筛选任务的生命周期
         """
         self.market_monitor = market_monitor
-        self.all_symbols = all_symbols or []
         self.running_flag = running_flag
         
-        # 初始化FeatureEngine（如果提供了api_client）
+        # 初始化FeatureEngine（如果提供了api_client；批量评分不依赖它）
         self.feature_engine = None
         if api_client:
-            self.feature_engine = FeatureEngine(api_client)
+            self.feature_engine = FeatureEngine(api_client, vectorized=True)
         
         # 筛选后的币种列表（对应 Nofx 的 FilterSymbol）
         self.filtered_symbols: List[str] = []
         self._filtered_symbols_lock = threading.Lock()
+        self._ranking_ready = threading.Event()  # 第一次产生非空排名后置位
+        
+        # 增量评分状态
+        self._scores: Dict[str, int] = {}  # 币种 -> 最近一次评分（只在筛选线程中读写）
+        self._dirty: Set[str] = set()  # 等待重新评分的币种
+        self._dirty_lock = threading.Lock()
+        self._dirty_event = threading.Event()
+        self._symbol_index: Dict[str, str] = {}  # BTCUSDT -> BTC/USDT
+        self._symbol_order: Dict[str, int] = {}  # 币种在 all_symbols 中的位置（分数相同时的排序依据）
+        self._all_symbols: List[str] = []
+        self.all_symbols = all_symbols or []
         
         # 筛选任务线程
         self._filtering_thread: Optional[threading.Thread] = None
@@ -56,8 +77,44 @@ class SymbolFilter:
         
         logger.info("SymbolFilter 初始化完成（整合评分功能）")
     
+    @property
+    def all_symbols(self) -> List[str]:
+        """所有可交易币种列表"""
+        return self._all_symbols
+    
+    @all_symbols.setter
+    def all_symbols(self, symbols: List[str]):
+        """更新币种列表：所有币种标记为待评分，筛选任务会在下一轮重新排名"""
+        symbols = list(symbols or [])
+        with self._dirty_lock:
+            self._all_symbols = symbols
+            self._symbol_index = {symbol.replace('/', '').upper(): symbol for symbol in symbols}
+            self._symbol_order = {symbol: i for i, symbol in enumerate(symbols)}
+            self._dirty.update(symbols)
+        self._dirty_event.set()
+    
+    def add_symbols(self, symbols: List[str]):
+        """把新加载完数据的币种加入币种列表并标记为待评分（历史数据逐个加载时调用）
+        
+        筛选任务在下一轮只对这些币种评分，并立即发布包含它们的部分排名，无需等待全部币种加载完成
+        """
+        with self._dirty_lock:
+            new_symbols = [symbol for symbol in symbols if symbol not in self._symbol_order]
+            if new_symbols:
+                # 复制后整体替换，筛选线程持有的旧引用不受影响
+                symbol_index = dict(self._symbol_index)
+                symbol_order = dict(self._symbol_order)
+                for symbol in new_symbols:
+                    symbol_index[symbol.replace('/', '').upper()] = symbol
+                    symbol_order[symbol] = len(symbol_order)
+                self._all_symbols = self._all_symbols + new_symbols
+                self._symbol_index = symbol_index
+                self._symbol_order = symbol_order
+            self._dirty.update(symbols)
+        self._dirty_event.set()
+    
     def start(self):
-        """启动筛选任务（后台定期更新 filtered_symbols，类似 Nofx 的定时更新）"""
+        """启动筛选任务（后台监听K线收盘事件，增量更新 filtered_symbols）"""
         if self._running:
             logger.warning("筛选任务已在运行")
             return
@@ -67,37 +124,31 @@ class SymbolFilter:
             return
         
         self._running = True
+        self.market_monitor.add_kline_listener(self._on_kline_closed)
         
         def filtering_loop():
-            logger.info("🚀 币种筛选任务已启动")
+            logger.info("🚀 币种筛选任务已启动（K线收盘事件驱动）")
             
             while self._running:
                 # 检查外部停止标志
-                if self.running_flag and self.running_flag.is_set():
+                if self._should_stop():
                     logger.info("收到停止信号，筛选任务将退出")
                     break
                 
+                if not self._dirty_event.wait(timeout=self.IDLE_CHECK_SECONDS):
+                    continue
+                
+                # 同一时刻收盘的K线会陆续到达，稍等片刻合并成一批再评分
+                if self._pause(self.DEBOUNCE_SECONDS):
+                    break
+                
                 try:
-                    # 执行筛选
-                    filtered = self._perform_filtering()
-                    
-                    with self._filtered_symbols_lock:
-                        self.filtered_symbols = filtered
-                    
-                    logger.info(f"✅ 币种筛选完成，筛选出 {len(filtered)} 个币种")
+                    self._rescore_dirty()
                 except Exception as e:
                     logger.error(f"❌ 币种筛选失败: {e}", exc_info=True)
-                
-                # 每分钟更新一次（类似 Nofx 的 time.Sleep(1 * time.Minute)）
-                # 使用 running_flag 的 wait 方法，可以响应停止信号
-                if self.running_flag:
-                    if self.running_flag.wait(timeout=60):
-                        # 如果 wait 返回 True，说明收到了停止信号
-                        break
-                else:
-                    time.sleep(60)
             
             self._running = False
+            self.market_monitor.remove_kline_listener(self._on_kline_closed)
             logger.info("筛选任务已停止")
         
         self._filtering_thread = threading.Thread(
@@ -113,6 +164,7 @@ class SymbolFilter:
             return
         
         self._running = False
+        self._dirty_event.set()  # 唤醒等待中的筛选线程
         
         if self._filtering_thread:
             self._filtering_thread.join(timeout=10)
@@ -125,41 +177,98 @@ class SymbolFilter:
         with self._filtered_symbols_lock:
             return self.filtered_symbols.copy()
     
-    def _perform_filtering(self) -> List[str]:
-        """执行筛选逻辑
+    def wait_for_ranking(self, timeout: float) -> List[str]:
+        """等待第一次排名完成（已有排名时立即返回）
         
+        Args:
+            timeout: 最长等待时间（秒）
+            
         Returns:
-            筛选后的币种列表（Top N）
+            筛选后的币种列表，超时仍无排名时为空列表
         """
-        # 如果 all_symbols 为空，等待数据准备好（数据正在后台加载）
-        if not self.all_symbols:
-            logger.debug("⏳ 等待币种数据加载完成...")
-            return []  # 返回空列表，等待下次循环
-        
-        # 获取要评分的币种列表
-        symbols_to_score = self.all_symbols if self.all_symbols else list(self.market_monitor._monitored_symbols)
-        
-        if not symbols_to_score:
-            logger.warning("⚠️ 没有可评分的币种")
-            return []
+        self._ranking_ready.wait(timeout)
+        return self.get_filtered_symbols()
+    
+    def _should_stop(self) -> bool:
+        return bool(self.running_flag and self.running_flag.is_set())
+    
+    def _pause(self, seconds: float) -> bool:
+        """等待一段时间，期间收到停止信号时返回 True"""
+        if self.running_flag:
+            return self.running_flag.wait(timeout=seconds)
+        time.sleep(seconds)
+        return not self._running
+    
+    def _on_kline_closed(self, symbol: str, interval: str, open_time: int):
+        """K线收盘事件回调（行情回调线程中调用，只做标记）"""
+        if interval not in self.SCORED_INTERVALS:
+            return
+        original = self._symbol_index.get(symbol.replace('/', '').upper())
+        if original is None:
+            return
+        with self._dirty_lock:
+            self._dirty.add(original)
+        self._dirty_event.set()
+    
+    def _rescore_dirty(self) -> List[str]:
+        """对待评分的币种重新评分并更新 Top N
         
-        # 使用技术指标进行评分
-        scored_coins = self._score_symbols(symbols_to_score)
+        Returns:
+            更新后的筛选结果（Top N）
+        """
+        with self._dirty_lock:
+            self._dirty_event.clear()
+            dirty = self._dirty
+            self._dirty = set()
+            universe = self._symbol_order
         
-        if not scored_coins:
-            logger.warning("⚠️ 评分结果为空")
-            return []
+        symbols = sorted((symbol for symbol in dirty if symbol in universe), key=universe.get)
+        scored_coins = self._score_symbols(symbols) if symbols else []
         
-        # 按分数排序，选择Top N
-        scored_coins.sort(key=lambda x: x.get('score', 0), reverse=True)
-        top_symbols = [coin.get('symbol') for coin in scored_coins[:self.TOP_N] if coin.get('symbol')]
+        # 重新评分失败（如数据不足）的币种移出排名，已不在币种列表中的也一并移除
+        for symbol in symbols:
+            self._scores.pop(symbol, None)
+        for symbol in [s for s in self._scores if s not in universe]:
+            del self._scores[symbol]
+        for coin in scored_coins:
+            self._scores[coin['symbol']] = coin['score']
         
-        logger.debug(f"📊 技术指标评分Top {self.TOP_N}: {[(c.get('symbol', 'N/A'), c.get('score', 0)) for c in scored_coins[:self.TOP_N]]}")
+        top_symbols = self._top_symbols()
+        with self._filtered_symbols_lock:
+            self.filtered_symbols = top_symbols
+        if top_symbols:
+            self._ranking_ready.set()
         
+        logger.info(f"✅ 币种筛选完成，重新评分 {len(symbols)} 个币种，筛选出 {len(top_symbols)} 个币种")
+        # 排名发布之后再预热增量指标，下一次收盘事件的评分不再重算整段序列
+        self._seed_indicators(coin['symbol'] for coin in scored_coins)
         return top_symbols
     
+    def _seed_indicators(self, symbols: Iterable[str]):
+        """在增量指标引擎中预热这些币种的评分周期（已预热的直接跳过）"""
+        for symbol in symbols:
+            for interval in self.SCORED_INTERVALS:
+                if self.market_monitor.get_indicators(symbol, interval, seed=False) is None:
+                    self.market_monitor.get_indicators(symbol, interval)
+    
+    def _seeded_indicators(self, symbol: str) -> Optional[Tuple[dict, dict]]:
+        """增量指标引擎中已预热的 (3m, 4h) 指标，任一周期未预热时返回 None"""
+        indicators = tuple(
+            self.market_monitor.get_indicators(symbol, interval, seed=False)
+            for interval in self.SCORED_INTERVALS
+        )
+        return None if any(values is None for values in indicators) else indicators
+    
+    def _top_symbols(self) -> List[str]:
+        """从全部分数中选出 Top N（堆选择，分数相同时按 all_symbols 中的顺序）"""
+        order = self._symbol_order
+        top = heapq.nlargest(self.TOP_N, self._scores.items(),
+                             key=lambda item: (item[1], -order.get(item[0], len(order))))
+        logger.debug(f"📊 技术指标评分Top {self.TOP_N}: {top}")
+        return [symbol for symbol, _ in top]
+    
     def _score_symbols(self, symbols: List[str]) -> List[dict]:
-        """批量评分币种（使用技术指标）
+        """批量评分币种（横截面向量化：所有币种的收盘价堆叠成 币种 × K线 矩阵一次计算）
         
         Args:
             symbols: 要评分的币种列表
@@ -167,39 +276,89 @@ class SymbolFilter:
         Returns:
             评分结果列表，每个元素包含 {'symbol': str, 'score': int}
         """
-        scored_coins = []
-        
         logger.info(f"📊 开始使用技术指标对 {len(symbols)} 个币种进行评分...")
         
+        scored_symbols = []
+        closes_3m = []
+        closes_4h = []
+        seeded = []  # 增量指标引擎中已预热的 (3m, 4h) 指标，未预热的币种为 None
         for symbol in symbols:
-            try:
-                klines_3m = self.market_monitor.get_klines(symbol, "3m", limit=100)
-                klines_4h = self.market_monitor.get_klines(symbol, "4h", limit=100)
-                
-                # 使用FeatureEngine计算特征（轻量级模式，跳过API调用）
-                if self.feature_engine:
-                    features = self.feature_engine.calculate_features(
-                        symbol, klines_3m, klines_4h, skip_api_calls=True
-                    )
-                    if not features:
-                        continue
-                    score = self._calculate_score_from_features(features)
-                else:
-                    # FeatureEngine不可用，跳过该币种
-                    logger.warning(f"⚠️ {symbol} FeatureEngine不可用，跳过评分（建议检查配置）")
-                    continue
-                
-                scored_coins.append({
-                    'symbol': symbol,
-                    'score': score
-                })
-            except Exception as e:
-                logger.debug(f"⚠️ {symbol} 评分失败: {e}")
+            arrays_3m = self.market_monitor.get_kline_arrays(symbol, "3m", limit=100)
+            arrays_4h = self.market_monitor.get_kline_arrays(symbol, "4h", limit=100)
+            # 与 FeatureEngine 相同的数据量要求
+            if (arrays_3m is None or arrays_4h is None or
+                    len(arrays_3m) < FeatureEngine.MIN_KLINES_REQUIRED or
+                    len(arrays_4h) < FeatureEngine.MIN_KLINES_REQUIRED):
                 continue
+            scored_symbols.append(symbol)
+            closes_3m.append(arrays_3m.close)
+            closes_4h.append(arrays_4h.close)
+            seeded.append(self._seeded_indicators(symbol))
+        
+        if not scored_symbols:
+            logger.info("✅ 技术指标评分完成，共评分 0 个币种")
+            return []
+        
+        latest_3m = self._latest_indicators(closes_3m, [values and values[0] for values in seeded])
+        latest_4h = self._latest_indicators(closes_4h, [values and values[1] for values in seeded])
+        scores = self._calculate_scores(latest_3m['close'], latest_3m, latest_4h)
         
+        scored_coins = [
+            {'symbol': symbol, 'score': int(score)}
+            for symbol, score in zip(scored_symbols, scores)
+        ]
         logger.info(f"✅ 技术指标评分完成，共评分 {len(scored_coins)} 个币种")
         return scored_coins
     
+    @staticmethod
+    def _latest_indicators(closes: List[np.ndarray],
+                           incremental: Optional[List[Optional[dict]]] = None) -> Dict[str, np.ndarray]:
+        """计算每个币种最新的 EMA20 / MACD / RSI14（按K线数量分组堆叠成矩阵，沿时间轴计算）
+        
+        incremental 中不为 None 的币种直接使用增量指标引擎的值，不参与矩阵计算。
+        数据不足时的取值与 FeatureEngine 一致（MACD 少于 34 根为 0.0）
+        """
+        count = len(closes)
+        latest = {name: np.zeros(count) for name in ('close', 'ema20', 'macd', 'rsi14')}
+        
+        groups = defaultdict(list)
+        for index, close in enumerate(closes):
+            values = incremental[index] if incremental else None
+            if values is None:
+                groups[len(close)].append(index)
+                continue
+            latest['close'][index] = close[-1]
+            latest['ema20'][index] = np.nan if values['ema20'] is None else values['ema20']
+            latest['rsi14'][index] = np.nan if values['rsi14'] is None else values['rsi14']
+            latest['macd'][index] = values['macd'] or 0.0
+        
+        for length, indices in groups.items():
+            matrix = np.vstack([closes[i] for i in indices])
+            latest['close'][indices] = matrix[:, -1]
+            latest['ema20'][indices] = VectorIndicatorCalculator.ema(matrix, FeatureEngine.EMA_SHORT_PERIOD)[:, -1]
+            latest['rsi14'][indices] = VectorIndicatorCalculator.rsi(matrix, FeatureEngine.RSI_LONG_PERIOD)[:, -1]
+            if length >= 34:
+                latest['macd'][indices] = VectorIndicatorCalculator.macd(matrix)[:, -1]
+        return latest
+    
+    @staticmethod
+    def _calculate_scores(price: np.ndarray, latest_3m: Dict[str, np.ndarray],
+                          latest_4h: Dict[str, np.ndarray]) -> np.ndarray:
+        """_calculate_score_from_features 的数组版本（规则完全相同）"""
+        rsi_3m = latest_3m['rsi14']
+        rsi_4h = latest_4h['rsi14']
+        with np.errstate(invalid='ignore'):
+            score = (
+                50
+                + np.where(price > latest_3m['ema20'], 10, -10)
+                + np.where(price > latest_4h['ema20'], 15, -15)
+                + np.where(latest_3m['macd'] > 0, 10, -10)
+                + np.where(latest_4h['macd'] > 0, 15, -15)
+                + np.where((rsi_3m > 30) & (rsi_3m < 70), 5, 0)
+                + np.where((rsi_4h > 30) & (rsi_4h < 70), 5, 0)
+            )
+        return np.clip(score, 0, 100)
+    
     def _calculate_score_from_features(self, features) -> int:
         """基于MarketFeatures计算评分（KISS原则：简单直接的算法）"""
         score = 50  # 基础分
@@ -0,0 +1,164 @@
+"""
+REST 请求权重调度器 - 按交易所共享的令牌桶（进程内每个交易所一个）
+每个请求先按权重取得令牌；交易所返回的 X-MBX-USED-WEIGHT-1M 用于校准剩余额度，
+429/418 时全局暂停并降低并发。等待中的请求按优先级排队（候选币种优先）
+"""
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Set, Tuple
+from utils.logger import logger
+
+
+def kline_weight(limit: int) -> int:
+    """币安现货 K线接口（/api/v3/klines，APIClient 使用 ccxt.binance() 现货接口）的请求权重
+
+    现货K线每次请求固定权重 2，与 limit（最大 1000）无关
+    """
+    return 2
+
+
+class WeightScheduler:
+    """请求权重令牌桶 + 自适应并发
+
+    - slot(weight, priority)：取得令牌和并发名额后执行请求，结束后释放名额
+    - observe(used_weight)：用响应头中的已用权重校准令牌（令牌数不超过交易所报告的剩余额度）
+    - penalize(retry_after)：收到 429/418 后暂停所有请求，令牌清零，并发减半
+    - 并发名额在令牌充足时逐步增加（加性增、乘性减）
+    """
+
+    WEIGHT_LIMIT = 6000  # 每分钟权重上限（币安现货 /api/v3 的 REQUEST_WEIGHT IP 限额）
+    SAFETY_RATIO = 0.8  # 只使用上限的一部分，给 WebSocket 重连、下单等请求留出余量
+    WINDOW_SECONDS = 60
+    INITIAL_CONCURRENCY = 5
+    MIN_CONCURRENCY = 1
+    MAX_CONCURRENCY = 20
+    DEFAULT_BACKOFF_SECONDS = 30  # 429 未带 Retry-After 时的暂停时间
+
+    HIGH = 0  # 候选币种、持仓币种
+    NORMAL = 1
+    LOW = 2
+
+    _instances: Dict[str, 'WeightScheduler'] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, weight_limit: int = WEIGHT_LIMIT, window_seconds: float = WINDOW_SECONDS):
+        self.capacity = weight_limit * self.SAFETY_RATIO
+        self.refill_per_second = self.capacity / window_seconds
+        self._tokens = self.capacity
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self.concurrency = self.INITIAL_CONCURRENCY
+        self._in_flight = 0
+        self._waiting = []  # (priority, seq) 最小堆
+        self._abandoned: Set[Tuple[int, int]] = set()  # 未轮到就离开的条目（到达堆顶时再删除）
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+
+        # 统计
+        self.granted = 0
+        self.granted_weight = 0
+        self.rate_limited = 0
+        self.last_used_weight: Optional[int] = None
+
+    @classmethod
+    def for_exchange(cls, exchange: str = "binance") -> 'WeightScheduler':
+        """获取交易所对应的进程内共享调度器"""
+        scheduler = cls._instances.get(exchange)
+        if scheduler is None:
+            with cls._instances_lock:
+                scheduler = cls._instances.setdefault(exchange, cls())
+        return scheduler
+
+    def _refill(self, now: float):
+        """按时间补充令牌（调用方持有锁）"""
+        if now > self._refilled_at:  # 暂停期间 _refilled_at 在将来，不补充
+            self._tokens = min(self.capacity, self._tokens + (now - self._refilled_at) * self.refill_per_second)
+            self._refilled_at = now
+
+    def acquire(self, weight: int, priority: int = NORMAL):
+        """阻塞直到轮到该请求，且令牌和并发名额都足够"""
+        entry = (priority, next(self._seq))
+        with self._condition:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiting[0] == entry and self._in_flight < self.concurrency:
+                        if now < self._paused_until:
+                            wait = self._paused_until - now
+                        elif self._tokens >= weight:
+                            self._tokens -= weight
+                            self._in_flight += 1
+                            self.granted += 1
+                            self.granted_weight += weight
+                            return
+                        else:
+                            wait = (weight - self._tokens) / self.refill_per_second
+                        self._condition.wait(timeout=wait)
+                    else:
+                        self._condition.wait()
+            finally:
+                # 放行的条目一定在堆顶，直接弹出；中途离开的条目延迟删除，避免 O(n) 的查找和重建堆
+                if self._waiting[0] == entry:
+                    heapq.heappop(self._waiting)
+                else:
+                    self._abandoned.add(entry)
+                while self._waiting and self._waiting[0] in self._abandoned:
+                    self._abandoned.discard(heapq.heappop(self._waiting))
+                self._condition.notify_all()
+
+    def release(self):
+        """请求结束，归还并发名额；令牌充足时增加一个并发名额"""
+        with self._condition:
+            self._in_flight -= 1
+            if self._tokens > self.capacity / 2 and self.concurrency < self.MAX_CONCURRENCY:
+                self.concurrency += 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, weight: int, priority: int = NORMAL):
+        """取得令牌执行一个请求"""
+        self.acquire(weight, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def observe(self, used_weight: int):
+        """用交易所报告的已用权重校准令牌"""
+        with self._condition:
+            self.last_used_weight = used_weight
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, self.capacity - used_weight)
+
+    def penalize(self, retry_after: Optional[float] = None):
+        """收到 429/418：暂停所有请求，令牌清零，并发减半"""
+        seconds = retry_after if retry_after else self.DEFAULT_BACKOFF_SECONDS
+        with self._condition:
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._refilled_at = self._paused_until
+            self.concurrency = max(self.MIN_CONCURRENCY, self.concurrency // 2)
+            self._condition.notify_all()
+        logger.warning(f"⚠️ REST 请求触发限频，暂停 {seconds:.0f} 秒（并发降为 {self.concurrency}）")
+
+    def stats(self) -> Dict:
+        """令牌、并发和限频统计"""
+        with self._condition:
+            self._refill(time.monotonic())
+            return {
+                'tokens': self._tokens,
+                'capacity': self.capacity,
+                'concurrency': self.concurrency,
+                'in_flight': self._in_flight,
+                'waiting': len(self._waiting) - len(self._abandoned),
+                'granted': self.granted,
+                'granted_weight': self.granted_weight,
+                'rate_limited': self.rate_limited,
+                'last_used_weight': self.last_used_weight,
+            }
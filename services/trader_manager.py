@@ -17,6 +17,7 @@ from models.system_config import SystemConfig
 from models.exchange import Exchange
 from models.signal_source import UserSignalSource
 from services.Auto_trader import AutoTrader
+from services.market.market_hub import MarketDataHub
 
 
 class TraderManager:
@@ -25,6 +26,8 @@ class TraderManager:
         self.prompt_service = PromptService(settings)
         self.traders: Dict[str, AutoTrader] = {}
         self._lock = threading.Lock()
+        # 进程级行情数据中心：所有交易员共享同一个 MarketMonitor（WebSocket 连接和K线缓存）
+        self.market_hub = MarketDataHub.instance()
 
     def load_traders_from_database(self):
     #从数据库加载交易员
@@ -316,7 +319,7 @@ class TraderManager:
         
         # 创建 trader 实例（这里需要实现 AutoTrader 类）
         try:
-            auto_trader = AutoTrader(trader_config, self.settings)
+            auto_trader = AutoTrader(trader_config, self.settings, market_hub=self.market_hub)
             # 修复：确保 key 是字符串
             trader_id_str = str(trader_id) if trader_id else None
             if not trader_id_str:
@@ -32,6 +32,15 @@ def cleanup_test_data(db_session):
     pass
 
 
+@pytest.fixture(autouse=True)
+def isolated_markets_cache():
+    """每个测试使用独立的进程级市场数据缓存（不读写磁盘快照）"""
+    from services.market.markets_cache import MarketsCache
+    MarketsCache._instance = MarketsCache()
+    yield MarketsCache._instance
+    MarketsCache._instance = None
+
+
 # ========== Trader测试相关fixtures ==========
 
 @pytest.fixture
@@ -0,0 +1,156 @@
+"""
+AsyncAPIClient 测试（交易所实例打桩，不访问网络）
+- 同步接口与 APIClient 一致
+- 批量请求在客户端事件循环中并发执行，并受最大并发数限制
+"""
+import asyncio
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from services.market.async_api_client import AsyncAPIClient
+from services.market.historical_loader import HistoricalDataLoader
+from services.market.kline_store import KlineStore
+from services.market.monitor import MarketMonitor
+
+REQUEST_DELAY_SECONDS = 0.05
+
+
+class FakeAsyncExchange:
+    """模拟 ccxt.async_support.binance，记录同时进行的请求数"""
+
+    def __init__(self, config):
+        self.config = config
+        self.markets = {}
+        self.active = 0
+        self.peak = 0
+        self.closed = False
+        self.load_count = 0
+
+    async def load_markets(self, reload=False):
+        self.load_count += 1
+        self.markets = {"BTC/USDT:USDT": {"symbol": "BTC/USDT:USDT", "type": "swap", "settle": "USDT", "active": True}}
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = {market["symbol"]: market for market in markets}
+
+    async def _delay(self):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(REQUEST_DELAY_SECONDS)
+        self.active -= 1
+
+    async def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        await self._delay()
+        if symbol.startswith("BAD"):
+            raise RuntimeError("bad symbol")
+        start = since or 1_700_000_000_000
+        return [[start + i * 180_000, 1.0, 2.0, 0.5, 1.5, 10.0] for i in range(limit)]
+
+    async def fetch_open_interest(self, symbol):
+        await self._delay()
+        return {"openInterestAmount": 123.0}
+
+    async def fetch_funding_rate(self, symbol):
+        await self._delay()
+        assert symbol == "BTC/USDT:USDT"
+        return {"fundingRate": 0.0001}
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def client():
+    with patch("services.market.async_api_client.ccxt_async.binance", FakeAsyncExchange):
+        api_client = AsyncAPIClient()
+        yield api_client
+        api_client.close()
+
+
+class TestAsyncAPIClient:
+    """异步客户端"""
+
+    def test_exchange_uses_shared_session(self, client):
+        assert client.exchange.config["session"] is client._session
+        assert client.exchange.config["enableRateLimit"] is True
+
+    def test_sync_wrappers(self, client):
+        klines = client.get_Klines("BTC/USDT", "3m", limit=5, since=1_700_000_000_000)
+        assert [k.open_time for k in klines] == [1_700_000_000_000 + i * 180_000 for i in range(5)]
+        assert klines[0].close_time == 1_700_000_000_000 + 179_999
+        assert client.get_Klines("BAD/USDT", "3m") is None
+        assert client.get_derivatives("BTC/USDT") == (123.0, 0.0001)
+
+    def test_batch_is_concurrent_and_bounded(self, client):
+        requests = [(f"SYM{i}/USDT", "3m", 10) for i in range(30)]
+
+        started = time.perf_counter()
+        results = client.get_klines_many(requests)
+        elapsed = time.perf_counter() - started
+
+        assert all(len(klines) == 10 for klines in results)
+        assert client.exchange.peak == AsyncAPIClient.MAX_CONCURRENT_REQUESTS
+        # 串行需要 30 * 0.05 = 1.5 秒
+        assert elapsed < len(requests) * REQUEST_DELAY_SECONDS / 2
+
+    def test_async_methods_from_another_loop(self, client):
+        async def run():
+            return await asyncio.gather(
+                client.get_klines_async("BTC/USDT", "4h", limit=3),
+                client.get_open_interest_async("BTC/USDT"),
+                client.get_funding_rate_async("BTC/USDT"),
+            )
+
+        klines, open_interest, funding_rate = asyncio.run(run())
+        assert len(klines) == 3
+        assert (open_interest, funding_rate) == (123.0, 0.0001)
+
+    def test_markets_shared_between_clients(self, client):
+        """第二个客户端从共享缓存装入市场数据，不再下载"""
+        assert client.exchange.load_count == 1
+        with patch("services.market.async_api_client.ccxt_async.binance", FakeAsyncExchange):
+            second = AsyncAPIClient()
+        try:
+            assert second.exchange.load_count == 0
+            assert list(second.exchange.markets) == ["BTC/USDT:USDT"]
+        finally:
+            second.close()
+
+    def test_close_releases_session(self, client):
+        exchange, session = client.exchange, client._session
+        client.close()
+        assert exchange.closed
+        assert session.closed
+
+    def test_reopen_after_close(self, client):
+        client.close()
+        assert client.is_closed()
+        with patch("services.market.async_api_client.ccxt_async.binance", FakeAsyncExchange):
+            client.reopen()
+        assert not client.is_closed()
+        assert client.get_open_interest("BTC/USDT") == 123.0
+
+    def test_monitor_stop_closes_client(self):
+        """MarketMonitor 停止时关闭异步客户端，重新启动时恢复"""
+        with patch("services.market.async_api_client.ccxt_async.binance", FakeAsyncExchange), \
+                patch.object(MarketMonitor, "_run_event_loop"):
+            monitor = MarketMonitor({'async_rest_client': True})
+            monitor.start()
+            monitor.stop()
+            assert monitor.api_client.is_closed()
+            monitor.start()
+            assert not monitor.api_client.is_closed()
+            monitor.stop()
+        assert monitor.api_client.is_closed()
+
+    def test_historical_loader_uses_batch_path(self, client):
+        store = KlineStore()
+        client.get_klines_many = MagicMock(wraps=client.get_klines_many)
+        loader = HistoricalDataLoader(client)
+
+        loaded = loader.load_historical_data(["BTC/USDT", "BAD/USDT", "ETH/USDT"], ["3m", "4h"], store)
+
+        assert loaded == 2
+        assert client.get_klines_many.call_count == 1
+        assert store.count("ETH/USDT", "4h") == HistoricalDataLoader.HISTORY_DEPTH
+        assert store.count("BAD/USDT", "3m") == 0
@@ -0,0 +1,101 @@
+"""
+DataCollector 市场数据收集测试
+缓存未命中的币种并发走 REST API，并记录每个币种的耗时；动态订阅的等待时间包含历史K线加载
+"""
+import threading
+import time
+from unittest.mock import MagicMock
+from decision_engine.nodes.data_collector import DataCollector
+
+REST_DELAY_SECONDS = 0.1
+
+
+def make_collector(cached_symbols=(), incomplete_symbols=()):
+    """构造 DataCollector：账户信息打桩，cached_symbols 视为已在监控器中，incomplete_symbols 的K线有缺口"""
+    monitor = MagicMock()
+    monitor.is_monitoring.side_effect = lambda symbol, owner=None: symbol in cached_symbols
+    monitor.get_data_status.side_effect = lambda symbol: {
+        'complete': symbol not in incomplete_symbols, 'fresh': True, 'intervals': {},
+    }
+    monitor.get_klines.return_value = []
+    collector = DataCollector(market_monitor=monitor, owner="trader-1")
+    collector._ensure_symbols_monitored = MagicMock()
+    collector._get_account_balance = MagicMock(return_value=0.0)
+    collector._get_positions = MagicMock(return_value=[])
+    return collector
+
+
+class TestParallelCollection:
+    """REST 回退并发收集"""
+
+    def test_rest_fetch_is_bounded_and_parallel(self):
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def slow_get_klines(symbol, interval, limit=100):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(REST_DELAY_SECONDS)
+            with lock:
+                active -= 1
+            return []
+
+        collector = make_collector()
+        collector.api_client = MagicMock()
+        collector.api_client.get_Klines.side_effect = slow_get_klines
+        symbols = [f"SYM{i}/USDT" for i in range(10)]
+
+        started = time.perf_counter()
+        state = collector.run({'candidate_symbols': symbols})
+        elapsed = time.perf_counter() - started
+
+        assert set(state['market_data_map']) == set(symbols)
+        assert peak == DataCollector.REST_FETCH_MAX_WORKERS
+        # 串行需要 10 * 2 * 0.1 = 2 秒
+        assert elapsed < len(symbols) * 2 * REST_DELAY_SECONDS / 2
+
+    def test_latency_recorded_for_every_symbol(self):
+        collector = make_collector(cached_symbols={"BTC/USDT"})
+        collector.api_client = MagicMock()
+        collector.api_client.get_Klines.side_effect = RuntimeError("boom")
+
+        state = collector.run({'candidate_symbols': ["BTC/USDT", "ETH/USDT"]})
+
+        assert set(state['fetch_latency_ms']) == {"BTC/USDT", "ETH/USDT"}
+        assert all(latency >= 0 for latency in state['fetch_latency_ms'].values())
+        assert state['market_data_map']["BTC/USDT"]['source'] == 'websocket_cache'
+        assert state['market_data_map']["ETH/USDT"]['error'] == "boom"
+
+    def test_incomplete_cache_falls_back_to_rest(self):
+        """断线后K线尚未回补完成的币种走 REST API"""
+        collector = make_collector(cached_symbols={"BTC/USDT", "ETH/USDT"}, incomplete_symbols={"ETH/USDT"})
+        collector.api_client = MagicMock()
+        collector.api_client.get_Klines.return_value = []
+
+        state = collector.run({'candidate_symbols': ["BTC/USDT", "ETH/USDT"]})
+
+        assert state['market_data_map']["BTC/USDT"]['source'] == 'websocket_cache'
+        assert state['market_data_map']["ETH/USDT"]['source'] == 'rest_api'
+
+
+class TestEnsureMonitored:
+    """动态订阅新币种"""
+
+    def test_wait_covers_history_load(self):
+        monitor = MagicMock()
+        monitor.is_monitoring.return_value = False
+        monitor.history_load_timeout.return_value = 36.0
+        collector = DataCollector(market_monitor=monitor, owner="trader-1")
+
+        collector._ensure_symbols_monitored(["BTC/USDT", "ETH/USDT"])
+
+        monitor.subscribe_many.assert_called_once_with(
+            ["BTC/USDT", "ETH/USDT"], intervals=DataCollector.SUBSCRIBE_INTERVALS, owner="trader-1"
+        )
+        monitor.history_load_timeout.assert_called_once_with(2, DataCollector.SUBSCRIBE_INTERVALS)
+        monitor.subscribe_many.return_value.result.assert_called_once_with(
+            timeout=DataCollector.WS_SUBSCRIBE_TIMEOUT_SECONDS + 36.0
+        )
@@ -0,0 +1,235 @@
+"""
+衍生品数据快照测试
+- 资金费率在 TTL 内只批量请求一次，持仓量只刷新过期的交易对
+- 单个交易对的查询读取快照；FeatureEngine 使用快照时不再逐个请求
+- 持仓量首次刷新时用历史数据预热，FeatureEngine 的均值和变化量来自真实历史
+"""
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from services.market.api_client import APIClient
+from services.market.derivatives_snapshot import DerivativesSnapshot
+from services.market.feature_engine import FeatureEngine
+from services.market.open_interest_history import OpenInterestHistory
+
+
+class FakeAPIClient:
+    """记录批量请求次数的假客户端"""
+
+    def __init__(self):
+        self.funding_calls = 0
+        self.open_interest_batches = []
+        self.history_batches = []
+
+    def get_funding_rates(self):
+        self.funding_calls += 1
+        return {'BTCUSDT': 0.0001, 'ETHUSDT': -0.0002}
+
+    def get_open_interest_histories(self, symbols, period, limit):
+        self.history_batches.append(list(symbols))
+        # 最近 10 个周期（到当前周期之前），与之后的实时采样相连
+        now_ms = int(time.time() * 1000)
+        return {symbol: [(now_ms - (10 - i) * 300_000, 900.0 + i * 10) for i in range(10)] for symbol in symbols}
+
+    def get_open_interests(self, symbols):
+        self.open_interest_batches.append(list(symbols))
+        return {symbol: 1000.0 for symbol in symbols if symbol != 'BADUSDT'}
+
+    def get_derivatives(self, symbol):
+        raise AssertionError("使用快照时不应逐个请求")
+
+
+class TestDerivativesSnapshot:
+    """资金费率/持仓量快照"""
+
+    def test_prefetch_batches_and_get_reads_snapshot(self):
+        api = FakeAPIClient()
+        snapshot = DerivativesSnapshot(api)
+        snapshot.prefetch(['BTC/USDT', 'ETH', 'btcusdt'])
+
+        assert api.funding_calls == 1
+        assert api.open_interest_batches == [['BTCUSDT', 'ETHUSDT']]
+        assert snapshot.get('BTC/USDT:USDT') == (1000.0, 0.0001)
+        assert snapshot.get('ETH') == (1000.0, -0.0002)
+        assert api.funding_calls == 1
+        assert len(api.open_interest_batches) == 1
+        assert snapshot.stats()['hits'] == 2
+
+    def test_open_interest_ttl_expiry(self):
+        api = FakeAPIClient()
+        snapshot = DerivativesSnapshot(api, open_interest_ttl=60)
+        with patch('services.market.derivatives_snapshot.time.monotonic', return_value=1000.0):
+            snapshot.prefetch(['BTC'])
+        with patch('services.market.derivatives_snapshot.time.monotonic', return_value=1030.0):
+            snapshot.prefetch(['BTC', 'ETH'])
+        assert api.open_interest_batches == [['BTCUSDT'], ['ETHUSDT']]
+
+        with patch('services.market.derivatives_snapshot.time.monotonic', return_value=1061.0):
+            snapshot.prefetch(['BTC', 'ETH'])
+        assert api.open_interest_batches[-1] == ['BTCUSDT']
+        assert api.funding_calls == 1
+
+    def test_missing_symbol_fetched_on_demand_and_failures_cached(self):
+        api = FakeAPIClient()
+        snapshot = DerivativesSnapshot(api)
+        assert snapshot.get('BAD') == (None, None)
+        assert snapshot.get('BAD') == (None, None)
+        assert api.open_interest_batches == [['BADUSDT']]
+
+    def test_streamed_funding_skips_rest_refresh(self):
+        api = FakeAPIClient()
+        snapshot = DerivativesSnapshot(api)
+        snapshot.update_funding({'BTCUSDT': 0.0003})
+        snapshot.prefetch(['BTC'])
+        assert api.funding_calls == 0
+        assert snapshot.get('BTC') == (1000.0, 0.0003)
+
+    def test_feature_engine_reads_snapshot(self):
+        api = FakeAPIClient()
+        snapshot = DerivativesSnapshot(api, history=OpenInterestHistory(window=11))
+        snapshot.prefetch(['BTC'])
+        engine = FeatureEngine(api, vectorized=True, derivatives=snapshot)
+        open_interest, average, change_pct, funding_rate = engine._fetch_derivatives_data('BTC/USDT', False)
+        assert (open_interest, funding_rate) == (1000.0, 0.0001)
+        # 预热的 10 个历史采样（900..990）+ 当前采样 1000
+        assert average == pytest.approx((sum(900.0 + i * 10 for i in range(10)) + 1000.0) / 11)
+        assert change_pct == pytest.approx((1000.0 / 900.0 - 1) * 100)
+
+    def test_default_ttl_samples_once_per_history_period(self):
+        """默认 TTL 与持仓量历史的采样周期一致：每个周期一次请求、一个采样"""
+        api = FakeAPIClient()
+        snapshot = DerivativesSnapshot(api)
+        assert snapshot.open_interest_ttl * 1000 == OpenInterestHistory.PERIOD_MS
+        start_ms = 1_700_003_000_000
+        for minute in range(0, 16):
+            with patch('services.market.derivatives_snapshot.time.monotonic', return_value=1000.0 + minute * 60), \
+                    patch('services.market.derivatives_snapshot.time.time', return_value=(start_ms + minute * 60_000) / 1000):
+                snapshot.prefetch(['BTC'])
+        assert len(api.open_interest_batches) == 4  # 第 0、5、10、15 分钟
+        assert snapshot.open_interest_summary('BTC')['samples'] == 10 + 4
+
+    def test_history_seeded_once_per_symbol(self):
+        api = FakeAPIClient()
+        snapshot = DerivativesSnapshot(api, open_interest_ttl=0)
+        snapshot.prefetch(['BTC'])
+        snapshot.prefetch(['BTC', 'ETH'])
+        assert api.history_batches == [['BTCUSDT'], ['ETHUSDT']]
+        assert snapshot.open_interest_summary('BTC/USDT')['latest'] == 1000.0
+
+    def test_history_reseeded_after_tracking_gap(self):
+        """停止跟踪超过一个窗口后重新跟踪：过期的历史被 openInterestHist 整体替换"""
+        api = FakeAPIClient()
+        snapshot = DerivativesSnapshot(api, open_interest_ttl=0, history=OpenInterestHistory(window=11))
+        start_ms = 1_700_003_000_000
+        with patch('services.market.derivatives_snapshot.time.time', return_value=start_ms / 1000):
+            snapshot.prefetch(['BTC'])
+        resumed_ms = start_ms + 6 * 3600 * 1000
+        with patch('services.market.derivatives_snapshot.time.time', return_value=resumed_ms / 1000):
+            snapshot.prefetch(['BTC'])
+
+        assert api.history_batches == [['BTCUSDT'], ['BTCUSDT']]
+        summary = snapshot.open_interest_summary('BTC')
+        assert summary['samples'] == 11
+        assert summary['last_timestamp'] // 300_000 == resumed_ms // 300_000
+        assert summary['change_pct'] == pytest.approx((1000.0 / 900.0 - 1) * 100)
+
+
+class ThreadRecordingAPIClient(FakeAPIClient):
+    """额外记录持仓量请求所在的线程"""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def get_open_interests(self, symbols):
+        self.threads.add(threading.current_thread().name)
+        return super().get_open_interests(symbols)
+
+
+class TestBackgroundRefresh:
+    """后台刷新：扫描时的 prefetch/get 只读快照"""
+
+    @pytest.fixture
+    def running(self):
+        api = ThreadRecordingAPIClient()
+        snapshot = DerivativesSnapshot(api)
+        snapshot.start()
+        yield api, snapshot
+        snapshot.stop()
+
+    def test_requests_happen_on_refresh_thread(self, running):
+        api, snapshot = running
+        snapshot.prefetch(['BTC', 'ETH'])
+        assert snapshot.get('BTC') == (1000.0, 0.0001)
+        assert api.threads == {"DerivativesRefresh"}
+        assert api.history_batches == [['BTCUSDT', 'ETHUSDT']]
+
+    def test_repeated_scans_are_pure_reads(self, running):
+        api, snapshot = running
+        snapshot.prefetch(['BTC', 'ETH'])
+        snapshot.get('BTC')  # 等待首次采样
+        batches = len(api.open_interest_batches)
+        for _ in range(5):
+            snapshot.prefetch(['BTC', 'ETH'])
+            snapshot.get('ETH/USDT')
+        assert len(api.open_interest_batches) == batches
+        assert api.funding_calls == 1
+
+    def test_untracked_symbol_waits_for_first_sample(self, running):
+        api, snapshot = running
+        assert snapshot.get('SOL/USDT') == (1000.0, None)
+        assert ['SOLUSDT'] in api.open_interest_batches
+        assert api.threads == {"DerivativesRefresh"}
+
+    def test_cold_fetch_does_not_block_scan(self):
+        """首次采样很慢时 prefetch 立即返回，get 最多等待 FIRST_SAMPLE_WAIT_SECONDS 后返回 None"""
+        release = threading.Event()
+
+        class SlowAPIClient(FakeAPIClient):
+            def get_open_interests(self, symbols):
+                release.wait(timeout=10)
+                return super().get_open_interests(symbols)
+
+        api = SlowAPIClient()
+        snapshot = DerivativesSnapshot(api)
+        snapshot.FIRST_SAMPLE_WAIT_SECONDS = 0.2
+        snapshot.start()
+        try:
+            started = time.monotonic()
+            snapshot.prefetch(['BTC', 'ETH'])
+            assert time.monotonic() - started < 0.1
+
+            assert snapshot.get('BTC')[0] is None
+            assert snapshot.get('ETH')[0] is None
+            # 同一批登记的交易对共用一个截止时间，等待不随交易对数量累加
+            assert time.monotonic() - started < 0.5
+
+            release.set()
+            deadline = time.monotonic() + 5
+            while snapshot.get('BTC')[0] is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert snapshot.get('BTC')[0] == 1000.0
+        finally:
+            release.set()
+            snapshot.stop()
+
+    def test_stop_joins_thread(self, running):
+        _, snapshot = running
+        snapshot.stop()
+        assert not snapshot.is_running()
+        assert snapshot._thread is None
+
+
+class TestParseFundingRates:
+    """fetch_funding_rates 返回值解析"""
+
+    def test_keys_by_exchange_id(self):
+        data = {
+            'BTC/USDT:USDT': {'fundingRate': 0.0001, 'info': {'symbol': 'BTCUSDT'}},
+            'ETH/USDT:USDT': {'fundingRate': '-0.0002', 'info': {}},
+            'XRP/USDT:USDT': {'fundingRate': None, 'info': {'symbol': 'XRPUSDT'}},
+        }
+        assert APIClient.__new__(APIClient)._parse_funding_rates(data) == {
+            'BTCUSDT': 0.0001, 'ETHUSDT': -0.0002,
+        }
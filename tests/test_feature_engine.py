@@ -0,0 +1,91 @@
+"""
+FeatureEngine 向量化模式测试
+向量化单次遍历的结果必须与原有 pandas_ta 路径一致（容差内）
+"""
+import math
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from services.market.feature_engine import FeatureEngine
+from services.market.kline_store import KlineStore
+from services.market.type import Kline
+
+TOLERANCE = 1e-9
+BASE_TIME = 1_700_000_000_000
+
+
+def make_klines(count: int, interval_ms: int, seed: int) -> list:
+    """随机游走K线（固定种子）"""
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, count)))
+    klines = []
+    for i, price in enumerate(close):
+        open_time = BASE_TIME + i * interval_ms
+        klines.append(Kline(
+            open_time=open_time,
+            open=float(price),
+            high=float(price * (1 + rng.uniform(0, 0.01))),
+            low=float(price * (1 - rng.uniform(0, 0.01))),
+            close=float(price),
+            volume=float(rng.uniform(10, 1000)),
+            close_time=open_time + interval_ms - 1,
+            quote_volume=0.0,
+            trades=1,
+        ))
+    return klines
+
+
+def assert_series_equal(actual: list, expected: list):
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        if math.isnan(e):
+            assert math.isnan(a)
+        else:
+            assert a == pytest.approx(e, rel=TOLERANCE, abs=TOLERANCE)
+
+
+def assert_features_equal(actual, expected):
+    for name, value in vars(expected).items():
+        if isinstance(value, dict):
+            for key, series in value.items():
+                assert_series_equal(getattr(actual, name)[key], series)
+        elif isinstance(value, float):
+            assert getattr(actual, name) == pytest.approx(value, rel=TOLERANCE, abs=TOLERANCE), name
+        else:
+            assert getattr(actual, name) == value, name
+
+
+class TestVectorizedFeatureEngine:
+    """向量化模式与 pandas_ta 路径的一致性"""
+
+    @pytest.mark.parametrize("count", [20, 40, 100, 1000])
+    def test_matches_pandas_ta_path(self, count):
+        klines_3m = make_klines(count, 180_000, seed=1)
+        klines_4h = make_klines(count, 14_400_000, seed=2)
+
+        expected = FeatureEngine(MagicMock()).calculate_features("BTC/USDT", klines_3m, klines_4h, skip_api_calls=True)
+        actual = FeatureEngine(MagicMock(), vectorized=True).calculate_features(
+            "BTC/USDT", klines_3m, klines_4h, skip_api_calls=True
+        )
+        assert_features_equal(actual, expected)
+
+    def test_accepts_kline_arrays(self):
+        """直接传入 KlineStore 的列式视图"""
+        klines_3m = make_klines(100, 180_000, seed=3)
+        klines_4h = make_klines(100, 14_400_000, seed=4)
+        store = KlineStore(capacity=200)
+        store.replace("BTC/USDT", "3m", klines_3m)
+        store.replace("BTC/USDT", "4h", klines_4h)
+
+        engine = FeatureEngine(MagicMock(), vectorized=True)
+        expected = engine.calculate_features("BTC/USDT", klines_3m, klines_4h, skip_api_calls=True)
+        actual = engine.calculate_features(
+            "BTC/USDT", store.get_arrays("BTC/USDT", "3m"), store.get_arrays("BTC/USDT", "4h"),
+            skip_api_calls=True
+        )
+        assert_features_equal(actual, expected)
+
+    def test_insufficient_data_returns_none(self):
+        engine = FeatureEngine(MagicMock(), vectorized=True)
+        assert engine.calculate_features("BTC/USDT", make_klines(10, 180_000, 5), make_klines(100, 14_400_000, 6)) is None
+        assert engine.calculate_features("BTC/USDT", None, None) is None
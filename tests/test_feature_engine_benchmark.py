@@ -0,0 +1,24 @@
+"""
+FeatureEngine 基准测试：pandas_ta 路径 vs 向量化单次遍历
+
+运行: pytest tests/test_feature_engine_benchmark.py --benchmark-group-by=param:count
+"""
+import pytest
+from unittest.mock import MagicMock
+
+pytest.importorskip("pytest_benchmark")
+
+from services.market.feature_engine import FeatureEngine
+from tests.test_feature_engine import make_klines
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("vectorized", [False, True], ids=["pandas_ta", "vectorized"])
+@pytest.mark.parametrize("count", [100, 1000])
+def test_calculate_features(benchmark, count, vectorized):
+    klines_3m = make_klines(count, 180_000, seed=1)
+    klines_4h = make_klines(count, 14_400_000, seed=2)
+    engine = FeatureEngine(MagicMock(), vectorized=vectorized)
+
+    features = benchmark(engine.calculate_features, "BTC/USDT", klines_3m, klines_4h, skip_api_calls=True)
+    assert features is not None
@@ -0,0 +1,131 @@
+"""
+特征计算执行器测试
+- 负载只包含 OHLCV 数组；进程池与当前线程的计算结果与 FeatureEngine 一致
+- SignalAnalyzer 通过执行器计算特征，持仓量/资金费率在主进程中补充
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from unittest.mock import MagicMock
+import numpy as np
+import pytest
+from decision_engine.nodes.signal_analyzer import SignalAnalyzer
+from services.market.feature_engine import FeatureEngine
+from services.market.feature_executor import FeatureExecutor
+from tests.test_feature_engine import make_klines
+
+
+def make_market_data(count: int) -> dict:
+    return {
+        f"SYM{i}/USDT": {
+            'klines_3m': make_klines(100, 180_000, seed=i * 2),
+            'klines_4h': make_klines(100, 14_400_000, seed=i * 2 + 1),
+        }
+        for i in range(count)
+    }
+
+
+def expected_features(market_data: dict) -> dict:
+    engine = FeatureEngine(MagicMock(), vectorized=True)
+    return {
+        symbol: asdict(engine.calculate_features(symbol, data['klines_3m'], data['klines_4h'], skip_api_calls=True))
+        for symbol, data in market_data.items()
+    }
+
+
+def same(actual: dict, expected: dict) -> bool:
+    """逐值比较（序列预热段为 NaN，用 repr 比较）"""
+    return repr(actual) == repr(expected)
+
+
+def run_all(feature_executor: FeatureExecutor, market_data: dict) -> dict:
+    payloads = [
+        FeatureExecutor.make_payload(symbol, data['klines_3m'], data['klines_4h'])
+        for symbol, data in market_data.items()
+    ]
+    futures = feature_executor.submit(payloads)
+    return {
+        payload[0]: asdict(feature_executor.result(future, payload))
+        for payload, future in zip(payloads, futures)
+    }
+
+
+class TestFeatureExecutor:
+    """负载格式与计算结果"""
+
+    def test_payload_is_compact_arrays(self):
+        data = make_market_data(1)["SYM0/USDT"]
+        symbol, ohlcv_3m, ohlcv_4h = FeatureExecutor.make_payload("SYM0/USDT", data['klines_3m'], data['klines_4h'])
+        assert symbol == "SYM0/USDT"
+        for ohlcv in (ohlcv_3m, ohlcv_4h):
+            assert set(ohlcv) == {'high', 'low', 'close', 'volume'}
+            assert all(isinstance(a, np.ndarray) and a.dtype == np.float64 for a in ohlcv.values())
+
+    def test_inline_matches_feature_engine(self):
+        market_data = make_market_data(6)
+        assert same(run_all(FeatureExecutor(), market_data), expected_features(market_data))
+
+    def test_process_pool_matches_feature_engine(self):
+        market_data = make_market_data(6)
+        pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context('spawn'))
+        feature_executor = FeatureExecutor(pool)
+        try:
+            assert same(run_all(feature_executor, market_data), expected_features(market_data))
+        finally:
+            feature_executor.shutdown()
+
+    def test_small_batches_run_inline(self):
+        executor = MagicMock()
+        market_data = make_market_data(FeatureExecutor.MIN_PARALLEL_SYMBOLS - 1)
+        assert same(run_all(FeatureExecutor(executor), market_data), expected_features(market_data))
+        executor.submit.assert_not_called()
+
+    def test_insufficient_data_yields_none(self):
+        data = make_market_data(1)["SYM0/USDT"]
+        payload = FeatureExecutor.make_payload("SYM0/USDT", data['klines_3m'][:5], data['klines_4h'])
+        feature_executor = FeatureExecutor()
+        assert feature_executor.result(feature_executor.submit([payload])[0], payload) is None
+
+
+class FakeDerivatives:
+    """按固定值返回持仓量/资金费率的快照替身"""
+
+    def __init__(self):
+        self.prefetched = []
+
+    def prefetch(self, symbols):
+        self.prefetched.extend(symbols)
+
+    def get(self, symbol):
+        return 1e9, 0.0001
+
+    def open_interest_summary(self, symbol):
+        return None
+
+
+class TestSignalAnalyzer:
+    """SignalAnalyzer 使用执行器"""
+
+    @pytest.fixture
+    def analyzer(self):
+        derivatives = FakeDerivatives()
+        executor = MagicMock(wraps=FeatureExecutor())
+        analyzer = SignalAnalyzer(derivatives=derivatives, feature_executor=executor)
+        analyzer.api_client = MagicMock()
+        analyzer.feature_engine = FeatureEngine(analyzer.api_client, vectorized=True, derivatives=derivatives)
+        return analyzer
+
+    def test_run_computes_features_through_executor(self, analyzer):
+        market_data = make_market_data(5)
+        market_data["BAD/USDT"] = {'error': 'timeout'}
+        state = analyzer.run({'market_data_map': market_data, 'positions': []})
+
+        expected = expected_features({s: d for s, d in market_data.items() if s != "BAD/USDT"})
+        assert set(state['signal_data_map']) == set(expected)
+        for symbol, signals in state['signal_data_map'].items():
+            assert signals['open_interest'] == 1e9
+            assert signals['funding_rate'] == 0.0001
+            assert signals['rsi14_4h'] == expected[symbol]['rsi14_4h']
+        analyzer.feature_executor.submit.assert_called_once()
+        assert analyzer.derivatives.prefetched == list(expected)
+        analyzer.api_client.get_derivatives.assert_not_called()
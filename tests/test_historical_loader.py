@@ -0,0 +1,122 @@
+"""
+HistoricalDataLoader 分页加载测试
+- 超过单页的深度按 since 游标拆分为大小相近的多页
+- 分页结果按 open_time 去重合并，得到连续的最近 depth 根K线
+"""
+from unittest.mock import patch
+from services.market.historical_loader import HistoricalDataLoader, PAGE_LIMIT, merge_pages, page_requests
+from services.market.kline_store import KlineStore
+from services.market.type import Kline
+
+INTERVAL_MS = 180_000
+BASE_TIME = 1_700_000_100_000  # 与 3m 周期对齐（交易所K线按 UTC 整点对齐）
+
+
+def make_kline(i: int) -> Kline:
+    open_time = BASE_TIME + i * INTERVAL_MS
+    return Kline(open_time=open_time, open=1.0, high=2.0, low=0.5, close=float(i), volume=10.0,
+                 close_time=open_time + INTERVAL_MS - 1, quote_volume=15.0, trades=i)
+
+
+def now_after(i: int) -> int:
+    """第 i 根K线收盘之后、第 i + 1 根未收盘时的时间"""
+    return BASE_TIME + (i + 1) * INTERVAL_MS + 1_000
+
+
+class FakeAPIClient:
+    """返回到 last 为止的K线（最后一根未收盘），记录请求"""
+
+    def __init__(self, last: int):
+        self.last = last
+        self.requests = []
+
+    def get_Klines(self, symbol, timeframe, limit=100, since=None):
+        self.requests.append((symbol, timeframe, limit, since))
+        start = self.last - limit + 1 if since is None else (since - BASE_TIME) // INTERVAL_MS
+        return [make_kline(i) for i in range(start, min(start + limit, self.last + 1))]
+
+
+class TestPageRequests:
+    """分页计划"""
+
+    def test_single_page_has_no_cursor(self):
+        assert page_requests("3m", 100) == [(None, 100)]
+        assert page_requests("1M", 2000) == [(None, 2000)]
+
+    def test_deep_history_is_split_into_even_pages(self):
+        now_ms = now_after(999)
+        pages = page_requests("3m", 1000, now_ms=now_ms)
+        assert [limit for _, limit in pages] == [334, 334, 332]
+        assert all(limit <= PAGE_LIMIT for _, limit in pages)
+        # 最后一页以当前（未收盘）K线结束，各页首尾相接
+        first_since, _ = pages[0]
+        assert first_since == make_kline(1000 - 999).open_time
+        for (since, limit), (next_since, _) in zip(pages, pages[1:]):
+            assert next_since == since + limit * INTERVAL_MS
+
+    def test_explicit_since_pages_forward(self):
+        since = make_kline(10).open_time
+        pages = page_requests("3m", 600, since=since)
+        assert pages == [(since, 300), (since + 300 * INTERVAL_MS, 300)]
+
+    def test_merge_deduplicates_and_keeps_latest(self):
+        pages = [[make_kline(i) for i in range(5, 10)], [make_kline(i) for i in range(0, 7)]]
+        merged = merge_pages(pages, depth=8)
+        assert [kline.trades for kline in merged] == list(range(2, 10))
+
+
+class TestPaginatedLoad:
+    """深度历史的并行分页加载"""
+
+    def test_fills_requested_depth(self):
+        api = FakeAPIClient(last=1500)
+        store = KlineStore(capacity=1000)
+        loader = HistoricalDataLoader(api)
+        with patch('services.market.historical_loader.time.time', return_value=now_after(1499) / 1000):
+            count = loader.load_historical_data(["BTC/USDT"], ["3m"], store, depth=1000)
+        assert count == 1
+        assert len(api.requests) == 3
+        # 最后一根（1500）未收盘，写入未收盘槽位
+        arrays = store.get_arrays("BTC/USDT", "3m", limit=1000, include_forming=True)
+        assert len(arrays) == 1000
+        assert arrays.close[0] == 501.0 and arrays.close[-1] == 1500.0
+        assert (arrays.open_time[1:] - arrays.open_time[:-1] == INTERVAL_MS).all()
+        assert store.count("BTC/USDT", "3m") == 999
+        assert store.last_open_time("BTC/USDT", "3m") == make_kline(1499).open_time
+
+    def test_forming_bar_keeps_updating_after_load(self):
+        """加载完成后，WebSocket 对未收盘K线的推送仍能原地更新"""
+        api = FakeAPIClient(last=200)
+        store = KlineStore(capacity=300)
+        with patch('services.market.historical_loader.time.time', return_value=now_after(199) / 1000):
+            HistoricalDataLoader(api).load_historical_data(["BTC/USDT"], ["3m"], store, depth=100)
+        forming = make_kline(200)
+        store.update_forming("BTC/USDT", "3m", open_time=forming.open_time, open=1.0, high=2.0, low=0.5,
+                             close=250.0, volume=10.0, close_time=forming.close_time, quote_volume=15.0,
+                             trades=200)
+        assert store.get_klines("BTC/USDT", "3m", limit=2, include_forming=True)[-1].close == 250.0
+        assert store.get_klines("BTC/USDT", "3m", limit=1)[-1].close == 199.0
+
+    def test_depth_is_capped_by_store_capacity(self):
+        api = FakeAPIClient(last=1500)
+        store = KlineStore(capacity=300)
+        with patch('services.market.historical_loader.time.time', return_value=now_after(1499) / 1000):
+            HistoricalDataLoader(api).load_historical_data(["BTC/USDT"], ["3m"], store, depth=1000)
+        assert api.requests == [("BTC/USDT", "3m", 300, None)]
+        assert store.count("BTC/USDT", "3m") == 299  # 另有一根未收盘K线
+
+    def test_failed_page_skips_symbol(self):
+        api = FakeAPIClient(last=1500)
+        fetch = api.get_Klines
+        # BAD/USDT 的后两页失败
+        api.get_Klines = lambda symbol, timeframe, limit=100, since=None: (
+            None if symbol == "BAD/USDT" and since is not None and since > make_kline(1000).open_time
+            else fetch(symbol, timeframe, limit, since)
+        )
+        store = KlineStore(capacity=1000)
+        with patch('services.market.historical_loader.time.time', return_value=now_after(1499) / 1000):
+            count = HistoricalDataLoader(api).load_historical_data(
+                ["BTC/USDT", "BAD/USDT"], ["3m"], store, depth=1000
+            )
+        assert count == 1
+        assert store.count("BAD/USDT", "3m") == 0
@@ -0,0 +1,170 @@
+"""
+增量指标引擎一致性测试
+逐根K线更新的结果必须与 pandas_ta 在完整序列上的计算结果一致（容差内）
+"""
+import math
+import numpy as np
+import pandas as pd
+import pandas_ta as ta
+import pytest
+from services.market.incremental_indicators import (
+    IncrementalEMA,
+    IncrementalRSI,
+    IncrementalMACD,
+    IncrementalATR,
+    IncrementalIndicatorEngine,
+)
+from services.market.kline_store import KlineStore
+
+TOLERANCE = 1e-9
+INTERVAL_MS = 180_000
+BASE_TIME = 1_700_000_000_000
+
+
+@pytest.fixture
+def ohlc():
+    """随机游走价格序列（固定种子，包含平盘K线）"""
+    rng = np.random.default_rng(42)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, 300)))
+    close[50:53] = close[49]  # 连续平盘，覆盖 diff 为 0 的情况
+    high = close * (1 + rng.uniform(0, 0.01, 300))
+    low = close * (1 - rng.uniform(0, 0.01, 300))
+    return pd.DataFrame({'high': high, 'low': low, 'close': close})
+
+
+def assert_stream_matches(stream_values, expected: pd.Series):
+    """逐根比较：pandas_ta 为 NaN 的位置增量值应为 None"""
+    for i, (actual, reference) in enumerate(zip(stream_values, expected)):
+        if reference is None or math.isnan(reference):
+            assert actual is None, f"index {i}: expected None, got {actual}"
+        else:
+            assert actual == pytest.approx(reference, rel=TOLERANCE, abs=TOLERANCE), f"index {i}"
+
+
+def streaming_reference(func, length: int, min_length: int):
+    """pandas_ta 对每个前缀计算的最后一个值（数据不足时为 NaN）"""
+    values = []
+    for end in range(1, length + 1):
+        if end < min_length:
+            values.append(float('nan'))
+            continue
+        series = func(end)
+        values.append(float(series.iloc[-1]) if series is not None else float('nan'))
+    return pd.Series(values)
+
+
+class TestIndicatorParity:
+    """增量指标与 pandas_ta 的一致性"""
+
+    @pytest.mark.parametrize("period", [20, 50])
+    def test_ema(self, ohlc, period):
+        ema = IncrementalEMA(period)
+        stream = [ema.update(x) for x in ohlc['close']]
+        assert_stream_matches(stream, ta.ema(ohlc['close'], length=period))
+
+    @pytest.mark.parametrize("period", [7, 14])
+    def test_rsi(self, ohlc, period):
+        rsi = IncrementalRSI(period)
+        stream = [rsi.update(x) for x in ohlc['close']]
+        expected = ta.rsi(ohlc['close'], length=period).copy()
+        expected.iloc[:period] = np.nan  # pandas_ta 至少需要 period + 1 个值
+        assert_stream_matches(stream, expected)
+
+    def test_macd(self, ohlc):
+        macd = IncrementalMACD(12, 26, 9)
+        stream = [macd.update(x) for x in ohlc['close']]
+        expected = ta.macd(ohlc['close'])['MACD_12_26_9'].copy()
+        expected.iloc[:33] = np.nan  # pandas_ta 至少需要 slow + signal - 1 个值
+        assert_stream_matches(stream, expected)
+
+        signal = ta.macd(ohlc['close'])['MACDs_12_26_9']
+        assert macd.signal == pytest.approx(signal.iloc[-1], rel=TOLERANCE)
+
+    @pytest.mark.parametrize("period", [3, 14])
+    def test_atr(self, ohlc, period):
+        atr = IncrementalATR(period)
+        stream = [atr.update(h, l, c) for h, l, c in zip(ohlc['high'], ohlc['low'], ohlc['close'])]
+        expected = ta.atr(ohlc['high'], ohlc['low'], ohlc['close'], length=period).copy()
+        expected.iloc[:period] = np.nan  # pandas_ta 至少需要 period + 1 个值
+        assert_stream_matches(stream, expected)
+
+    def test_short_series_matches_pandas_ta_prefixes(self, ohlc):
+        """短序列（刚满足最小长度附近）逐前缀与 pandas_ta 比较"""
+        head = ohlc.iloc[:40].reset_index(drop=True)
+        rsi = IncrementalRSI(14)
+        stream = [rsi.update(x) for x in head['close']]
+        expected = streaming_reference(lambda n: ta.rsi(head['close'].iloc[:n], length=14), len(head), 15)
+        assert_stream_matches(stream, expected)
+
+
+class TestIncrementalIndicatorEngine:
+    """增量指标引擎（KlineStore + K线收盘事件）测试"""
+
+    @staticmethod
+    def write_bar(store: KlineStore, ohlc: pd.DataFrame, i: int, close: float = None):
+        open_time = BASE_TIME + i * INTERVAL_MS
+        store.upsert(
+            "BTC/USDT", "3m", open_time=open_time, open=float(ohlc['close'][i]),
+            high=float(ohlc['high'][i]), low=float(ohlc['low'][i]),
+            close=float(ohlc['close'][i] if close is None else close), volume=1.0,
+            close_time=open_time + INTERVAL_MS - 1, quote_volume=1.0, trades=1,
+        )
+        return open_time
+
+    @staticmethod
+    def reference(ohlc: pd.DataFrame) -> dict:
+        return {
+            'ema20': ta.ema(ohlc['close'], length=20).iloc[-1],
+            'ema50': ta.ema(ohlc['close'], length=50).iloc[-1],
+            'macd': ta.macd(ohlc['close'])['MACD_12_26_9'].iloc[-1],
+            'rsi7': ta.rsi(ohlc['close'], length=7).iloc[-1],
+            'rsi14': ta.rsi(ohlc['close'], length=14).iloc[-1],
+            'atr3': ta.atr(ohlc['high'], ohlc['low'], ohlc['close'], length=3).iloc[-1],
+            'atr14': ta.atr(ohlc['high'], ohlc['low'], ohlc['close'], length=14).iloc[-1],
+        }
+
+    def assert_matches(self, values: dict, ohlc: pd.DataFrame):
+        for name, expected in self.reference(ohlc).items():
+            assert values[name] == pytest.approx(expected, rel=TOLERANCE), name
+
+    def test_seed_then_stream(self, ohlc):
+        """预热后逐根推送，结果与 pandas_ta 一致"""
+        store = KlineStore(capacity=1000)
+        engine = IncrementalIndicatorEngine(store)
+        for i in range(200):
+            self.write_bar(store, ohlc, i)
+        self.assert_matches(engine.get("BTC/USDT", "3m"), ohlc.iloc[:200])
+
+        for i in range(200, 300):
+            open_time = self.write_bar(store, ohlc, i)
+            engine.on_kline_closed("BTCUSDT", "3m", open_time)
+        self.assert_matches(engine.get("BTC/USDT", "3m"), ohlc)
+
+    def test_repeated_last_bar_is_recomputed(self, ohlc):
+        """同一根K线重复推送（收盘价修正）时回滚后重算"""
+        store = KlineStore(capacity=1000)
+        engine = IncrementalIndicatorEngine(store)
+        for i in range(100):
+            self.write_bar(store, ohlc, i)
+        engine.get("BTC/USDT", "3m")
+
+        corrected = ohlc.iloc[:100].copy()
+        corrected.loc[99, 'close'] = corrected['close'][99] * 1.01
+        open_time = self.write_bar(store, ohlc, 99, close=float(corrected['close'][99]))
+        engine.on_kline_closed("BTCUSDT", "3m", open_time)
+
+        self.assert_matches(engine.get("BTC/USDT", "3m"), corrected)
+
+    def test_out_of_order_bar_triggers_reseed(self, ohlc):
+        """乱序补入的旧K线会触发重新预热"""
+        store = KlineStore(capacity=1000)
+        engine = IncrementalIndicatorEngine(store)
+        for i in range(100):
+            if i != 50:
+                self.write_bar(store, ohlc, i)
+        engine.get("BTC/USDT", "3m")
+
+        open_time = self.write_bar(store, ohlc, 50)
+        engine.on_kline_closed("BTCUSDT", "3m", open_time)
+
+        self.assert_matches(engine.get("BTC/USDT", "3m"), ohlc.iloc[:100])
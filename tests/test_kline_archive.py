@@ -0,0 +1,204 @@
+"""
+K线磁盘归档测试
+- 只追加已收盘、比归档更新的K线；写入中断留下的不完整记录会被截掉；超过容量时压缩
+- 历史加载器从归档恢复，只请求归档之后的增量；归档过旧时完整下载并重建归档
+- 监控器在独立的写入线程中写归档，收盘事件的分发不等待磁盘
+"""
+import threading
+import time
+import numpy as np
+from unittest.mock import patch
+from services.market.historical_loader import HistoricalDataLoader
+from services.market.kline_archive import KlineArchive, RECORD_DTYPE
+from services.market.kline_store import KlineStore
+from services.market.monitor import MarketMonitor
+from services.market.type import Kline
+
+INTERVAL_MS = 180_000
+BASE_TIME = 1_700_000_000_000
+
+
+def make_kline(i: int) -> Kline:
+    open_time = BASE_TIME + i * INTERVAL_MS
+    return Kline(open_time=open_time, open=1.0, high=2.0, low=0.5, close=float(i), volume=10.0,
+                 close_time=open_time + INTERVAL_MS - 1, quote_volume=15.0, trades=i)
+
+
+def now_after(i: int) -> int:
+    """第 i 根K线收盘之后、第 i + 1 根未收盘时的时间"""
+    return BASE_TIME + (i + 1) * INTERVAL_MS + 1_000
+
+
+class FakeAPIClient:
+    """返回到 last 为止的K线（最后一根未收盘），记录请求"""
+
+    def __init__(self, last: int):
+        self.last = last
+        self.requests = []
+
+    def get_Klines(self, symbol, timeframe, limit=100, since=None):
+        self.requests.append((symbol, timeframe, limit, since))
+        start = self.last - limit + 1 if since is None else (since - BASE_TIME) // INTERVAL_MS
+        return [make_kline(i) for i in range(start, min(start + limit, self.last + 1))]
+
+
+class TestKlineArchive:
+    """磁盘归档读写"""
+
+    def test_append_only_closed_and_newer_bars(self, tmp_path):
+        archive = KlineArchive(tmp_path, capacity=100)
+        klines = [make_kline(i) for i in range(10)]
+        assert archive.append("BTC/USDT", "3m", klines, now_ms=now_after(8)) == 9  # 第 9 根未收盘
+        assert archive.append("BTC/USDT", "3m", klines, now_ms=now_after(9)) == 1
+        assert archive.append("BTC/USDT", "3m", klines[:5], now_ms=now_after(9)) == 0
+
+        columns = archive.load("BTC/USDT", "3m", limit=4)
+        assert columns['close'].tolist() == [6.0, 7.0, 8.0, 9.0]
+        assert columns['trades'].dtype == np.int64
+        assert KlineArchive(tmp_path).last_open_time("BTCUSDT", "3m") == make_kline(9).open_time
+
+    def test_truncated_record_is_repaired(self, tmp_path):
+        archive = KlineArchive(tmp_path, capacity=100)
+        archive.append("BTC/USDT", "3m", [make_kline(i) for i in range(3)], now_ms=now_after(3))
+        path = archive.path("BTC/USDT", "3m")
+        with open(path, 'ab') as f:
+            f.write(b'\x00' * (RECORD_DTYPE.itemsize // 2))
+
+        reopened = KlineArchive(tmp_path, capacity=100)
+        assert len(reopened.load("BTC/USDT", "3m")['open_time']) == 3
+        assert path.stat().st_size == 3 * RECORD_DTYPE.itemsize
+
+    def test_compaction_keeps_latest_capacity(self, tmp_path):
+        archive = KlineArchive(tmp_path, capacity=10)
+        for i in range(45):
+            archive.append("BTC/USDT", "3m", [make_kline(i)], now_ms=now_after(i))
+        path = archive.path("BTC/USDT", "3m")
+        assert path.stat().st_size <= 10 * KlineArchive.COMPACT_FACTOR * RECORD_DTYPE.itemsize
+        assert archive.load("BTC/USDT", "3m", limit=1)['close'].tolist() == [44.0]
+        archive.append("BTC/USDT", "3m", [make_kline(45)], now_ms=now_after(45))
+        assert archive.load("BTC/USDT", "3m", limit=2)['close'].tolist() == [44.0, 45.0]
+
+
+class TestArchiveWarmStart:
+    """历史加载器从归档恢复"""
+
+    def load(self, archive, api, last, depth=100):
+        store = KlineStore(capacity=1000)
+        loader = HistoricalDataLoader(api, archive=archive)
+        with patch('services.market.historical_loader.time.time', return_value=now_after(last - 1) / 1000):
+            count = loader.load_historical_data(["BTC/USDT"], ["3m"], store, depth=depth)
+        return count, store
+
+    def test_cold_start_fills_archive_then_warm_start_fetches_delta(self, tmp_path):
+        archive = KlineArchive(tmp_path, capacity=1000)
+        cold_api = FakeAPIClient(last=199)
+        with patch('services.market.kline_archive.time.time', return_value=now_after(198) / 1000):
+            count, _ = self.load(archive, cold_api, last=199)
+        assert count == 1
+        assert cold_api.requests == [("BTC/USDT", "3m", 100, None)]
+        assert archive.last_open_time("BTC/USDT", "3m") == make_kline(198).open_time
+
+        warm_api = FakeAPIClient(last=205)
+        count, store = self.load(archive, warm_api, last=205)
+        assert count == 1
+        # 只请求归档之后的 7 根（199..205，最后一根未收盘）
+        assert warm_api.requests == [("BTC/USDT", "3m", 7, make_kline(199).open_time)]
+        arrays = store.get_arrays("BTC/USDT", "3m", limit=1000)
+        assert len(arrays) == 105  # 归档 100..198 + 增量 199..204
+        assert arrays.close[-1] == 204.0
+        assert archive.last_open_time("BTC/USDT", "3m") == make_kline(204).open_time
+
+    def test_restored_symbols_are_reported_in_completion_order(self, tmp_path):
+        """排在前面的币种增量请求很慢时，后面已恢复的币种先通知"""
+        archive = KlineArchive(tmp_path, capacity=1000)
+        for symbol in ("BTC/USDT", "ETH/USDT"):
+            archive.append(symbol, "3m", [make_kline(i) for i in range(100, 199)], now_ms=now_after(198))
+        eth_loaded = threading.Event()
+
+        class SlowFirstAPIClient(FakeAPIClient):
+            def get_Klines(self, symbol, timeframe, limit=100, since=None):
+                if symbol == "BTC/USDT":
+                    eth_loaded.wait(timeout=5)
+                return super().get_Klines(symbol, timeframe, limit, since)
+
+        reported = []
+
+        def on_symbol_loaded(symbol):
+            reported.append(symbol)
+            if symbol == "ETH/USDT":
+                eth_loaded.set()
+
+        loader = HistoricalDataLoader(SlowFirstAPIClient(last=205), archive=archive)
+        with patch('services.market.historical_loader.time.time', return_value=now_after(204) / 1000):
+            count = loader.load_historical_data(["BTC/USDT", "ETH/USDT"], ["3m"], KlineStore(capacity=1000),
+                                                on_symbol_loaded=on_symbol_loaded, depth=100)
+        assert count == 2
+        assert reported == ["ETH/USDT", "BTC/USDT"]
+
+    def test_up_to_date_archive_needs_no_requests(self, tmp_path):
+        archive = KlineArchive(tmp_path, capacity=1000)
+        archive.append("BTC/USDT", "3m", [make_kline(i) for i in range(50)], now_ms=now_after(49))
+        api = FakeAPIClient(last=50)
+        count, store = self.load(archive, api, last=50, depth=50)
+        assert count == 1
+        assert api.requests == []
+        assert store.count("BTC/USDT", "3m") == 50
+
+    def test_shallow_archive_is_downloaded_again(self, tmp_path):
+        archive = KlineArchive(tmp_path, capacity=1000)
+        archive.append("BTC/USDT", "3m", [make_kline(i) for i in range(50)], now_ms=now_after(49))
+        api = FakeAPIClient(last=50)
+        with patch('services.market.kline_archive.time.time', return_value=now_after(49) / 1000):
+            count, store = self.load(archive, api, last=50, depth=100)
+        assert count == 1
+        assert api.requests == [("BTC/USDT", "3m", 100, None)]
+        assert len(archive.load("BTC/USDT", "3m")['close']) == 99  # 归档按新下载的数据重建
+
+    def test_stale_archive_falls_back_to_full_download(self, tmp_path):
+        archive = KlineArchive(tmp_path, capacity=1000)
+        archive.append("BTC/USDT", "3m", [make_kline(i) for i in range(50)], now_ms=now_after(49))
+        api = FakeAPIClient(last=400)
+        with patch('services.market.kline_archive.time.time', return_value=now_after(399) / 1000):
+            count, store = self.load(archive, api, last=400)
+        assert count == 1
+        assert api.requests == [("BTC/USDT", "3m", 100, None)]
+        # 旧归档与新数据之间有缺口，归档被重建
+        columns = archive.load("BTC/USDT", "3m")
+        assert columns['close'][0] == 301.0 and len(columns['close']) == 99
+
+
+class TestMonitorArchiveWriter:
+    """监控器的归档写入线程"""
+
+    def test_slow_disk_does_not_block_kline_listeners(self, tmp_path):
+        with patch("services.market.monitor.APIClient"):
+            monitor = MarketMonitor({'kline_archive_dir': str(tmp_path)})
+        monitor.kline_store.replace("BTC/USDT", "3m", [make_kline(i) for i in range(10)])
+        release = threading.Event()
+        written = []
+        original_append = monitor.kline_archive.append
+
+        def slow_append(symbol, interval, klines, now_ms=None):
+            release.wait(timeout=10)
+            written.append((threading.current_thread().name, klines[-1].open_time))
+            return original_append(symbol, interval, klines, now_ms=now_ms)
+
+        monitor.kline_archive.append = slow_append
+        monitor._archive_writer.start()
+        try:
+            started = time.monotonic()
+            monitor._notify_kline_closed("BTC/USDT", "3m", make_kline(9).open_time)
+            assert time.monotonic() - started < 0.5
+            assert written == []
+
+            release.set()
+            deadline = time.monotonic() + 5
+            while not written and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert written == [("KlineArchiveWriter", make_kline(9).open_time)]
+        finally:
+            release.set()
+            monitor._archive_writer.stop()
+        open_times = KlineArchive(str(tmp_path)).load("BTC/USDT", "3m", limit=100)['open_time']
+        assert len(open_times) == MarketMonitor.ARCHIVE_SYNC_WINDOW
+        assert open_times[-1] == make_kline(9).open_time
@@ -0,0 +1,184 @@
+"""
+K线缺口回补测试
+- 检测缓存中间的缺口和最新一根之后未收到的已收盘K线
+- 回补写入缓存并触发K线收盘事件；交易所确认没有数据的区间不再重复请求
+"""
+import asyncio
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from services.market.kline_backfill import KlineBackfiller
+from services.market.kline_store import KlineStore
+from services.market.monitor import MarketMonitor
+from services.market.type import Kline
+
+INTERVAL_MS = 180_000
+BASE_TIME = 1_700_000_000_000
+
+
+def make_kline(open_time: int) -> Kline:
+    return Kline(open_time=open_time, open=1.0, high=2.0, low=0.5, close=1.5, volume=10.0,
+                 close_time=open_time + INTERVAL_MS - 1, quote_volume=15.0, trades=3)
+
+
+class FakeAPIClient:
+    """按 since/limit 返回交易所K线；missing 中的 open_time 交易所本身没有数据"""
+
+    def __init__(self, last_open_time: int, missing=()):
+        self.last_open_time = last_open_time
+        self.missing = set(missing)
+        self.requests = []
+
+    def get_Klines(self, symbol, timeframe, limit=100, since=None):
+        self.requests.append((since, limit))
+        klines = []
+        open_time = since
+        while len(klines) < limit and open_time <= self.last_open_time:
+            if open_time not in self.missing:
+                klines.append(make_kline(open_time))
+            open_time += INTERVAL_MS
+        return klines
+
+
+def fill_store(store: KlineStore, indices):
+    for i in indices:
+        kline = make_kline(BASE_TIME + i * INTERVAL_MS)
+        store.upsert("BTC/USDT", "3m", open_time=kline.open_time, open=kline.open, high=kline.high,
+                     low=kline.low, close=kline.close, volume=kline.volume, close_time=kline.close_time,
+                     quote_volume=kline.quote_volume, trades=kline.trades)
+
+
+def now_after(index: int) -> int:
+    """第 index 根K线收盘并超过宽限时间之后的时刻"""
+    return BASE_TIME + (index + 1) * INTERVAL_MS + KlineBackfiller.CLOSE_GRACE_MS + 1
+
+
+def make_backfiller(store, api_client, on_filled=None):
+    return KlineBackfiller(store, api_client, targets=lambda: [("BTC/USDT", "3m")],
+                           on_filled=on_filled, requests_per_second=1000)
+
+
+class TestGapDetection:
+    """缺口检测与数据状态"""
+
+    def test_middle_and_tail_gaps(self):
+        store = KlineStore()
+        fill_store(store, [i for i in range(20) if i not in (5, 6, 12)])
+        backfiller = make_backfiller(store, FakeAPIClient(BASE_TIME))
+
+        ranges = backfiller.missing_ranges("BTC/USDT", "3m", now_ms=now_after(23))
+
+        assert ranges == [
+            (BASE_TIME + 5 * INTERVAL_MS, BASE_TIME + 6 * INTERVAL_MS),
+            (BASE_TIME + 12 * INTERVAL_MS, BASE_TIME + 12 * INTERVAL_MS),
+            (BASE_TIME + 20 * INTERVAL_MS, BASE_TIME + 23 * INTERVAL_MS),
+        ]
+        status = backfiller.status("BTC/USDT", "3m", now_ms=now_after(23))
+        assert status['missing_bars'] == 7
+        assert not status['fresh']
+
+    def test_forming_bar_is_not_missing(self):
+        store = KlineStore()
+        fill_store(store, range(10))
+        backfiller = make_backfiller(store, FakeAPIClient(BASE_TIME))
+
+        # 第 10 根尚未收盘（或刚收盘仍在宽限时间内）
+        status = backfiller.status("BTC/USDT", "3m", now_ms=BASE_TIME + 11 * INTERVAL_MS)
+        assert status['missing_bars'] == 0
+        assert status['fresh']
+
+
+class TestBackfill:
+    """REST 回补"""
+
+    def test_fills_all_gaps_and_notifies(self):
+        store = KlineStore()
+        fill_store(store, [i for i in range(20) if i not in (5, 6, 12)])
+        api_client = FakeAPIClient(BASE_TIME + 23 * INTERVAL_MS)
+        on_filled = MagicMock()
+        backfiller = make_backfiller(store, api_client, on_filled)
+
+        with patch("services.market.kline_backfill.time.time", return_value=now_after(23) / 1000):
+            filled = backfiller.backfill("BTC/USDT", "3m")
+            status = backfiller.status("BTC/USDT", "3m")
+
+        assert filled == 7
+        arrays = store.get_arrays("BTC/USDT", "3m", limit=100)
+        assert list(arrays.open_time) == [BASE_TIME + i * INTERVAL_MS for i in range(24)]
+        on_filled.assert_called_once_with("BTC/USDT", "3m", BASE_TIME + 23 * INTERVAL_MS)
+        assert status['missing_bars'] == 0 and status['fresh']
+
+    def test_long_gap_is_paginated(self):
+        store = KlineStore(capacity=3000)
+        fill_store(store, [0, 2500])
+        api_client = FakeAPIClient(BASE_TIME + 2500 * INTERVAL_MS)
+        backfiller = make_backfiller(store, api_client)
+
+        with patch("services.market.kline_backfill.time.time", return_value=now_after(2500) / 1000):
+            assert backfiller.backfill("BTC/USDT", "3m") == 2499
+
+        assert [limit for _, limit in api_client.requests] == [1000, 1000, 499]
+
+    def test_exchange_gap_is_not_requested_again(self):
+        store = KlineStore()
+        fill_store(store, [0, 1, 4, 5])
+        api_client = FakeAPIClient(BASE_TIME + 5 * INTERVAL_MS, missing={BASE_TIME + 2 * INTERVAL_MS, BASE_TIME + 3 * INTERVAL_MS})
+        backfiller = make_backfiller(store, api_client)
+
+        with patch("services.market.kline_backfill.time.time", return_value=now_after(5) / 1000):
+            assert backfiller.backfill("BTC/USDT", "3m") == 0
+            assert backfiller.backfill("BTC/USDT", "3m") == 0
+            status = backfiller.status("BTC/USDT", "3m")
+
+        assert len(api_client.requests) == 1
+        assert status['missing_bars'] == 0
+
+    def test_background_worker_handles_requests(self):
+        store = KlineStore()
+        fill_store(store, [0, 1, 3])
+        api_client = FakeAPIClient(BASE_TIME + 3 * INTERVAL_MS)
+        backfiller = make_backfiller(store, api_client)
+        backfiller.start()
+        try:
+            backfiller.request([("BTC/USDT", "3m")])
+            deadline = time.monotonic() + 5
+            while store.count("BTC/USDT", "3m") < 4:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+        finally:
+            backfiller.stop()
+
+        assert not backfiller.status("BTC/USDT", "3m")['backfilling']
+
+
+@pytest.fixture
+def monitor():
+    with patch("services.market.monitor.APIClient"):
+        yield MarketMonitor({})
+
+
+class TestMonitorIntegration:
+    """MarketMonitor 重连回补与数据状态"""
+
+    def test_reconnect_requests_backfill_for_kline_streams(self, monitor):
+        monitor._monitored_symbols = {"BTC/USDT", "ETH/USDT"}
+        monitor._symbol_intervals = {"BTC/USDT": {"3m", "4h"}, "ETH/USDT": {"3m"}}
+        monitor.backfiller.request = MagicMock()
+
+        asyncio.run(monitor._on_ws_reconnect(["btcusdt@kline_3m", "btcusdt@ticker", "ethusdt@kline_3m"]))
+
+        pairs = monitor.backfiller.request.call_args[0][0]
+        assert sorted(pairs) == [("BTC/USDT", "3m"), ("ETH/USDT", "3m")]
+
+    def test_data_status(self, monitor):
+        fill_store(monitor.kline_store, [0, 1, 3])
+        monitor._monitored_symbols = {"BTC/USDT"}
+        monitor._symbol_intervals = {"BTC/USDT": {"3m"}}
+
+        with patch("services.market.kline_backfill.time.time", return_value=now_after(3) / 1000):
+            status = monitor.get_data_status("BTC/USDT")
+
+        assert not status['complete']
+        assert status['fresh']
+        assert status['intervals']['3m']['missing_bars'] == 1
+        assert monitor.get_data_status("ETH/USDT") is None
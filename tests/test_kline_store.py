@@ -0,0 +1,346 @@
+"""
+KlineStore 单元测试
+测试核心流程：追加、环形覆盖、按 open_time 更新、零拷贝只读视图
+"""
+import sys
+import threading
+import time
+import pytest
+import numpy as np
+from services.market.kline_store import KlineStore, KlineRingBuffer
+from services.market.lock_stats import InstrumentedLock
+from services.market.type import Kline
+
+
+def make_kline(i: int, interval_ms: int = 180_000) -> Kline:
+    """构造测试K线"""
+    open_time = 1_700_000_000_000 + i * interval_ms
+    return Kline(
+        open_time=open_time,
+        open=100.0 + i,
+        high=101.0 + i,
+        low=99.0 + i,
+        close=100.5 + i,
+        volume=10.0 + i,
+        close_time=open_time + interval_ms - 1,
+        quote_volume=1000.0 + i,
+        trades=i,
+    )
+
+
+def upsert_kline(store: KlineStore, symbol: str, interval: str, kline: Kline):
+    store.upsert(
+        symbol, interval,
+        open_time=kline.open_time, open=kline.open, high=kline.high, low=kline.low,
+        close=kline.close, volume=kline.volume, close_time=kline.close_time,
+        quote_volume=kline.quote_volume, trades=kline.trades,
+    )
+
+
+class TestKlineRingBuffer:
+    """KlineRingBuffer 核心功能测试"""
+
+    def test_append_and_view(self):
+        """测试追加后视图按时间升序返回"""
+        buffer = KlineRingBuffer(capacity=5)
+        for i in range(3):
+            buffer.append_kline(make_kline(i))
+
+        view = buffer.view()
+        assert len(buffer) == 3
+        assert list(view.close) == [100.5, 101.5, 102.5]
+
+    def test_wraparound_keeps_latest(self):
+        """测试缓冲区满后覆盖最旧的K线，且窗口连续"""
+        buffer = KlineRingBuffer(capacity=5)
+        for i in range(12):
+            buffer.append_kline(make_kline(i))
+
+        view = buffer.view()
+        assert len(view) == 5
+        assert list(view.trades) == [7, 8, 9, 10, 11]
+        assert list(buffer.view(2).trades) == [10, 11]
+
+    def test_view_is_readonly_zero_copy(self):
+        """测试视图只读且与缓冲区共享内存"""
+        buffer = KlineRingBuffer(capacity=5)
+        for i in range(3):
+            buffer.append_kline(make_kline(i))
+
+        view = buffer.view()
+        assert not view.close.flags.writeable
+        assert np.shares_memory(view.close, buffer._columns['close'])
+        with pytest.raises(ValueError):
+            view.close[0] = 0.0
+
+
+class TestKlineStore:
+    """KlineStore 核心功能测试"""
+
+    def test_replace_and_get_klines(self):
+        """测试整体替换后读取 Kline 列表"""
+        store = KlineStore(capacity=10)
+        klines = [make_kline(i) for i in range(15)]
+        store.replace("BTC/USDT", "3m", klines)
+
+        result = store.get_klines("BTC/USDT", "3m", limit=3)
+        assert result == klines[-3:]
+        assert store.count("btcusdt", "3m") == 10
+
+    def test_upsert_replaces_same_open_time(self):
+        """测试相同 open_time 的K线原地替换"""
+        store = KlineStore(capacity=10)
+        store.replace("BTC/USDT", "3m", [make_kline(i) for i in range(3)])
+
+        updated = make_kline(2)
+        updated.close = 999.0
+        upsert_kline(store, "BTCUSDT", "3m", updated)
+
+        arrays = store.get_arrays("BTC/USDT", "3m")
+        assert len(arrays) == 3
+        assert arrays.close[-1] == 999.0
+
+    def test_upsert_appends_new_open_time(self):
+        """测试新 open_time 的K线追加到末尾"""
+        store = KlineStore(capacity=10)
+        store.replace("BTC/USDT", "3m", [make_kline(i) for i in range(3)])
+        upsert_kline(store, "BTCUSDT", "3m", make_kline(3))
+
+        arrays = store.get_arrays("BTC/USDT", "3m")
+        assert list(arrays.trades) == [0, 1, 2, 3]
+
+    def test_missing_key_returns_empty(self):
+        """测试没有缓存时的返回值"""
+        store = KlineStore(capacity=10)
+        assert store.get_arrays("ETH/USDT", "4h") is None
+        assert store.get_klines("ETH/USDT", "4h") == []
+
+    def test_remove_symbol(self):
+        """测试移除交易对会清理所有周期的缓存"""
+        store = KlineStore(capacity=10)
+        store.replace("BTC/USDT", "3m", [make_kline(0)])
+        store.replace("BTC/USDT", "4h", [make_kline(0)])
+        store.replace("ETH/USDT", "3m", [make_kline(0)])
+
+        store.remove_symbol("BTC/USDT")
+
+        assert store.count("BTC/USDT", "3m") == 0
+        assert store.count("BTC/USDT", "4h") == 0
+        assert store.count("ETH/USDT", "3m") == 1
+
+    def test_upsert_out_of_order_inserts_sorted(self):
+        """测试乱序到达的旧K线按时间顺序插入"""
+        store = KlineStore(capacity=10)
+        store.replace("BTC/USDT", "3m", [make_kline(i) for i in (0, 1, 3, 4)])
+        upsert_kline(store, "BTCUSDT", "3m", make_kline(2))
+
+        arrays = store.get_arrays("BTC/USDT", "3m")
+        assert list(arrays.trades) == [0, 1, 2, 3, 4]
+        assert np.all(np.diff(arrays.open_time) > 0)
+
+    def test_upsert_out_of_order_duplicate_replaced(self):
+        """测试乱序到达的重复K线原地替换，不改变长度"""
+        store = KlineStore(capacity=10)
+        store.replace("BTC/USDT", "3m", [make_kline(i) for i in range(5)])
+
+        duplicate = make_kline(1)
+        duplicate.close = 555.0
+        upsert_kline(store, "BTCUSDT", "3m", duplicate)
+
+        arrays = store.get_arrays("BTC/USDT", "3m")
+        assert len(arrays) == 5
+        assert arrays.close[1] == 555.0
+
+    def test_upsert_older_than_full_buffer_is_dropped(self):
+        """测试缓冲区已满时，比最旧K线还旧的K线被丢弃"""
+        store = KlineStore(capacity=3)
+        store.replace("BTC/USDT", "3m", [make_kline(i) for i in range(5, 8)])
+        upsert_kline(store, "BTCUSDT", "3m", make_kline(1))
+
+        assert list(store.get_arrays("BTC/USDT", "3m").trades) == [5, 6, 7]
+
+    def test_upsert_out_of_order_into_full_buffer_evicts_oldest(self):
+        """测试缓冲区已满时插入中间的K线会挤掉最旧的一根"""
+        store = KlineStore(capacity=3)
+        store.replace("BTC/USDT", "3m", [make_kline(i) for i in (4, 6, 7)])
+        upsert_kline(store, "BTCUSDT", "3m", make_kline(5))
+
+        assert list(store.get_arrays("BTC/USDT", "3m").trades) == [5, 6, 7]
+
+
+def set_forming(buffer: KlineRingBuffer, kline: Kline):
+    buffer.set_forming(kline.open_time, kline.open, kline.high, kline.low, kline.close,
+                       kline.volume, kline.close_time, kline.quote_volume, kline.trades)
+
+
+class TestFormingBar:
+    """未收盘K线槽位"""
+
+    def test_forming_bar_is_opt_in(self):
+        """默认视图只含已收盘K线，include_forming 时末尾追加未收盘K线"""
+        buffer = KlineRingBuffer(capacity=3)
+        for i in range(5):
+            buffer.append_kline(make_kline(i))
+        set_forming(buffer, make_kline(5))
+
+        assert list(buffer.view().trades) == [2, 3, 4]
+        assert list(buffer.view(include_forming=True).trades) == [2, 3, 4, 5]
+        assert list(buffer.view(2, include_forming=True).trades) == [4, 5]
+        assert buffer.last_open_time() == make_kline(4).open_time
+
+    def test_forming_updates_in_place_and_closes(self):
+        """未收盘K线原地更新，收盘后成为普通K线"""
+        buffer = KlineRingBuffer(capacity=3)
+        for i in range(3):
+            buffer.append_kline(make_kline(i))
+        set_forming(buffer, make_kline(3))
+        live = buffer.view(include_forming=True)
+
+        updated = make_kline(3)
+        updated.close = 999.0
+        set_forming(buffer, updated)
+        assert live.close[-1] == 999.0  # 视图与槽位共享内存
+
+        buffer.append_kline(updated)
+        assert not buffer.has_forming()
+        assert list(buffer.view(include_forming=True).close) == [101.5, 102.5, 999.0]
+
+    def test_stale_forming_push_is_ignored(self):
+        """收盘消息之后迟到的未收盘推送被忽略"""
+        buffer = KlineRingBuffer(capacity=3)
+        buffer.append_kline(make_kline(0))
+        set_forming(buffer, make_kline(0))
+        assert not buffer.has_forming()
+
+    def test_forming_survives_older_inserts(self):
+        """回补旧K线（追加或插入中间）不会覆盖未收盘K线"""
+        store = KlineStore(capacity=5)
+        store.replace("BTC/USDT", "3m", [make_kline(i) for i in (0, 2)])
+        forming = make_kline(5)
+        store.update_forming("BTC/USDT", "3m", open_time=forming.open_time, open=forming.open,
+                             high=forming.high, low=forming.low, close=forming.close, volume=forming.volume,
+                             close_time=forming.close_time, quote_volume=forming.quote_volume,
+                             trades=forming.trades)
+        upsert_kline(store, "BTC/USDT", "3m", make_kline(3))
+        upsert_kline(store, "BTC/USDT", "3m", make_kline(1))
+
+        assert list(store.get_arrays("BTC/USDT", "3m").trades) == [0, 1, 2, 3]
+        assert list(store.get_arrays("BTC/USDT", "3m", include_forming=True).trades) == [0, 1, 2, 3, 5]
+
+    def test_replace_routes_open_bar_to_forming_slot(self):
+        """REST 返回的未收盘K线写入未收盘槽位，之后的推送继续原地更新"""
+        store = KlineStore(capacity=5)
+        forming = make_kline(3)
+        forming.close = 100.0
+        store.replace("BTC/USDT", "3m", [make_kline(i) for i in range(3)] + [forming],
+                      now_ms=forming.open_time + 1_000)
+
+        assert list(store.get_arrays("BTC/USDT", "3m").trades) == [0, 1, 2]
+        assert store.last_open_time("BTC/USDT", "3m") == make_kline(2).open_time
+        assert store.get_klines("BTC/USDT", "3m", include_forming=True)[-1].close == 100.0
+
+        store.update_forming("BTC/USDT", "3m", open_time=forming.open_time, open=forming.open,
+                             high=forming.high, low=forming.low, close=150.0, volume=forming.volume,
+                             close_time=forming.close_time, quote_volume=forming.quote_volume,
+                             trades=forming.trades)
+        assert store.get_klines("BTC/USDT", "3m", include_forming=True)[-1].close == 150.0
+        assert store.get_klines("BTC/USDT", "3m")[-1].close == make_kline(2).close
+
+    def test_replace_keeps_closed_last_bar(self):
+        """最后一根已收盘时全部作为已收盘K线写入"""
+        store = KlineStore(capacity=5)
+        klines = [make_kline(i) for i in range(4)]
+        store.replace("BTC/USDT", "3m", klines, now_ms=klines[-1].close_time + 1)
+        assert list(store.get_arrays("BTC/USDT", "3m", include_forming=True).trades) == [0, 1, 2, 3]
+
+
+class TestConcurrentReads:
+    """读写并发"""
+
+    def test_get_klines_never_returns_torn_rows(self):
+        """写线程不断原地改写K线时，get_klines 返回的每一行字段都来自同一次写入"""
+        store = KlineStore(capacity=200)
+        store.replace("BTC/USDT", "3m", [make_kline(i) for i in range(200)])
+        forming = make_kline(200)
+        rewritten = {make_kline(i).open_time for i in (0, 100, 199)} | {forming.open_time}
+        stop = threading.Event()
+        torn = []
+
+        def rewrite(value: int):
+            for i in (0, 100, 199):
+                kline = make_kline(i)
+                store.upsert("BTC/USDT", "3m", open_time=kline.open_time, open=value, high=value,
+                             low=value, close=value, volume=value, close_time=kline.close_time,
+                             quote_volume=value, trades=value)
+            store.update_forming("BTC/USDT", "3m", open_time=forming.open_time, open=value, high=value,
+                                 low=value, close=value, volume=value, close_time=forming.close_time,
+                                 quote_volume=value, trades=value)
+
+        def writer():
+            value = 0
+            while not stop.is_set():
+                value += 1
+                rewrite(value)
+
+        rewrite(0)
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # 频繁切换线程，放大读写交错的机会
+        thread = threading.Thread(target=writer, daemon=True)
+        thread.start()
+        try:
+            deadline = time.monotonic() + 0.5
+            while time.monotonic() < deadline:
+                for kline in store.get_klines("BTC/USDT", "3m", limit=200, include_forming=True):
+                    if kline.open_time in rewritten and not (kline.open == kline.close == kline.volume == kline.trades):
+                        torn.append(kline)
+        finally:
+            stop.set()
+            thread.join(timeout=2)
+            sys.setswitchinterval(switch_interval)
+        assert torn == []
+
+
+class TestLockStats:
+    """分片锁与竞争统计测试"""
+
+    def test_uncontended_lock_records_no_wait(self):
+        """测试无竞争时只计数不计等待"""
+        lock = InstrumentedLock()
+        for _ in range(3):
+            with lock:
+                pass
+
+        assert lock.acquisitions == 3
+        assert lock.contended == 0
+        assert lock.total_wait == 0.0
+
+    def test_contended_lock_records_wait(self):
+        """测试发生竞争时记录等待时间"""
+        lock = InstrumentedLock()
+        lock.acquire()
+        waiter = threading.Thread(target=lambda: (lock.acquire(), lock.release()))
+        waiter.start()
+        time.sleep(0.05)
+        lock.release()
+        waiter.join()
+
+        assert lock.contended == 1
+        assert lock.max_wait > 0.0
+
+    def test_store_shards_locks_per_key(self):
+        """测试每个 symbol/interval 使用独立的锁，统计可按分片汇总"""
+        store = KlineStore(capacity=10)
+        store.replace("BTC/USDT", "3m", [make_kline(0)])
+        store.replace("ETH/USDT", "3m", [make_kline(0)])
+
+        btc = store._buffers[store.make_key("BTC/USDT", "3m")]
+        eth = store._buffers[store.make_key("ETH/USDT", "3m")]
+        assert btc.lock is not eth.lock
+
+        with btc.lock:
+            # 持有 BTC 分片锁时，ETH 的读取不受影响
+            assert store.get_arrays("ETH/USDT", "3m") is not None
+
+        stats = store.lock_stats()
+        assert stats['shards'] == 2
+        assert stats['acquisitions'] >= 3
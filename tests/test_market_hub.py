@@ -0,0 +1,109 @@
+"""
+MarketDataHub 单元测试
+测试核心流程：共享监控器、按交易员引用计数启动/停止、订阅取并集
+"""
+import asyncio
+import threading
+import pytest
+from unittest.mock import patch
+from services.market.market_hub import MarketDataHub
+from services.market.monitor import MarketMonitor
+from services.market.type import Kline
+
+CLOSED_KLINE = Kline(open_time=1_700_000_100_000, open=1.0, high=2.0, low=0.5, close=1.5, volume=1.0,
+                     close_time=1_700_000_279_999, quote_volume=1.5, trades=1)
+
+
+@pytest.fixture
+def hub():
+    with patch("services.market.monitor.APIClient") as api_client_cls:
+        api_client_cls.return_value.get_Klines.return_value = [CLOSED_KLINE]
+        with patch.object(MarketMonitor, "start") as start, patch.object(MarketMonitor, "stop") as stop:
+            running = {"value": False}
+            start.side_effect = lambda: running.update(value=True)
+            stop.side_effect = lambda: running.update(value=False)
+            with patch.object(MarketMonitor, "is_running", lambda self: running["value"]):
+                yield MarketDataHub()
+
+
+class TestMarketDataHub:
+    """MarketDataHub 核心功能测试"""
+
+    def test_traders_share_one_monitor(self, hub):
+        """测试同一交易所的交易员拿到同一个监控器"""
+        monitor_a = hub.get_monitor({'name': 'binance'})
+        monitor_b = hub.get_monitor({'name': 'binance'})
+        assert monitor_a is monitor_b
+
+    def test_monitor_started_once_and_stopped_by_last_owner(self, hub):
+        """测试第一个交易员启动监控器，最后一个交易员释放时才停止"""
+        monitor = hub.get_monitor()
+
+        hub.acquire("trader-a")
+        hub.acquire("trader-b")
+        assert MarketMonitor.start.call_count == 1
+
+        hub.release("trader-a")
+        assert MarketMonitor.stop.call_count == 0
+        assert monitor.is_running()
+
+        hub.release("trader-b")
+        assert MarketMonitor.stop.call_count == 1
+
+    def test_release_unknown_owner_is_noop(self, hub):
+        """测试释放未登记的交易员不会影响监控器"""
+        hub.acquire("trader-a")
+        hub.release("trader-x")
+        assert MarketMonitor.stop.call_count == 0
+
+    def test_subscriptions_are_unioned_and_dropped_by_last_owner(self, hub):
+        """测试订阅取并集，最后一个交易员释放后才退订"""
+        monitor = hub.get_monitor()
+        asyncio.run(monitor.add_symbol("BTC/USDT", ["3m"], owner="trader-a"))
+        asyncio.run(monitor.add_symbol("BTC/USDT", ["3m", "4h"], owner="trader-b"))
+
+        assert set(monitor.ws_client.subscribed_streams) == {
+            "btcusdt@kline_3m", "btcusdt@kline_4h", "btcusdt@ticker"
+        }
+
+        asyncio.run(monitor.release_owner("trader-a"))
+        assert monitor.is_monitoring("BTC/USDT")
+        assert not monitor.is_monitoring("BTC/USDT", owner="trader-a")
+
+        asyncio.run(monitor.release_owner("trader-b"))
+        assert not monitor.is_monitoring("BTC/USDT")
+        assert monitor.ws_client.subscribed_streams == []
+
+    def test_conflicting_monitor_config_is_warned(self, hub):
+        """测试后来的交易员配置与共享监控器不同时给出警告"""
+        hub.get_monitor({'name': 'binance', 'ws_combined_streams': True})
+        with patch("services.market.market_hub.logger") as logger:
+            hub.get_monitor({'name': 'binance', 'ws_combined_streams': True})
+            logger.warning.assert_not_called()
+            hub.get_monitor({'name': 'binance', 'ws_combined_streams': False, 'kline_archive_dir': '/tmp/k'})
+            message = logger.warning.call_args[0][0]
+        assert 'ws_combined_streams' in message and 'kline_archive_dir' in message
+
+    def test_release_does_not_block_hub_while_stopping(self, hub):
+        """测试停止监控器期间不持有中心锁，其他调用不被阻塞"""
+        hub.acquire("trader-a")
+        stopping = threading.Event()
+        finish = threading.Event()
+
+        def slow_stop():
+            stopping.set()
+            finish.wait(timeout=5)
+
+        MarketMonitor.stop.side_effect = slow_stop
+        thread = threading.Thread(target=hub.release, args=("trader-a",))
+        thread.start()
+        assert stopping.wait(timeout=2)
+        status = {}
+        reader = threading.Thread(target=lambda: status.update(hub.get_status()))
+        reader.start()
+        reader.join(timeout=1)
+        finished_while_stopping = not reader.is_alive()
+        finish.set()
+        thread.join(timeout=2)
+        assert finished_while_stopping
+        assert status['binance']['owners'] == []
@@ -0,0 +1,85 @@
+"""
+市场数据缓存测试
+- 多个交易所实例共享一次下载，过期后重新下载
+- 磁盘快照在重启后可直接使用；预建的交易对索引与原筛选逻辑一致
+"""
+import time
+from unittest.mock import patch
+from services.market.markets_cache import MarketsCache
+
+MARKETS = {
+    "BTC/USDT:USDT": {"id": "BTCUSDT", "symbol": "BTC/USDT:USDT", "type": "swap", "settle": "USDT", "active": True},
+    "ETH/USDT:USDT": {"id": "ETHUSDT", "symbol": "ETH/USDT:USDT", "type": "swap", "settle": "USDT", "active": True},
+    "OLD/USDT:USDT": {"id": "OLDUSDT", "symbol": "OLD/USDT:USDT", "type": "swap", "settle": "USDT", "active": False},
+    "BTC/USDT": {"id": "BTCUSDT", "symbol": "BTC/USDT", "type": "spot", "active": True},
+    "BTC/USD:BTC": {"id": "BTCUSD_PERP", "symbol": "BTC/USD:BTC", "type": "swap", "settle": "BTC", "active": True},
+}
+
+
+class FakeExchange:
+    """模拟 ccxt 同步交易所实例的 load_markets / set_markets"""
+
+    def __init__(self):
+        self.markets = {}
+        self.currencies = {}
+        self.load_count = 0
+        self.set_count = 0
+
+    def load_markets(self, reload=False):
+        self.load_count += 1
+        self.markets = dict(MARKETS)
+        return self.markets
+
+    def set_markets(self, markets, currencies=None):
+        self.set_count += 1
+        self.markets = {market["symbol"]: market for market in markets}
+        return self.markets
+
+
+class TestMarketsCache:
+    """进程级市场数据缓存"""
+
+    def test_exchanges_share_one_download(self):
+        cache = MarketsCache()
+        first, second = FakeExchange(), FakeExchange()
+        cache.apply(first)
+        cache.apply(second)
+        cache.apply(second)
+        assert (first.load_count, second.load_count) == (1, 0)
+        assert second.set_count == 1  # 已装入当前版本时不再重复 set_markets
+        assert set(second.markets) == set(MARKETS)
+
+    def test_ttl_expiry_reloads(self):
+        cache = MarketsCache(ttl_seconds=60)
+        exchange = FakeExchange()
+        with patch("services.market.markets_cache.time.time", return_value=1000.0):
+            cache.apply(exchange)
+        with patch("services.market.markets_cache.time.time", return_value=1059.0):
+            cache.apply(exchange)
+        assert exchange.load_count == 1
+        with patch("services.market.markets_cache.time.time", return_value=1061.0):
+            cache.apply(exchange)
+        assert exchange.load_count == 2
+
+    def test_snapshot_survives_restart(self, tmp_path):
+        path = tmp_path / "markets.json"
+        MarketsCache(snapshot_path=str(path)).apply(FakeExchange())
+        assert path.exists()
+
+        restarted = MarketsCache(snapshot_path=str(path))
+        exchange = FakeExchange()
+        restarted.apply(exchange)
+        assert exchange.load_count == 0
+        assert set(exchange.markets) == set(MARKETS)
+
+        expired = MarketsCache(ttl_seconds=60, snapshot_path=str(path))
+        with patch("services.market.markets_cache.time.time", return_value=time.time() + 120):
+            assert expired.get() is None
+
+    def test_symbol_index(self):
+        cache = MarketsCache()
+        cache.store(MARKETS)
+        assert cache.tradable_symbols() == ["BTC/USDT", "ETH/USDT"]
+        for symbol in ("BTC", "btcusdt", "BTC/USDT", "BTC/USDT:USDT"):
+            assert cache.perpetual(symbol)["symbol"] == "BTC/USDT:USDT"
+        assert cache.perpetual("OLD") is None
@@ -0,0 +1,109 @@
+"""
+MarketMonitor K线消息处理基准测试
+验证 _on_kline_message 的单条消息耗时不随缓存深度和交易对数量增长
+
+运行: pytest tests/test_monitor_benchmark.py --benchmark-group-by=func
+"""
+import time
+import pytest
+from unittest.mock import patch
+
+pytest.importorskip("pytest_benchmark")
+
+from services.market.monitor import MarketMonitor
+
+INTERVAL_MS = 180_000
+BASE_TIME = 1_700_000_000_000
+MESSAGES_PER_ROUND = 1000  # 每轮固定消息数，不同参数下的耗时可直接比较
+
+
+def make_kline_message(symbol: str, open_time: int, close: float) -> dict:
+    """构造 Binance kline 推送消息"""
+    return {
+        "e": "kline",
+        "s": symbol,
+        "k": {
+            "t": open_time,
+            "T": open_time + INTERVAL_MS - 1,
+            "s": symbol,
+            "i": "3m",
+            "o": "100.0",
+            "h": "101.0",
+            "l": "99.0",
+            "c": str(close),
+            "v": "10.0",
+            "q": "1000.0",
+            "n": 42,
+            "x": True,
+        },
+    }
+
+
+@pytest.fixture
+def monitor():
+    with patch("services.market.monitor.APIClient"):
+        yield MarketMonitor({})
+
+
+def fill(monitor, symbols, depth: int):
+    """每个交易对预填充 depth 根已收盘K线"""
+    for symbol in symbols:
+        for i in range(depth):
+            monitor.kline_store.upsert(
+                symbol, "3m", open_time=BASE_TIME + i * INTERVAL_MS, open=100.0, high=101.0,
+                low=99.0, close=100.0, volume=10.0, close_time=BASE_TIME + (i + 1) * INTERVAL_MS - 1,
+                quote_volume=1000.0, trades=42,
+            )
+
+
+def make_messages(symbols, depth: int) -> list:
+    """三种常见路径轮流出现：新K线追加、重复推送最新K线、修正窗口中间的旧K线"""
+    messages = []
+    for i in range(MESSAGES_PER_ROUND):
+        symbol = symbols[i % len(symbols)]
+        kind = i % 3
+        if kind == 0:
+            open_time = BASE_TIME + depth * INTERVAL_MS
+        elif kind == 1:
+            open_time = BASE_TIME + (depth - 1) * INTERVAL_MS
+        else:
+            open_time = BASE_TIME + (depth // 2) * INTERVAL_MS
+        messages.append(make_kline_message(symbol, open_time, 100.0 + i))
+    return messages
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("symbol_count", [10, 500])
+@pytest.mark.parametrize("depth", [100, 1000])
+def test_kline_message_cost(benchmark, monitor, depth, symbol_count):
+    """预填充 depth 根K线后，循环推送每个交易对的新K线/最新K线/旧K线修正"""
+    symbols = [f"SYM{i}USDT" for i in range(symbol_count)]
+    fill(monitor, symbols, depth)
+    messages = make_messages(symbols, depth)
+
+    def handle_all():
+        for message in messages:
+            monitor._on_kline_message(message)
+
+    benchmark(handle_all)
+    assert monitor.kline_store.count(symbols[0], "3m") == min(depth + 1, MarketMonitor.KLINE_CACHE_SIZE)
+
+
+@pytest.mark.slow
+def test_kline_message_cost_is_flat():
+    """缓存深度增加 10 倍时，单条消息耗时基本不变（取多轮最小值，允许 3 倍波动）"""
+    symbols = [f"SYM{i}USDT" for i in range(10)]
+    timings = {}
+    for depth in (100, 1000):
+        with patch("services.market.monitor.APIClient"):
+            monitor = MarketMonitor({})
+        fill(monitor, symbols, depth)
+        messages = make_messages(symbols, depth)
+        best = float("inf")
+        for _ in range(5):
+            started = time.perf_counter()
+            for message in messages:
+                monitor._on_kline_message(message)
+            best = min(best, time.perf_counter() - started)
+        timings[depth] = best
+    assert timings[1000] / timings[100] < 3.0, timings
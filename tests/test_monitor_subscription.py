@@ -0,0 +1,183 @@
+"""
+MarketMonitor 跨线程批量订阅测试
+subscribe_many 必须在监控器自己的事件循环中执行，并把所有流合并为一个 SUBSCRIBE 请求
+"""
+import asyncio
+import json
+import threading
+import pytest
+from unittest.mock import patch
+from services.market.historical_loader import page_requests
+from services.market.monitor import MarketMonitor
+from services.market.type import Kline
+
+CLOSED_KLINE = Kline(open_time=1_700_000_100_000, open=1.0, high=2.0, low=0.5, close=1.5, volume=1.0,
+                     close_time=1_700_000_279_999, quote_volume=1.5, trades=1)
+
+
+class FakeConnection:
+    """记录发送的帧以及发送所在的线程"""
+
+    def __init__(self):
+        self.frames = []
+        self.threads = set()
+
+    async def send(self, message: str):
+        self.frames.append(json.loads(message))
+        self.threads.add(threading.current_thread().name)
+
+
+@pytest.fixture
+def monitor():
+    with patch("services.market.monitor.APIClient") as api_client_cls:
+        api_client_cls.return_value.get_Klines.return_value = [CLOSED_KLINE]
+        yield MarketMonitor({})
+
+
+@pytest.fixture
+def running_loop(monitor):
+    """在独立线程中运行事件循环，模拟监控线程（不建立真实连接）"""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True, name="MarketMonitor")
+    thread.start()
+    monitor._loop = loop
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    loop.close()
+
+
+class TestSubscribeMany:
+    """跨线程批量订阅"""
+
+    def test_runs_on_monitor_loop_with_one_frame(self, monitor, running_loop):
+        connection = FakeConnection()
+        monitor.ws_client.clients[0].conn = connection
+
+        future = monitor.subscribe_many(["BTC/USDT", "ETH/USDT"], ["3m", "4h"], owner="trader-a")
+        future.result(timeout=5)
+
+        assert connection.threads == {"MarketMonitor"}
+        assert len(connection.frames) == 1
+        assert connection.frames[0]["method"] == "SUBSCRIBE"
+        assert set(connection.frames[0]["params"]) == {
+            "btcusdt@kline_3m", "btcusdt@kline_4h", "btcusdt@ticker",
+            "ethusdt@kline_3m", "ethusdt@kline_4h", "ethusdt@ticker",
+        }
+        assert monitor.is_monitoring("BTC/USDT", owner="trader-a")
+        # 每个 symbol/interval 按分页加载历史K线
+        pages = len(page_requests("3m", MarketMonitor.HISTORY_DEPTH))
+        assert monitor.api_client.get_Klines.call_count == 4 * pages
+
+    def test_existing_streams_are_not_resubscribed(self, monitor, running_loop):
+        connection = FakeConnection()
+        monitor.ws_client.clients[0].conn = connection
+        monitor.subscribe_many(["BTC/USDT"], ["3m"], owner="trader-a").result(timeout=5)
+        monitor.subscribe_many(["BTC/USDT", "ETH/USDT"], ["3m"], owner="trader-b").result(timeout=5)
+
+        assert [frame["params"] for frame in connection.frames] == [
+            ["btcusdt@kline_3m", "btcusdt@ticker"],
+            ["ethusdt@kline_3m", "ethusdt@ticker"],
+        ]
+        assert monitor.is_monitoring("BTC/USDT", owner="trader-b")
+
+    def test_without_running_loop_records_streams(self, monitor):
+        """监控器未启动时直接登记订阅，连接建立后统一发送"""
+        monitor.subscribe_many(["BTC/USDT"], ["3m"]).result(timeout=5)
+        assert monitor.ws_client.subscribed_streams == ["btcusdt@kline_3m", "btcusdt@ticker"]
+
+    def test_unsubscribe_is_batched(self, monitor, running_loop):
+        connection = FakeConnection()
+        monitor.ws_client.clients[0].conn = connection
+        monitor.subscribe_many(["BTC/USDT"], ["3m", "4h"], owner="trader-a").result(timeout=5)
+
+        asyncio.run_coroutine_threadsafe(monitor.remove_symbol("BTC/USDT"), running_loop).result(timeout=5)
+
+        assert connection.frames[-1]["method"] == "UNSUBSCRIBE"
+        assert set(connection.frames[-1]["params"]) == {"btcusdt@kline_3m", "btcusdt@kline_4h", "btcusdt@ticker"}
+        assert monitor.ws_client.subscribed_streams == []
+
+
+    def test_failed_history_is_not_subscribed(self, monitor, running_loop):
+        """历史数据加载失败的 symbol/interval 不标记为监控中、不订阅，之后可以重新添加"""
+        connection = FakeConnection()
+        monitor.ws_client.clients[0].conn = connection
+        fetch = monitor.api_client.get_Klines
+        fetch.side_effect = lambda symbol, interval, limit=100, since=None: (
+            [] if symbol == "ETH/USDT" or interval == "4h" else [CLOSED_KLINE]
+        )
+        monitor.subscribe_many(["BTC/USDT", "ETH/USDT"], ["3m", "4h"], owner="trader-a").result(timeout=5)
+
+        assert connection.frames[0]["params"] == ["btcusdt@kline_3m", "btcusdt@ticker"]
+        assert monitor.is_monitoring("BTC/USDT") and not monitor.is_monitoring("ETH/USDT")
+        assert monitor._symbol_intervals == {"BTC/USDT": {"3m"}}
+        assert "ETH/USDT" not in monitor._symbol_owners
+
+        fetch.side_effect = None
+        monitor.subscribe_many(["BTC/USDT", "ETH/USDT"], ["3m", "4h"], owner="trader-a").result(timeout=5)
+        assert set(connection.frames[1]["params"]) == {
+            "btcusdt@kline_4h", "ethusdt@kline_3m", "ethusdt@kline_4h", "ethusdt@ticker",
+        }
+        assert monitor.is_monitoring("ETH/USDT")
+
+    def test_history_load_timeout_scales_with_requests(self, monitor):
+        """订阅前的历史加载耗时按并发批次和分页数估算"""
+        pages = len(page_requests("3m", MarketMonitor.HISTORY_DEPTH))
+        per_batch = pages * MarketMonitor.HISTORY_REQUEST_SECONDS
+        assert monitor.history_load_timeout(0, ["3m", "4h"]) == 0.0
+        assert monitor.history_load_timeout(1, ["3m", "4h"]) == per_batch
+        # 6 个交易对 × 2 个周期 = 12 个加载，按 5 个并发分 3 批
+        assert monitor.history_load_timeout(6, ["3m", "4h"]) == 3 * per_batch
+
+
+class TestMarketWideStreams:
+    """全市场流模式"""
+
+    def test_array_streams_fill_caches_and_skip_per_symbol_ticker(self, monitor):
+        monitor.enable_market_streams().result(timeout=5)
+        monitor.subscribe_many(["BTC/USDT"], ["3m"]).result(timeout=5)
+
+        assert set(monitor.ws_client.subscribed_streams) == {
+            MarketMonitor.MARKET_TICKER_STREAM, MarketMonitor.MARKET_MARK_PRICE_STREAM, "btcusdt@kline_3m",
+        }
+
+        monitor._on_ticker_array_message([
+            {"e": "24hrTicker", "s": "BTCUSDT", "c": "65000.5"},
+            {"e": "24hrTicker", "s": "DOGEUSDT", "c": "0.1"},
+        ])
+        monitor._on_mark_price_array_message([
+            {"e": "markPriceUpdate", "s": "DOGEUSDT", "p": "0.1001", "i": "0.1", "r": "0.0001", "T": 1700000000000},
+        ])
+
+        assert monitor.get_latest_price("BTC/USDT") == 65000.5
+        assert monitor.get_ticker("DOGE/USDT")["c"] == "0.1"
+        assert monitor.get_mark_price("DOGE/USDT")["funding_rate"] == 0.0001
+
+    def test_enable_is_idempotent(self, monitor):
+        monitor.enable_market_streams().result(timeout=5)
+        monitor.enable_market_streams().result(timeout=5)
+        client = monitor.ws_client.clients[0]
+        assert len(client.subscribers[MarketMonitor.MARKET_TICKER_STREAM]) == 1
+
+
+class TestFormingKline:
+    """未收盘K线推送"""
+
+    @staticmethod
+    def kline_message(open_time: int, close: str, closed: bool) -> dict:
+        return {"e": "kline", "s": "BTCUSDT", "k": {
+            "t": open_time, "T": open_time + 179_999, "s": "BTCUSDT", "i": "3m", "o": "1", "h": "2",
+            "l": "0.5", "c": close, "v": "1", "q": "1", "n": 1, "x": closed,
+        }}
+
+    def test_forming_updates_price_without_closing(self, monitor):
+        listener = []
+        monitor.add_kline_listener(lambda *args: listener.append(args))
+        monitor._on_kline_message(self.kline_message(0, "1.5", closed=True))
+        monitor._on_kline_message(self.kline_message(180_000, "1.7", closed=False))
+        monitor._on_kline_message(self.kline_message(180_000, "1.8", closed=False))
+
+        assert monitor.get_latest_price("BTC/USDT") == 1.8
+        assert [k.close for k in monitor.get_klines("BTC/USDT", "3m")] == [1.5]
+        assert [k.close for k in monitor.get_klines("BTC/USDT", "3m", include_forming=True)] == [1.5, 1.8]
+        assert listener == [("BTCUSDT", "3m", 0)]
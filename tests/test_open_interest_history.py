@@ -0,0 +1,118 @@
+"""
+持仓量历史测试
+- 环形缓冲区按周期去重，滚动均值与完整求和一致
+- 缺失的周期不计入均值，间隔超过窗口时丢弃旧采样
+- 预热只在没有数据时写入，摘要在覆盖整个窗口后给出变化量和变化百分比
+"""
+import numpy as np
+import pytest
+from services.market.open_interest_history import OpenInterestHistory, OpenInterestRing
+
+PERIOD_MS = 300_000
+BASE_TIME = 1_700_000_000_000
+
+
+class TestOpenInterestRing:
+    """单个交易对的环形缓冲区"""
+
+    def test_rolling_average_matches_full_sum(self):
+        rng = np.random.default_rng(7)
+        values = rng.uniform(1e6, 2e6, 500)
+        ring = OpenInterestRing(capacity=48, period_ms=PERIOD_MS)
+        for i, value in enumerate(values):
+            ring.record(BASE_TIME + i * PERIOD_MS, value)
+            window = values[max(0, i - 47):i + 1]
+            assert ring.average == pytest.approx(window.mean(), rel=1e-12)
+        assert len(ring) == 48
+        assert ring.latest == values[-1]
+        assert ring.oldest == values[-48]
+        assert np.array_equal(ring.values(), values[-48:])
+
+    def test_same_period_replaces_latest_and_older_is_ignored(self):
+        ring = OpenInterestRing(capacity=4, period_ms=PERIOD_MS)
+        ring.record(BASE_TIME, 100.0)
+        ring.record(BASE_TIME + PERIOD_MS, 200.0)
+        assert ring.record(BASE_TIME + PERIOD_MS + 60_000, 300.0)
+        assert not ring.record(BASE_TIME, 50.0)
+        assert len(ring) == 2
+        assert ring.average == 200.0
+        assert ring.latest == 300.0
+
+    def test_missing_periods_are_skipped(self):
+        ring = OpenInterestRing(capacity=4, period_ms=PERIOD_MS)
+        ring.record(BASE_TIME, 100.0)
+        ring.record(BASE_TIME + 2 * PERIOD_MS, 300.0)
+        assert len(ring) == 2
+        assert not ring.full
+        assert ring.average == 200.0
+        assert np.array_equal(ring.values(), [100.0, np.nan, 300.0], equal_nan=True)
+
+        ring.record(BASE_TIME + 3 * PERIOD_MS, 400.0)
+        assert ring.full
+        ring.record(BASE_TIME + 4 * PERIOD_MS, 500.0)
+        # 100 移出窗口，最早的采样是 300（缺失的周期跳过）
+        assert ring.oldest == 300.0
+        assert ring.average == pytest.approx(400.0)
+
+    def test_gap_longer_than_window_restarts(self):
+        ring = OpenInterestRing(capacity=4, period_ms=PERIOD_MS)
+        for i in range(4):
+            ring.record(BASE_TIME + i * PERIOD_MS, 100.0 + i)
+        ring.record(BASE_TIME + 40 * PERIOD_MS, 500.0)
+        assert len(ring) == 1
+        assert not ring.full
+        assert (ring.oldest, ring.latest, ring.average) == (500.0, 500.0, 500.0)
+
+
+class TestOpenInterestHistory:
+    """全部交易对的持仓量历史"""
+
+    def test_seed_then_record(self):
+        history = OpenInterestHistory(window=4, period_ms=PERIOD_MS)
+        history.seed("BTCUSDT", [(BASE_TIME + i * PERIOD_MS, 100.0 + i) for i in range(6)])
+        history.record("BTCUSDT", 110.0, BASE_TIME + 6 * PERIOD_MS)
+        summary = history.summary("BTCUSDT")
+        assert summary['samples'] == 4
+        assert summary['average'] == pytest.approx((103 + 104 + 105 + 110) / 4)
+        assert summary['delta'] == pytest.approx(7.0)
+        assert summary['change_pct'] == pytest.approx((110 / 103 - 1) * 100)
+
+    def test_seed_does_not_overwrite_and_invalid_values_ignored(self):
+        history = OpenInterestHistory(window=4, period_ms=PERIOD_MS)
+        history.record("ETHUSDT", None, BASE_TIME)
+        history.record("ETHUSDT", 0.0, BASE_TIME)
+        assert history.summary("ETHUSDT") is None
+        history.record("ETHUSDT", 50.0, BASE_TIME)
+        history.seed("ETHUSDT", [(BASE_TIME - PERIOD_MS, 10.0)])
+        assert history.summary("ETHUSDT")['samples'] == 1
+        assert history.summary("ETHUSDT")['latest'] == 50.0
+        # 只有一个采样，还没有覆盖整个窗口
+        assert history.average("ETHUSDT") is None
+
+    def test_resumed_after_gap_reports_change_only_over_full_window(self):
+        """停止跟踪数小时后恢复：旧采样不与新采样拼成跨度不均的变化量"""
+        history = OpenInterestHistory(window=4, period_ms=PERIOD_MS)
+        for i in range(4):
+            history.record("BTCUSDT", 100.0 + i, BASE_TIME + i * PERIOD_MS)
+        assert history.summary("BTCUSDT")['change_pct'] == pytest.approx((103 / 100 - 1) * 100)
+
+        resumed = BASE_TIME + 6 * 3600 * 1000
+        assert not history.has("BTCUSDT", resumed)
+        history.record("BTCUSDT", 200.0, resumed)
+        summary = history.summary("BTCUSDT")
+        assert (summary['latest'], summary['samples']) == (200.0, 1)
+        assert summary['average'] is None and summary['delta'] is None and summary['change_pct'] is None
+
+        for i in range(1, 4):
+            history.record("BTCUSDT", 200.0 + i, resumed + i * PERIOD_MS)
+        summary = history.summary("BTCUSDT")
+        assert summary['average'] == pytest.approx(201.5)
+        assert summary['change_pct'] == pytest.approx((203 / 200 - 1) * 100)
+
+    def test_seed_replaces_expired_history(self):
+        history = OpenInterestHistory(window=4, period_ms=PERIOD_MS)
+        history.record("BTCUSDT", 100.0, BASE_TIME)
+        resumed = BASE_TIME + 100 * PERIOD_MS
+        history.seed("BTCUSDT", [(resumed - (4 - i) * PERIOD_MS, 10.0 + i) for i in range(4)])
+        assert history.summary("BTCUSDT")['samples'] == 4
+        assert history.average("BTCUSDT") == pytest.approx(11.5)
@@ -0,0 +1,146 @@
+"""
+StreamDispatcher 测试
+- 回调变慢时接收循环不被阻塞
+- Ticker 只保留最新一条，已收盘K线从不丢弃
+"""
+import asyncio
+import json
+import threading
+import time
+from services.market.client import WSClient
+from services.market.stream_dispatcher import StreamDispatcher
+
+
+def kline(open_time: int, closed: bool) -> dict:
+    return {"e": "kline", "s": "BTCUSDT", "k": {"t": open_time, "i": "3m", "x": closed}}
+
+
+def ticker(price: int) -> dict:
+    return {"e": "24hrTicker", "s": "BTCUSDT", "c": str(price)}
+
+
+def wait_until(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timeout"
+        time.sleep(0.01)
+
+
+class BlockingConsumer:
+    """第一次回调时阻塞，直到 release()"""
+
+    def __init__(self):
+        self.received = []
+        self._gate = threading.Event()
+        self.blocked = threading.Event()
+
+    def __call__(self, message):
+        self.blocked.set()
+        self._gate.wait(timeout=5)
+        self.received.append(message)
+
+    def release(self):
+        self._gate.set()
+
+
+class TestStreamDispatcher:
+    """合并策略与统计"""
+
+    def test_latest_values_are_coalesced(self):
+        dispatcher = StreamDispatcher()
+        consumer = BlockingConsumer()
+        handlers = [(consumer, False)]
+        dispatcher.start()
+        try:
+            dispatcher.submit("ticker", handlers, ticker(0))
+            consumer.blocked.wait(timeout=5)
+            for price in range(1, 101):
+                dispatcher.submit("ticker", handlers, ticker(price))
+
+            assert dispatcher.depth("ticker") == 1
+            consumer.release()
+            wait_until(lambda: dispatcher.stats()['pending'] == 0 and len(consumer.received) == 2)
+        finally:
+            dispatcher.stop()
+
+        assert consumer.received == [ticker(0), ticker(100)]
+        stats = dispatcher.stats()
+        assert stats['coalesced'] == 99
+        assert stats['dropped'] == 0
+
+    def test_closed_klines_are_never_dropped(self):
+        dispatcher = StreamDispatcher(max_queue_size=4)
+        consumer = BlockingConsumer()
+        handlers = [(consumer, False)]
+        dispatcher.start()
+        try:
+            dispatcher.submit("kline", handlers, kline(0, closed=True))
+            consumer.blocked.wait(timeout=5)
+            for i in range(1, 11):
+                dispatcher.submit("kline", handlers, kline(i, closed=False))
+                dispatcher.submit("kline", handlers, kline(i, closed=True))
+
+            consumer.release()
+            wait_until(lambda: sum(m["k"]["x"] for m in consumer.received) == 11)
+        finally:
+            dispatcher.stop()
+
+        closed = [m["k"]["t"] for m in consumer.received if m["k"]["x"]]
+        assert closed == list(range(11))
+        stats = dispatcher.stats()
+        assert stats['dropped'] > 0  # 未收盘K线在队列满时被丢弃
+        assert stats['dropped_by_stream'] == {"kline": stats['dropped']}
+
+    def test_array_messages_are_queued_in_order(self):
+        dispatcher = StreamDispatcher(max_queue_size=3)
+        consumer = BlockingConsumer()
+        handlers = [(consumer, False)]
+        dispatcher.start()
+        try:
+            dispatcher.submit("arr", handlers, [ticker(0)])
+            consumer.blocked.wait(timeout=5)
+            for price in range(1, 6):
+                dispatcher.submit("arr", handlers, [ticker(price)])
+
+            consumer.release()
+            wait_until(lambda: len(consumer.received) == 4)
+        finally:
+            dispatcher.stop()
+
+        # 数组只包含有变化的交易对，不合并；队列满时丢弃最旧的
+        assert [m[0]["c"] for m in consumer.received] == ["0", "3", "4", "5"]
+        assert dispatcher.stats()['dropped'] == 2
+
+
+class TestWSClientOffload:
+    """WSClient 接入分发线程"""
+
+    def test_slow_callback_does_not_block_receive_loop(self):
+        dispatcher = StreamDispatcher()
+        consumer = BlockingConsumer()
+        received_async = []
+
+        async def on_ticker(message):
+            received_async.append(message)
+
+        client = WSClient(dispatcher=dispatcher)
+        dispatcher.start()
+        try:
+            asyncio.run(client.subscribe_many([("btcusdt@ticker", consumer), ("btcusdt@ticker", on_ticker)]))
+
+            async def receive():
+                for price in range(200):
+                    await client._handle_message(json.dumps(ticker(price)))
+
+            started = time.monotonic()
+            asyncio.run(receive())
+            assert time.monotonic() - started < 1.0
+            # 协程回调仍在事件循环中逐条执行
+            assert len(received_async) == 200
+
+            consumer.release()
+            wait_until(lambda: dispatcher.stats()['pending'] == 0 and consumer.received[-1:] == [ticker(199)])
+        finally:
+            dispatcher.stop()
+
+        assert len(consumer.received) < 200
@@ -0,0 +1,226 @@
+"""
+SymbolFilter 测试
+- 横截面向量化评分必须与逐币种 FeatureEngine 评分结果一致
+- K线收盘事件驱动的增量重新评分
+- 历史数据逐个加载时逐步评分、发布部分排名
+"""
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+from services.market.feature_engine import FeatureEngine
+from services.market.historical_loader import HistoricalDataLoader
+from services.market.incremental_indicators import IncrementalIndicatorEngine
+from services.market.kline_store import KlineStore
+from services.market.symbol_filter import SymbolFilter
+from tests.test_feature_engine import make_klines
+
+
+class StoreMonitor:
+    """只提供K线读取、增量指标和收盘事件的最小 MarketMonitor 替身"""
+
+    def __init__(self, store: KlineStore):
+        self.kline_store = store
+        self.indicator_engine = IncrementalIndicatorEngine(store)
+        self._monitored_symbols = set()
+        self.listeners = []
+
+    def get_kline_arrays(self, symbol: str, interval: str, limit: int = 100):
+        return self.kline_store.get_arrays(symbol, interval, limit)
+
+    def get_indicators(self, symbol: str, interval: str, seed: bool = True):
+        return self.indicator_engine.get(symbol, interval, seed)
+
+    def add_kline_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_kline_listener(self, callback):
+        self.listeners.remove(callback)
+
+    def close_bar(self, symbol: str, interval: str, close: float):
+        """在最新K线之后追加一根收盘K线并发出收盘事件"""
+        arrays = self.kline_store.get_arrays(symbol, interval, limit=2)
+        step = int(arrays.open_time[-1] - arrays.open_time[-2])
+        open_time = int(arrays.open_time[-1]) + step
+        self.kline_store.upsert(symbol, interval, open_time=open_time, open=close, high=close, low=close,
+                                close=close, volume=1.0, close_time=open_time + step - 1,
+                                quote_volume=1.0, trades=1)
+        for callback in list(self.listeners):
+            callback(symbol.replace('/', ''), interval, open_time)
+
+
+def build_filter(lengths: dict) -> SymbolFilter:
+    """按 {symbol: (3m 根数, 4h 根数)} 构造带数据的 SymbolFilter"""
+    store = KlineStore(capacity=200)
+    for seed, (symbol, (count_3m, count_4h)) in enumerate(lengths.items()):
+        store.replace(symbol, "3m", make_klines(count_3m, 180_000, seed=seed * 2))
+        store.replace(symbol, "4h", make_klines(count_4h, 14_400_000, seed=seed * 2 + 1))
+    return SymbolFilter(StoreMonitor(store), api_client=MagicMock(), all_symbols=list(lengths))
+
+
+def per_symbol_scores(symbol_filter: SymbolFilter, vectorized: bool) -> dict:
+    """逐币种计算特征再评分（原有路径）"""
+    engine = FeatureEngine(MagicMock(), vectorized=vectorized)
+    scores = {}
+    for symbol in symbol_filter.all_symbols:
+        features = engine.calculate_features(
+            symbol,
+            symbol_filter.market_monitor.get_kline_arrays(symbol, "3m").to_klines(),
+            symbol_filter.market_monitor.get_kline_arrays(symbol, "4h").to_klines(),
+            skip_api_calls=True,
+        )
+        if features:
+            scores[symbol] = symbol_filter._calculate_score_from_features(features)
+    return scores
+
+
+class TestBatchedScoring:
+    """批量评分与逐币种评分的一致性"""
+
+    def test_matches_pandas_ta_scores(self):
+        lengths = {f"SYM{i}/USDT": (100, 100) for i in range(30)}
+        lengths.update({"SHORT/USDT": (60, 40), "NEW/USDT": (100, 10)})
+        symbol_filter = build_filter(lengths)
+
+        batched = {c['symbol']: c['score'] for c in symbol_filter._score_symbols(symbol_filter.all_symbols)}
+        assert batched == per_symbol_scores(symbol_filter, vectorized=False)
+        assert "NEW/USDT" not in batched  # 4h 数据不足，与 FeatureEngine 一样跳过
+        assert len(set(batched.values())) > 1
+
+    def test_short_macd_window_matches_vectorized_engine(self):
+        """26-33 根K线（pandas_ta 不输出 MACD）时与向量化 FeatureEngine 一致"""
+        symbol_filter = build_filter({"A/USDT": (30, 100), "B/USDT": (100, 26), "C/USDT": (100, 100)})
+
+        batched = {c['symbol']: c['score'] for c in symbol_filter._score_symbols(symbol_filter.all_symbols)}
+        assert batched == per_symbol_scores(symbol_filter, vectorized=True)
+
+    def test_seeded_symbols_use_incremental_indicators(self):
+        """已在增量指标引擎中预热的币种直接读取指标，评分与逐币种计算一致"""
+        lengths = {f"SYM{i}/USDT": (100, 100) for i in range(10)}
+        lengths["SHORT/USDT"] = (60, 30)
+        symbol_filter = build_filter(lengths)
+        symbol_filter._seed_indicators(symbol_filter.all_symbols)
+
+        with patch("services.market.symbol_filter.VectorIndicatorCalculator") as vector:
+            batched = {c['symbol']: c['score'] for c in symbol_filter._score_symbols(symbol_filter.all_symbols)}
+        vector.ema.assert_not_called()
+        assert batched == per_symbol_scores(symbol_filter, vectorized=True)
+
+    def test_first_rescore_ranks_every_symbol(self):
+        """新建的筛选器所有币种都待评分，第一轮重新评分即全量排名"""
+        symbol_filter = build_filter({f"SYM{i}/USDT": (100, 100) for i in range(30)})
+        top = symbol_filter._rescore_dirty()
+        scores = {c['symbol']: c['score'] for c in symbol_filter._score_symbols(symbol_filter.all_symbols)}
+
+        assert len(top) == SymbolFilter.TOP_N
+        assert min(scores[s] for s in top) >= max(scores[s] for s in scores if s not in top)
+
+
+class TestEventDrivenFiltering:
+    """K线收盘事件驱动的增量筛选"""
+
+    @pytest.fixture
+    def running_filter(self):
+        symbol_filter = build_filter({f"SYM{i}/USDT": (100, 100) for i in range(30)})
+        symbol_filter.DEBOUNCE_SECONDS = 0.01
+        symbol_filter.IDLE_CHECK_SECONDS = 0.01
+        symbol_filter.start()
+        yield symbol_filter
+        symbol_filter.stop()
+
+    def test_first_ranking_is_available(self, running_filter):
+        top = running_filter.wait_for_ranking(timeout=5)
+        assert top == build_filter({f"SYM{i}/USDT": (100, 100) for i in range(30)})._rescore_dirty()
+
+    def test_only_changed_symbols_are_rescored(self, running_filter):
+        top = running_filter.wait_for_ranking(timeout=5)
+        loser = top[-1]
+        monitor = running_filter.market_monitor
+
+        with patch.object(running_filter, "_score_symbols", wraps=running_filter._score_symbols) as spy:
+            # 大幅下跌：EMA/MACD 全部转空，分数降到最低档
+            monitor.close_bar(loser, "3m", 1.0)
+            monitor.close_bar(loser, "4h", 1.0)
+            for _ in range(500):
+                if spy.called and loser not in running_filter.get_filtered_symbols():
+                    break
+                threading.Event().wait(0.01)
+
+        assert [call.args[0] for call in spy.call_args_list] == [[loser]]
+        assert loser not in running_filter.get_filtered_symbols()
+        assert len(running_filter.get_filtered_symbols()) == SymbolFilter.TOP_N
+
+    def test_scored_symbols_are_seeded_after_ranking(self, running_filter):
+        running_filter.wait_for_ranking(timeout=5)
+        monitor = running_filter.market_monitor
+        for _ in range(500):
+            if all(running_filter._seeded_indicators(symbol) for symbol in running_filter.all_symbols):
+                break
+            threading.Event().wait(0.01)
+        assert all(monitor.get_indicators(symbol, interval, seed=False)
+                   for symbol in running_filter.all_symbols for interval in SymbolFilter.SCORED_INTERVALS)
+
+    def test_unknown_symbols_and_intervals_are_ignored(self, running_filter):
+        running_filter.wait_for_ranking(timeout=5)
+        running_filter._on_kline_closed("OTHERUSDT", "3m", 0)
+        running_filter._on_kline_closed("SYM0USDT", "1m", 0)
+        assert not running_filter._dirty
+
+    def test_stop_unregisters_listener(self, running_filter):
+        running_filter.stop()
+        assert running_filter.market_monitor.listeners == []
+
+
+class StoreAPIClient:
+    """从预先准备的K线存储返回数据的假客户端"""
+
+    def __init__(self, source: KlineStore):
+        self.source = source
+
+    def get_Klines(self, symbol, timeframe, limit=100, since=None):
+        return self.source.get_arrays(symbol, timeframe, limit).to_klines()
+
+
+class TestProgressiveLoading:
+    """历史数据加载过程中逐步评分"""
+
+    def test_partial_ranking_before_all_symbols_known(self):
+        lengths = {f"SYM{i}/USDT": (100, 100) for i in range(30)}
+        full_top = build_filter(lengths)._rescore_dirty()
+        symbol_filter = build_filter(lengths)
+        symbol_filter.all_symbols = []
+        symbol_filter.DEBOUNCE_SECONDS = 0.01
+        symbol_filter.IDLE_CHECK_SECONDS = 0.01
+        symbol_filter.start()
+        try:
+            symbol_filter.add_symbols(full_top[:3])
+            partial = symbol_filter.wait_for_ranking(timeout=5)
+            assert set(partial) == set(full_top[:3])
+            assert symbol_filter.all_symbols == full_top[:3]
+
+            # 已知币种再次加入不会重复进入列表
+            symbol_filter.add_symbols(full_top[:5])
+            assert symbol_filter.all_symbols == full_top[:5]
+        finally:
+            symbol_filter.stop()
+
+    def test_loader_reports_each_symbol(self):
+        source = build_filter({f"SYM{i}/USDT": (100, 100) for i in range(5)}).market_monitor.kline_store
+        loaded = []
+        loader = HistoricalDataLoader(StoreAPIClient(source))
+        count = loader.load_historical_data(
+            [f"SYM{i}/USDT" for i in range(5)] + ["MISSING/USDT"], ["3m", "4h"], KlineStore(capacity=200),
+            on_symbol_loaded=loaded.append,
+        )
+        assert count == 5
+        assert sorted(loaded) == [f"SYM{i}/USDT" for i in range(5)]
+
+    def test_callback_errors_do_not_stop_loading(self):
+        source = build_filter({"A/USDT": (100, 100), "B/USDT": (100, 100)}).market_monitor.kline_store
+        loader = HistoricalDataLoader(StoreAPIClient(source))
+
+        def fail(symbol):
+            raise RuntimeError("boom")
+
+        count = loader.load_historical_data(["A/USDT", "B/USDT"], ["3m"], KlineStore(capacity=200),
+                                            on_symbol_loaded=fail)
+        assert count == 2
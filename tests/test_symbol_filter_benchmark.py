@@ -0,0 +1,17 @@
+"""
+SymbolFilter 评分基准测试：500 个币种的一次完整筛选
+
+运行: pytest tests/test_symbol_filter_benchmark.py
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from tests.test_symbol_filter import build_filter
+
+
+@pytest.mark.slow
+def test_score_500_symbols(benchmark):
+    symbol_filter = build_filter({f"SYM{i}/USDT": (100, 100) for i in range(500)})
+    scored = benchmark(symbol_filter._score_symbols, symbol_filter.all_symbols)
+    assert len(scored) == 500
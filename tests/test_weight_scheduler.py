@@ -0,0 +1,223 @@
+"""
+REST 请求权重调度器测试
+- 令牌不足时等待补充；等待中的请求按优先级放行
+- 响应头中的已用权重校准令牌；429 时暂停、并发减半；令牌充足时并发逐步增加
+- 历史加载器按优先级排序币种，所有K线请求经过调度器
+"""
+import threading
+import time
+import pytest
+from services.market.api_client import APIClient
+from services.market.historical_loader import HistoricalDataLoader
+from services.market.kline_store import KlineStore
+from services.market.type import Kline
+from services.market.weight_scheduler import WeightScheduler, kline_weight
+
+
+@pytest.fixture(autouse=True)
+def isolated_schedulers():
+    """每个测试使用独立的按交易所共享实例"""
+    saved = dict(WeightScheduler._instances)
+    WeightScheduler._instances.clear()
+    yield
+    WeightScheduler._instances.clear()
+    WeightScheduler._instances.update(saved)
+
+
+def make_scheduler(weight_limit=100, window_seconds=1.0) -> WeightScheduler:
+    return WeightScheduler(weight_limit=weight_limit, window_seconds=window_seconds)
+
+
+class TestWeightScheduler:
+    """令牌桶、优先级和自适应并发"""
+
+    def test_kline_weight(self):
+        """现货 /api/v3/klines 固定权重 2，默认上限为现货的每分钟 6000"""
+        assert [kline_weight(limit) for limit in (50, 100, 499, 500, 1000)] == [2] * 5
+        assert WeightScheduler().capacity == 6000 * WeightScheduler.SAFETY_RATIO
+
+    def test_waits_for_refill_when_tokens_exhausted(self):
+        scheduler = make_scheduler(weight_limit=100, window_seconds=1.0)  # 容量 80，每秒补充 80
+        with scheduler.slot(80):
+            pass
+        started = time.monotonic()
+        with scheduler.slot(40):
+            pass
+        assert time.monotonic() - started >= 0.4
+        assert scheduler.stats()['granted_weight'] == 120
+
+    def test_high_priority_waiter_goes_first(self):
+        scheduler = make_scheduler(weight_limit=100, window_seconds=2.0)
+        scheduler.concurrency = 1
+        order = []
+        scheduler.acquire(1)  # 占用唯一的并发名额
+
+        def worker(name, priority):
+            with scheduler.slot(1, priority):
+                order.append(name)
+
+        threads = [threading.Thread(target=worker, args=("low", WeightScheduler.LOW))]
+        threads[0].start()
+        time.sleep(0.05)
+        threads.append(threading.Thread(target=worker, args=("high", WeightScheduler.HIGH)))
+        threads[1].start()
+        time.sleep(0.05)
+        scheduler.release()
+        for thread in threads:
+            thread.join(timeout=2)
+        assert order == ["high", "low"]
+
+    def test_abandoned_waiter_is_removed_lazily(self):
+        """未轮到就离开的等待者只做标记，到达堆顶时删除，不影响其他等待者"""
+        scheduler = make_scheduler(weight_limit=100, window_seconds=2.0)
+        scheduler.concurrency = 1
+        scheduler.acquire(1)  # 占用唯一的并发名额
+        original_wait = scheduler._condition.wait
+        interrupt = threading.Event()
+        granted, errors = [], []
+
+        def wait(timeout=None):
+            if interrupt.is_set() and threading.current_thread().name == "low":
+                raise RuntimeError("interrupted")
+            return original_wait(timeout)
+
+        scheduler._condition.wait = wait
+
+        def worker(priority):
+            try:
+                with scheduler.slot(1, priority):
+                    granted.append(priority)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=worker, args=(priority,), name=name)
+                   for name, priority in (("high", WeightScheduler.HIGH), ("low", WeightScheduler.LOW))]
+        for thread in threads:
+            thread.start()
+        for _ in range(200):
+            if scheduler.stats()['waiting'] == 2:
+                break
+            time.sleep(0.01)
+
+        interrupt.set()
+        with scheduler._condition:
+            scheduler._condition.notify_all()
+        threads[1].join(timeout=2)
+        assert errors == ["interrupted"]
+        assert scheduler.stats()['waiting'] == 1
+        assert len(scheduler._waiting) == 2  # 离开的条目仍在堆中，只做了标记
+
+        scheduler.release()
+        threads[0].join(timeout=2)
+        assert granted == [WeightScheduler.HIGH]
+        assert scheduler._waiting == [] and not scheduler._abandoned
+        assert scheduler.stats()['waiting'] == 0
+
+    def test_observe_caps_tokens_to_exchange_remaining(self):
+        scheduler = make_scheduler(weight_limit=2400, window_seconds=60)
+        scheduler.observe(1900)
+        assert scheduler.stats()['tokens'] == pytest.approx(scheduler.capacity - 1900, abs=1)
+        assert scheduler.stats()['last_used_weight'] == 1900
+
+    def test_penalize_pauses_and_halves_concurrency(self):
+        scheduler = make_scheduler(weight_limit=100, window_seconds=1.0)
+        scheduler.concurrency = 8
+        scheduler.penalize(retry_after=0.3)
+        assert scheduler.concurrency == 4
+        started = time.monotonic()
+        with scheduler.slot(1):
+            pass
+        assert time.monotonic() - started >= 0.3
+        assert scheduler.stats()['rate_limited'] == 1
+
+    def test_concurrency_ramps_up_while_tokens_plentiful(self):
+        scheduler = make_scheduler(weight_limit=10_000, window_seconds=60)
+        for _ in range(WeightScheduler.MAX_CONCURRENCY * 2):
+            with scheduler.slot(1):
+                pass
+        assert scheduler.concurrency == WeightScheduler.MAX_CONCURRENCY
+
+    def test_shared_per_exchange(self):
+        assert WeightScheduler.for_exchange("binance") is WeightScheduler.for_exchange("binance")
+        assert WeightScheduler.for_exchange("binance") is not WeightScheduler.for_exchange("okx")
+
+
+class RecordingAPIClient:
+    """记录请求顺序的假客户端"""
+
+    def __init__(self):
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get_Klines(self, symbol, timeframe, limit=100, since=None):
+        with self._lock:
+            self.requests.append(symbol)
+        return [Kline(open_time=i * 180_000, open=1.0, high=1.0, low=1.0, close=1.0, volume=1.0,
+                      close_time=i * 180_000 + 179_999, quote_volume=1.0, trades=1) for i in range(limit)]
+
+
+class TestLoaderScheduling:
+    """历史加载器与调度器"""
+
+    def test_priority_symbols_requested_first(self):
+        api = RecordingAPIClient()
+        scheduler = make_scheduler(weight_limit=10_000, window_seconds=60)
+        scheduler.concurrency = 1  # 串行放行，请求顺序即优先级顺序
+        scheduler.MAX_CONCURRENCY = 1
+        loader = HistoricalDataLoader(api, scheduler=scheduler)
+        symbols = [f"S{i}/USDT" for i in range(10)]
+        result = {}
+
+        def load():
+            result['count'] = loader.load_historical_data(symbols, ["3m"], KlineStore(capacity=200),
+                                                          priority_symbols=["S7/USDT", "S3/USDT"], depth=100)
+
+        # 占住唯一的并发名额，等所有请求都进入队列后再放行
+        scheduler.acquire(1)
+        thread = threading.Thread(target=load)
+        thread.start()
+        for _ in range(500):
+            if scheduler.stats()['waiting'] == 10:
+                break
+            time.sleep(0.01)
+        scheduler.release()
+        thread.join(timeout=5)
+
+        assert result['count'] == 10
+        assert set(api.requests[:2]) == {"S3/USDT", "S7/USDT"}
+        stats = scheduler.stats()
+        assert stats['granted'] == 11
+        assert stats['granted_weight'] == 1 + 10 * kline_weight(100)
+
+    def test_defaults_to_client_scheduler(self):
+        api = RecordingAPIClient()
+        api.scheduler = make_scheduler()
+        assert HistoricalDataLoader(api).scheduler is api.scheduler
+        assert HistoricalDataLoader(RecordingAPIClient()).scheduler is WeightScheduler.for_exchange("binance")
+
+
+class HeaderExchange:
+    """返回固定响应头的假 ccxt 实例"""
+
+    last_response_headers = {'X-MBX-USED-WEIGHT-1M': '1200'}
+
+    def fetch_ohlcv(self, *args, **kwargs):
+        return []
+
+    def fetch_open_interest(self, *args, **kwargs):
+        return {'openInterestAmount': 1.0}
+
+
+class TestClientFeedback:
+    """只有经过调度器的现货接口校准调度器"""
+
+    def test_only_spot_kline_responses_are_observed(self):
+        api = APIClient.__new__(APIClient)
+        api.exchange = HeaderExchange()
+        api.scheduler = make_scheduler(weight_limit=6000, window_seconds=60)
+
+        api._call('fetch_open_interest', 'BTC/USDT:USDT')
+        assert api.scheduler.stats()['last_used_weight'] is None
+
+        api._call('fetch_ohlcv', 'BTC/USDT', '3m')
+        assert api.scheduler.stats()['last_used_weight'] == 1200
@@ -0,0 +1,277 @@
+"""
+WSClient / WSClientPool 订阅测试
+- 订阅请求按方法合并、分块发送
+- 连接池按每连接流数量上限分片，重连后重新均衡
+"""
+import asyncio
+import json
+from unittest.mock import patch
+from services.market.client import WSClient, WSClientPool
+
+
+class FakeConnection:
+    """记录发送的控制帧"""
+
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, message: str):
+        self.frames.append(json.loads(message))
+
+
+def noop(message):
+    pass
+
+
+def fast_client(client: WSClient) -> FakeConnection:
+    """挂上假连接并取消发送间隔"""
+    client.CONTROL_MESSAGES_PER_SECOND = 1_000_000
+    client.conn = FakeConnection()
+    return client.conn
+
+
+class TestWSClientFrames:
+    """订阅控制帧的合并与分块"""
+
+    def test_streams_are_chunked(self):
+        client = WSClient()
+        connection = fast_client(client)
+        streams = [f"sym{i}usdt@kline_3m" for i in range(450)]
+
+        asyncio.run(client.subscribe_many([(stream, noop) for stream in streams]))
+
+        assert [len(frame["params"]) for frame in connection.frames] == [200, 200, 50]
+        assert all(frame["method"] == "SUBSCRIBE" for frame in connection.frames)
+        assert [p for frame in connection.frames for p in frame["params"]] == streams
+
+    def test_concurrent_calls_are_coalesced_in_order(self):
+        client = WSClient()
+        connection = fast_client(client)
+
+        async def run():
+            await asyncio.gather(
+                client.subscribe_many([("a@ticker", noop)]),
+                client.subscribe_many([("b@ticker", noop), ("c@ticker", noop)]),
+                client.unsubscribe_many(["a@ticker"]),
+            )
+
+        asyncio.run(run())
+        # 第一帧只有 a（发送时其他调用尚未入队），之后 b/c 合并为一帧，退订保持在订阅之后
+        assert [(f["method"], f["params"]) for f in connection.frames] == [
+            ("SUBSCRIBE", ["a@ticker"]),
+            ("SUBSCRIBE", ["b@ticker", "c@ticker"]),
+            ("UNSUBSCRIBE", ["a@ticker"]),
+        ]
+
+    def test_not_connected_defers_to_resubscribe(self):
+        client = WSClient()
+        asyncio.run(client.subscribe_many([(f"s{i}@ticker", noop) for i in range(250)]))
+
+        connection = fast_client(client)
+        asyncio.run(client._resubscribe())
+        assert [len(frame["params"]) for frame in connection.frames] == [200, 50]
+
+
+class TestWSClientPool:
+    """连接池分片与重新均衡"""
+
+    def make_pool(self, limit: int) -> WSClientPool:
+        pool = WSClientPool(streams_per_connection=limit)
+        original_create_client = pool._create_client
+
+        def create_client():
+            client = original_create_client()
+            fast_client(client)
+            return client
+
+        pool._create_client = create_client
+        fast_client(pool.clients[0])
+        return pool
+
+    def test_streams_are_sharded_by_limit(self):
+        pool = self.make_pool(limit=3)
+        asyncio.run(pool.subscribe_many([(f"s{i}@ticker", noop) for i in range(7)]))
+
+        assert [len(client._subscribed_streams) for client in pool.clients] == [3, 3, 1]
+        assert len(pool.subscribed_streams) == 7
+        # 每个连接只发送一帧
+        assert [len(client.conn.frames) for client in pool.clients] == [1, 1, 1]
+
+    def test_rebalance_evens_out_and_closes_empty_connections(self):
+        pool = self.make_pool(limit=3)
+        asyncio.run(pool.subscribe_many([(f"s{i}@ticker", noop) for i in range(7)]))
+        asyncio.run(pool.unsubscribe_many(["s0@ticker", "s1@ticker", "s2@ticker", "s3@ticker"]))
+        assert [len(client._subscribed_streams) for client in pool.clients] == [0, 2, 1]
+
+        with patch.object(WSClient, "stop") as stop:
+            asyncio.run(pool.rebalance())
+
+        assert [len(client._subscribed_streams) for client in pool.clients] == [3]
+        assert stop.call_count == 2
+        assert sorted(pool.clients[0]._subscribed_streams) == ["s4@ticker", "s5@ticker", "s6@ticker"]
+        assert pool.clients[0].subscribers["s5@ticker"] == [noop]
+
+    def test_unsubscribe_keeps_stream_with_other_callbacks(self):
+        """同一个流还有其他回调时只移除该回调，最后一个回调移除后才退订"""
+        pool = self.make_pool(limit=3)
+
+        def other(message):
+            pass
+
+        asyncio.run(pool.subscribe_many([("s0@ticker", noop), ("s0@ticker", other)]))
+        client = pool.clients[0]
+
+        asyncio.run(pool.unsubscribe("s0@ticker", noop))
+        assert pool._stream_clients["s0@ticker"] is client
+        assert client.subscribers["s0@ticker"] == [other]
+        assert client._stream_handlers["s0@ticker"] == [(other, False)]
+        assert [frame["method"] for frame in client.conn.frames] == ["SUBSCRIBE"]
+
+        asyncio.run(pool.unsubscribe("s0@ticker", other))
+        assert "s0@ticker" not in pool._stream_clients
+        assert pool.subscribed_streams == []
+        assert client.conn.frames[-1] == {"method": "UNSUBSCRIBE", "params": ["s0@ticker"],
+                                          "id": client.conn.frames[-1]["id"]}
+
+    def test_reconnect_triggers_rebalance(self):
+        pool = self.make_pool(limit=3)
+        client = pool.clients[0]
+        with patch.object(pool, "rebalance") as rebalance:
+            asyncio.run(client.on_reconnect(client))
+        rebalance.assert_called_once()
+
+    def test_reconnect_does_not_stop_the_reconnecting_client(self):
+        """重连回调运行在该连接自己的监听任务里，均衡时不能关闭它"""
+        pool = self.make_pool(limit=3)
+        asyncio.run(pool.subscribe_many([(f"s{i}@ticker", noop) for i in range(7)]))
+        asyncio.run(pool.unsubscribe_many(["s0@ticker", "s1@ticker", "s2@ticker", "s3@ticker"]))
+        kept, surplus, reconnecting = pool.clients
+        stopped = []
+
+        async def stop(client):
+            if client._task is asyncio.current_task():
+                raise RuntimeError("Task cannot await on itself")
+            stopped.append(client)
+
+        async def run():
+            reconnecting._task = asyncio.create_task(reconnecting.on_reconnect(reconnecting))
+            await reconnecting._task
+
+        with patch.object(WSClient, "stop", autospec=True, side_effect=stop):
+            asyncio.run(run())
+
+        # 另一个空连接被关闭，重连中的连接保留在池中，下次均衡再关闭
+        assert stopped == [surplus]
+        assert pool.clients == [kept, reconnecting]
+        assert sorted(kept._subscribed_streams) == ["s4@ticker", "s5@ticker", "s6@ticker"]
+
+    def test_reconnect_reports_streams_of_that_connection(self):
+        pool = self.make_pool(limit=3)
+        asyncio.run(pool.subscribe_many([(f"s{i}@ticker", noop) for i in range(5)]))
+        reported = []
+
+        async def on_reconnect(streams):
+            reported.append(streams)
+
+        pool.on_reconnect = on_reconnect
+        client = pool.clients[1]
+        asyncio.run(client.on_reconnect(client))
+
+        assert reported == [["s3@ticker", "s4@ticker"]]
+
+
+class TestStreamModes:
+    """全市场数组流与组合流端点"""
+
+    def test_raw_array_message_dispatched_by_event_type(self):
+        client = WSClient()
+        received = []
+        asyncio.run(client.subscribe("!ticker@arr", received.append))
+
+        tickers = [{"e": "24hrTicker", "s": "BTCUSDT", "c": "1"}, {"e": "24hrTicker", "s": "ETHUSDT", "c": "2"}]
+        asyncio.run(client._handle_message(json.dumps(tickers)))
+
+        assert received == [tickers]
+
+    def test_combined_message_with_array_payload(self):
+        client = WSClient(combined=True)
+        received = []
+        asyncio.run(client.subscribe("!markPrice@arr", received.append))
+
+        payload = [{"e": "markPriceUpdate", "s": "BTCUSDT", "p": "1"}]
+        asyncio.run(client._handle_message(json.dumps({"stream": "!markPrice@arr", "data": payload})))
+
+        assert received == [payload]
+
+    def test_combined_url_carries_streams(self):
+        client = WSClient(combined=True)
+        asyncio.run(client.subscribe_many([(f"s{i}@ticker", noop) for i in range(250)]))
+
+        url, count = client._connect_url()
+        assert url.startswith("wss://fstream.binance.com/stream?streams=s0@ticker/s1@ticker/")
+        assert count == WSClient.MAX_STREAMS_PER_FRAME
+
+        # URL 放不下的部分通过 SUBSCRIBE 补发
+        connection = fast_client(client)
+        asyncio.run(client._resubscribe(skip=count))
+        assert connection.frames[0]["params"] == [f"s{i}@ticker" for i in range(200, 250)]
+
+    def test_raw_mode_url_has_no_streams(self):
+        client = WSClient()
+        asyncio.run(client.subscribe("btcusdt@ticker", noop))
+        assert client._connect_url() == ("wss://fstream.binance.com/ws", 0)
+
+
+class TestDispatchTable:
+    """订阅时预先计算的分发表"""
+
+    def test_event_keys(self):
+        assert WSClient._event_key("btcusdt@kline_3m") == ("BTCUSDT", "kline", "3m")
+        assert WSClient._event_key("btcusdt@ticker") == ("BTCUSDT", "24hrTicker", None)
+        assert WSClient._event_key("btcusdt@markPrice@1s") == ("BTCUSDT", "markPriceUpdate", None)
+        assert WSClient._event_key("!ticker@arr") is None
+
+    def test_raw_messages_routed_by_symbol_event_and_interval(self):
+        client = WSClient()
+        kline_3m, kline_4h, tickers = [], [], []
+
+        async def on_ticker(message):
+            tickers.append(message)
+
+        asyncio.run(client.subscribe_many([
+            ("btcusdt@kline_3m", kline_3m.append),
+            ("btcusdt@kline_4h", kline_4h.append),
+            ("btcusdt@ticker", on_ticker),
+        ]))
+
+        kline = {"e": "kline", "s": "BTCUSDT", "k": {"i": "3m", "x": True}}
+        ticker = {"e": "24hrTicker", "s": "BTCUSDT", "c": "1"}
+        other = {"e": "24hrTicker", "s": "ETHUSDT", "c": "2"}
+        for message in (kline, ticker, other):
+            asyncio.run(client._handle_message(json.dumps(message)))
+
+        assert kline_3m == [kline]
+        assert kline_4h == []
+        assert tickers == [ticker]
+
+    def test_unsubscribe_removes_route(self):
+        client = WSClient()
+        received = []
+        asyncio.run(client.subscribe("btcusdt@ticker", received.append))
+        asyncio.run(client.unsubscribe_many(["btcusdt@ticker"]))
+
+        asyncio.run(client._handle_message(json.dumps({"e": "24hrTicker", "s": "BTCUSDT"})))
+
+        assert received == []
+        assert client._event_handlers == {} and client._stream_handlers == {}
+
+    def test_custom_decoder(self):
+        decoded = []
+
+        def loads(message):
+            decoded.append(message)
+            return json.loads(message)
+
+        client = WSClient(json_loads=loads)
+        asyncio.run(client._handle_message('{"result": null, "id": 1}'))
+        assert decoded == ['{"result": null, "id": 1}']
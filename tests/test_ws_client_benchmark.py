@@ -0,0 +1,94 @@
+"""
+WSClient 消息分发基准测试
+用录制格式的 Binance 推送帧测量 _handle_message 的吞吐（条/秒），对比标准库 json 与 orjson
+
+运行: pytest tests/test_ws_client_benchmark.py --benchmark-group-by=param:stream_mode
+"""
+import asyncio
+import json
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from services.market.client import WSClient
+
+SYMBOL_COUNT = 200
+MESSAGES_PER_ROUND = 2000
+
+DECODERS = {"json": json.loads}
+try:
+    import orjson
+    DECODERS["orjson"] = orjson.loads
+except ImportError:
+    pass
+
+
+def kline_frame(symbol: str, i: int) -> dict:
+    """与 Binance U 本位合约 kline 推送字段一致"""
+    open_time = 1_700_000_000_000 + i * 180_000
+    return {
+        "e": "kline", "E": open_time + 1234, "s": symbol,
+        "k": {
+            "t": open_time, "T": open_time + 179_999, "s": symbol, "i": "3m",
+            "f": 100, "L": 200, "o": "0.0010", "c": "0.0020", "h": "0.0025", "l": "0.0015",
+            "v": "1000", "n": 100, "x": i % 10 == 0, "q": "1.0000", "V": "500",
+            "Q": "0.500", "B": "123456",
+        },
+    }
+
+
+def ticker_frame(symbol: str, i: int) -> dict:
+    """与 Binance U 本位合约 24hrTicker 推送字段一致"""
+    return {
+        "e": "24hrTicker", "E": 1_700_000_000_000 + i, "s": symbol,
+        "p": "0.0015", "P": "250.00", "w": "0.0018", "c": "0.0025", "Q": "10",
+        "o": "0.0010", "h": "0.0025", "l": "0.0010", "v": "10000", "q": "18",
+        "O": 0, "C": 86_400_000, "F": 0, "L": 18150, "n": 18151,
+    }
+
+
+def recorded_frames(stream_mode: str):
+    symbols = [f"SYM{i}USDT" for i in range(SYMBOL_COUNT)]
+    frames = []
+    for i in range(MESSAGES_PER_ROUND):
+        symbol = symbols[i % SYMBOL_COUNT]
+        payload = kline_frame(symbol, i) if i % 2 == 0 else ticker_frame(symbol, i)
+        if stream_mode == "combined":
+            suffix = "kline_3m" if i % 2 == 0 else "ticker"
+            payload = {"stream": f"{symbol.lower()}@{suffix}", "data": payload}
+        frames.append(json.dumps(payload))
+    return symbols, frames
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("decoder", list(DECODERS))
+@pytest.mark.parametrize("stream_mode", ["raw", "combined"])
+def test_handle_message_throughput(benchmark, decoder, stream_mode):
+    """每轮分发 MESSAGES_PER_ROUND 条消息（kline 与 ticker 各半）"""
+    client = WSClient(combined=stream_mode == "combined", json_loads=DECODERS[decoder])
+    symbols, frames = recorded_frames(stream_mode)
+    received = []
+    subscriptions = []
+    for symbol in symbols:
+        subscriptions.append((f"{symbol.lower()}@kline_3m", received.append))
+        subscriptions.append((f"{symbol.lower()}@ticker", received.append))
+    asyncio.run(client.subscribe_many(subscriptions))
+
+    loop = asyncio.new_event_loop()
+
+    async def handle_all():
+        for frame in frames:
+            await client._handle_message(frame)
+
+    def run():
+        received.clear()
+        loop.run_until_complete(handle_all())
+
+    try:
+        benchmark(run)
+    finally:
+        loop.close()
+
+    assert len(received) == MESSAGES_PER_ROUND
+    if benchmark.stats is not None:  # --benchmark-disable 时没有统计数据
+        benchmark.extra_info["messages_per_second"] = MESSAGES_PER_ROUND / benchmark.stats.stats.mean